@@ -0,0 +1,9 @@
+import os
+
+from qchess.engine import ChessEngine, QuantumState
+
+# Profiling is switched on by the environment; see qchess.instrument. The
+# module is only imported then, to keep startup short.
+if os.environ.get('QCHESS_PROFILE', '0') != '0':
+    from qchess.instrument import enable_from_environment
+    enable_from_environment()
@@ -0,0 +1,293 @@
+# Computer player: iterative deepening alpha-beta with chance nodes
+#
+# Classical moves are searched with negamax alpha-beta. A move that forces
+# a collapse, and a superposed piece whose timer will run out before the
+# position is reached, become chance nodes that average both outcomes.
+# Search runs on a copy of the engine, walked with make_move/unmake_move,
+# and stops at the time budget with the best move of the deepest search
+# that got through at least its first root move.
+#
+# The player only considers classical moves; it never splits a piece.
+
+import time
+
+from qchess.bitboard import (WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, COLOR_INDEX,
+                             code_color, code_piece, squares)
+
+PIECE_VALUES = (100, 320, 330, 500, 900, 0)
+MATE = 100_000
+INFINITY = MATE + 1
+# Scores beyond this are mates, stored in the table relative to the node
+MATE_BOUND = MATE - 1000
+TABLE_SIZE = 200_000
+# Nodes between clock checks
+CHECK_INTERVAL = 16
+PROMOTIONS = ('queen', 'knight')
+
+EXACT, LOWER, UPPER = range(3)
+
+
+def _centrality(sq):
+    row, col = divmod(sq, 8)
+    return int(7 - abs(row - 3.5) - abs(col - 3.5))
+
+
+# Positional bonus per [color][piece][square], added to the material value
+SQUARE_VALUES = [[[0] * 64 for _ in range(6)] for _ in range(2)]
+for _sq in range(64):
+    _row = _sq // 8
+    for _color in (WHITE, BLACK):
+        advance = 6 - _row if _color == WHITE else _row - 1
+        SQUARE_VALUES[_color][PAWN][_sq] = PIECE_VALUES[PAWN] + 6 * max(advance, 0) + _centrality(_sq)
+        SQUARE_VALUES[_color][KNIGHT][_sq] = PIECE_VALUES[KNIGHT] + 5 * _centrality(_sq)
+        SQUARE_VALUES[_color][BISHOP][_sq] = PIECE_VALUES[BISHOP] + 3 * _centrality(_sq)
+        SQUARE_VALUES[_color][ROOK][_sq] = PIECE_VALUES[ROOK]
+        SQUARE_VALUES[_color][QUEEN][_sq] = PIECE_VALUES[QUEEN] + _centrality(_sq)
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def evaluate(engine):
+    # Material and placement from the side to move's point of view. Both
+    # halves of a superposed piece are on the board, so each counts half.
+    bitboards = engine.bitboards
+    score = 0
+    for color, sign in ((WHITE, 1), (BLACK, -1)):
+        for piece in range(KING):
+            values = SQUARE_VALUES[color][piece]
+            for sq in squares(bitboards.pieces[color][piece]):
+                score += sign * values[sq]
+    for state in engine.quantum_states:
+        color, piece = code_color(state.piece), code_piece(state.piece)
+        if piece != KING:
+            values = SQUARE_VALUES[color][piece]
+            half = sum(values[row * 8 + col] for row, col in state.positions) // 2
+            score -= half if color == WHITE else -half
+    return score if engine.turn == 'white' else -score
+
+
+class EnginePlayer:
+    def __init__(self, time_budget=1.0, max_depth=32, ply_seconds=5.0, clock=time.perf_counter, book=None):
+        # time_budget of None searches to max_depth, which is repeatable
+        self.time_budget = time_budget
+        # A qchess.book.OpeningBook; its moves are played without searching
+        self.book = book
+        self.max_depth = max_depth
+        # Assumed thinking time per ply when deciding which quantum timers
+        # will have run out deeper in the tree
+        self.ply_seconds = ply_seconds
+        self.clock = clock
+        self.table = {}
+        self.nodes = 0
+        self.deadline = None
+        self.stop = None
+
+    def choose_move(self, engine, stop=None, progress=None):
+        # Returns a dict with the move (from_row, from_col, to_row, to_col),
+        # the promotion choice, score, completed depth, nodes and seconds.
+        # Setting the stop event ends the search early, as the deadline does,
+        # and progress is called with the same dict after every depth. A book
+        # move comes back at depth 0, with no score and 'book' set.
+        start = self.clock()
+        if self.book is not None:
+            book_move = self.book.best_move(engine)
+            if book_move is not None:
+                return {'move': book_move[0], 'promotion': book_move[1], 'score': None, 'depth': 0,
+                        'nodes': 0, 'seconds': self.clock() - start, 'book': True}
+        self.deadline = None if self.time_budget is None else start + self.time_budget
+        self.stop = stop
+        self.nodes = 0
+        if len(self.table) > TABLE_SIZE:
+            self.table.clear()
+
+        engine = engine.copy()
+        moves = self.ordered_moves(engine, self.table.get(engine.position_key()))
+        if not moves:
+            return None
+        best_move, best_score, depth_done = moves[0], None, 0
+
+        for depth in range(1, self.max_depth + 1):
+            depth_best, depth_score = None, -INFINITY
+            try:
+                for move in moves:
+                    score = self.search_move(engine, move, depth, depth_score, INFINITY, 0)
+                    if score > depth_score:
+                        depth_best, depth_score = move, score
+            except SearchTimeout:
+                # The previous best move is searched first, so a partial
+                # iteration that finished it is at least as good
+                if depth_best is not None:
+                    best_move, best_score = depth_best, depth_score
+                break
+            best_move, best_score, depth_done = depth_best, depth_score, depth
+            moves.remove(depth_best)
+            moves.insert(0, depth_best)
+            if progress is not None:
+                progress(self.result(best_move, best_score, depth_done, start))
+            if abs(depth_score) > MATE_BOUND:
+                break
+
+        return self.result(best_move, best_score, depth_done, start)
+
+    def result(self, move, score, depth, start):
+        return {
+            'move': move[:4],
+            'promotion': move[4],
+            'score': score,
+            'depth': depth,
+            'nodes': self.nodes,
+            'seconds': self.clock() - start,
+        }
+
+    def ordered_moves(self, engine, entry=None, captures_only=False):
+        # (from_row, from_col, to_row, to_col, promotion) with the table's
+        # best move first, then captures by victim value, then the rest
+        board = engine.board
+        scored = []
+        for from_row, from_col, to_row, to_col in engine.iter_legal_moves():
+            victim = board[to_row * 8 + to_col]
+            piece = board[from_row * 8 + from_col]
+            promotes = code_piece(piece) == PAWN and to_row in (0, 7)
+            if captures_only and not victim and not promotes:
+                continue
+            order = 10 * PIECE_VALUES[code_piece(victim)] - PIECE_VALUES[code_piece(piece)] if victim else -MATE
+            if promotes:
+                for choice in PROMOTIONS:
+                    scored.append((order + (PIECE_VALUES[QUEEN] if choice == 'queen' else 0),
+                                   (from_row, from_col, to_row, to_col, choice)))
+            else:
+                scored.append((order, (from_row, from_col, to_row, to_col, None)))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        moves = [move for _, move in scored]
+        if entry and entry[3] in moves:
+            moves.remove(entry[3])
+            moves.insert(0, entry[3])
+        return moves
+
+    def tick(self):
+        self.nodes += 1
+        if self.nodes % CHECK_INTERVAL == 0:
+            if self.deadline is not None and self.clock() >= self.deadline:
+                raise SearchTimeout()
+            if self.stop is not None and self.stop.is_set():
+                raise SearchTimeout()
+
+    def search_move(self, engine, move, depth, alpha, beta, ply):
+        from_row, from_col, to_row, to_col, promotion = move
+        if engine.move_collapses(from_row, from_col, to_row, to_col):
+            # Chance node: both collapse outcomes are equally likely, and
+            # each is searched with a full window so the average is exact
+            total = 0
+            for index in (0, 1):
+                engine.make_move(from_row, from_col, to_row, to_col, collapse_index=index)
+                total -= self.negamax(engine, depth - 1, -INFINITY, INFINITY, ply + 1)
+                engine.unmake_move()
+            return total / 2
+
+        engine.make_move(from_row, from_col, to_row, to_col, collapse_index=0)
+        if promotion:
+            engine.promote(promotion)
+        score = -self.negamax(engine, depth - 1, -beta, -alpha, ply + 1)
+        engine.unmake_move()
+        return score
+
+    def expiring_state(self, engine, ply):
+        # The first state to run out, if it does before this ply is played
+        state = engine.timers.peek()
+        if state is not None and engine.time_left(state) <= (self.time_budget or 0) + ply * self.ply_seconds:
+            return state
+        return None
+
+    def negamax(self, engine, depth, alpha, beta, ply):
+        self.tick()
+        color = COLOR_INDEX[engine.turn]
+        if not engine.bitboards.pieces[color][KING]:
+            return -MATE + ply
+
+        state = self.expiring_state(engine, ply)
+        if state is not None:
+            total = 0
+            for index in (0, 1):
+                engine.push_undo_frame()
+                engine.collapse_state(state, index)
+                total += self.negamax(engine, depth, -INFINITY, INFINITY, ply)
+                engine.unmake_move()
+            return total / 2
+
+        if depth <= 0:
+            return self.quiesce(engine, alpha, beta, ply)
+
+        key = engine.position_key()
+        entry = self.table.get(key)
+        if entry and entry[0] >= depth:
+            score = self.from_table(entry[1], ply)
+            if entry[2] == EXACT:
+                return score
+            if entry[2] == LOWER and score >= beta:
+                return score
+            if entry[2] == UPPER and score <= alpha:
+                return score
+
+        moves = self.ordered_moves(engine, entry)
+        if not moves:
+            return -MATE + ply if engine.is_in_check(engine.turn) else 0
+
+        original_alpha = alpha
+        best_score, best_move = -INFINITY, moves[0]
+        for move in moves:
+            score = self.search_move(engine, move, depth, alpha, beta, ply)
+            if score > best_score:
+                best_score, best_move = score, move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table[key] = (depth, self.to_table(best_score, ply), flag, best_move)
+        return best_score
+
+    def quiesce(self, engine, alpha, beta, ply):
+        # Captures and promotions only; collapsing captures are left to the
+        # full search
+        self.tick()
+        stand_pat = evaluate(engine)
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        for move in self.ordered_moves(engine, captures_only=True):
+            from_row, from_col, to_row, to_col, promotion = move
+            if engine.move_collapses(from_row, from_col, to_row, to_col):
+                continue
+            engine.make_move(from_row, from_col, to_row, to_col, collapse_index=0)
+            if promotion:
+                engine.promote(promotion)
+            if not engine.bitboards.pieces[COLOR_INDEX[engine.turn]][KING]:
+                score = MATE - ply - 1
+            else:
+                score = -self.quiesce(engine, -beta, -alpha, ply + 1)
+            engine.unmake_move()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def to_table(self, score, ply):
+        if score > MATE_BOUND:
+            return score + ply
+        if score < -MATE_BOUND:
+            return score - ply
+        return score
+
+    def from_table(self, score, ply):
+        if score > MATE_BOUND:
+            return score - ply
+        if score < -MATE_BOUND:
+            return score + ply
+        return score
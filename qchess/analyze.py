@@ -0,0 +1,137 @@
+# Batch position analysis across a process pool
+#
+#   python -m qchess.analyze positions.txt -o annotated.jsonl
+#   zcat positions.txt.gz | python -m qchess.analyze - --workers 8
+#
+# Reads one position per line in the extended FEN of qchess.fen, quantum
+# pairs and timers included; blank lines and lines starting with # are
+# skipped. Every position is annotated with its legal move and split
+# counts, check and game status, which superpositions are observed (the
+# ones check_quantum_collapse would collapse, and on which square) and the
+# static evaluation of qchess.ai, from the side to move's point of view.
+#
+# Input is read as a stream and sent to the workers in chunks. At most
+# --window chunks are in flight at a time, so memory stays bounded however
+# long the input is. Results are written as JSON lines in input order, as
+# soon as every chunk before them is done.
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from multiprocessing import Pool
+
+from qchess.ai import evaluate
+from qchess.engine import ChessEngine, ManualClock
+from qchess.fen import parse_fen, square_name
+
+# Reused by every position a worker analyses
+_engine = None
+
+
+def analyze_position(engine, fen):
+    parse_fen(fen, engine)
+    observed = {state: engine.observed_position(state) for state in engine.observed_states()}
+    status = engine.status()
+    return {
+        'turn': engine.turn,
+        'status': status,
+        'check': engine.is_in_check(engine.turn),
+        'moves': 0 if status == 'promotion' else sum(1 for _ in engine.iter_legal_moves()),
+        'splits': 0 if status == 'promotion' else sum(1 for _ in engine.iter_split_moves()),
+        'quantum': [{'squares': square_name(*state.positions[0]) + square_name(*state.positions[1]),
+                     'seconds': engine.time_left(state),
+                     'observed': square_name(*observed[state]) if state in observed else None}
+                    for state in engine.quantum_states],
+        'evaluation': evaluate(engine),
+    }
+
+
+def analyze_chunk(chunk):
+    # chunk is a list of (line number, FEN)
+    global _engine
+    if _engine is None:
+        # Timers are read at time zero, so they come out as written
+        _engine = ChessEngine(clock=ManualClock())
+    results = []
+    for number, fen in chunk:
+        try:
+            result = {'line': number, 'fen': fen, **analyze_position(_engine, fen)}
+        except ValueError as error:
+            result = {'line': number, 'fen': fen, 'error': str(error)}
+        results.append(result)
+    return results
+
+
+def read_chunks(lines, chunk_size):
+    chunk = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        chunk.append((number, line))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def analyze(lines, output, workers=None, chunk_size=256, window=None):
+    # Returns (positions, errors)
+    summary = [0, 0]
+
+    def write(results):
+        for result in results:
+            output.write(json.dumps(result) + '\n')
+            summary[0] += 1
+            summary[1] += 'error' in result
+
+    chunks = read_chunks(lines, chunk_size)
+    if workers == 1:
+        # In this process, which also lets qchess.instrument see the work
+        for chunk in chunks:
+            write(analyze_chunk(chunk))
+    else:
+        window = window or 4 * (workers or os.cpu_count())
+        pending = deque()
+        with Pool(workers) as pool:
+            for chunk in chunks:
+                if len(pending) >= window:
+                    write(pending.popleft().get())
+                pending.append(pool.apply_async(analyze_chunk, (chunk,)))
+            while pending:
+                write(pending.popleft().get())
+    output.flush()
+    return tuple(summary)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Annotate quantum chess positions')
+    parser.add_argument('input', help='file with one position per line, - for stdin')
+    parser.add_argument('-o', '--output', default='-', help='JSON lines file, - for stdout')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=256, help='positions per task')
+    parser.add_argument('--window', type=int, help='chunks in flight at once, 4 per worker by default')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    source = sys.stdin if args.input == '-' else open(args.input)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        positions, errors = analyze(source, output, args.workers, args.chunk_size, args.window)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start
+    print(f"{positions} positions, {errors} errors in {elapsed:.2f}s "
+          f"({positions / elapsed if elapsed else 0:.0f}/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
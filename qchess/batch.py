@@ -0,0 +1,482 @@
+# Batched boards for Monte Carlo rollouts
+#
+#   python -m qchess.batch --games 4096 --split-rate 0.2
+#
+# BatchBoard holds N games as NumPy arrays and advances all of them one ply
+# at a time, so the interpreter cost is paid per ply rather than per square
+# per game. Rollouts play pseudo-legal moves: a king can be left en prise
+# and the game ends when it is captured. Pawns always promote to queens.
+#
+# Each game has MAX_PAIRS superposition slots. A piece that is already
+# superposed cannot split again, and quantum timers run on ply time
+# (seconds_per_ply per ply) rather than the wall clock.
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from qchess.bitboard import (COLORS, COLOR_INDEX, KNIGHT_ATTACKS,
+                             KING_ATTACKS, PAWN_ATTACKS, ROOK_RAYS_UP, ROOK_RAYS_DOWN,
+                             BISHOP_RAYS_UP, BISHOP_RAYS_DOWN, BETWEEN, PAWN_DIRECTION,
+                             PAWN_START_ROW, code_color, squares)
+from qchess.engine import ChessEngine, QUANTUM_DURATION
+
+MAX_PAIRS = 8
+
+# Piece codes; 0 is an empty square and the rest are the bitboard indexes + 1
+EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(7)
+WHITE, BLACK = 0, 1
+NO_SQUARE = -1
+
+
+def _mask_table(table):
+    return np.array([[mask >> target & 1 for target in range(64)] for mask in table], dtype=bool)
+
+
+def _line_table(rays_list):
+    return _mask_table([
+        sum(rays[sq] for rays in rays_list) for sq in range(64)
+    ])
+
+
+KNIGHT_TABLE = _mask_table(KNIGHT_ATTACKS)
+KING_TABLE = _mask_table(KING_ATTACKS)
+PAWN_TABLE = np.stack([_mask_table(PAWN_ATTACKS[color]) for color in (WHITE, BLACK)])
+ROOK_LINES = _line_table(ROOK_RAYS_UP + ROOK_RAYS_DOWN)
+BISHOP_LINES = _line_table(BISHOP_RAYS_UP + BISHOP_RAYS_DOWN)
+
+# BETWEEN as a (64, 64 * 64) matrix, so an occupancy batch times it counts
+# the blockers between every pair of squares in one product
+BETWEEN_MATRIX = np.zeros((64, 64 * 64), dtype=np.float32)
+for _sq in range(64):
+    for _target in range(64):
+        for _blocker in squares(BETWEEN[_sq][_target]):
+            BETWEEN_MATRIX[_blocker, _sq * 64 + _target] = 1
+
+
+def _pawn_push_tables():
+    single = np.zeros((2, 64, 64), dtype=bool)
+    double = np.zeros((2, 64, 64), dtype=bool)
+    # Square the double push passes through, 64 (always occupied) otherwise
+    via = np.full((2, 64), 64, dtype=np.intp)
+    for color in (WHITE, BLACK):
+        step = 8 * PAWN_DIRECTION[color]
+        for sq in range(64):
+            row = sq // 8
+            if 0 <= row + PAWN_DIRECTION[color] < 8:
+                single[color, sq, sq + step] = True
+            if row == PAWN_START_ROW[color]:
+                double[color, sq, sq + 2 * step] = True
+                via[color, sq] = sq + step
+    return single, double, via
+
+
+PAWN_PUSHES, PAWN_DOUBLE_PUSHES, PAWN_DOUBLE_VIA = _pawn_push_tables()
+PAWN_START_MASK = np.zeros((2, 64), dtype=bool)
+for _color in (WHITE, BLACK):
+    PAWN_START_MASK[_color, PAWN_START_ROW[_color] * 8:PAWN_START_ROW[_color] * 8 + 8] = True
+
+
+def _castling_table():
+    # [color][0 = kingside, 1 = queenside]: king from/to, rook from/to, and
+    # the squares that must be empty and unattacked
+    king_to, rook_from, rook_to = [], [], []
+    empty = np.zeros((2, 2, 64), dtype=bool)
+    safe = np.zeros((2, 2, 64), dtype=bool)
+    for color, back in ((WHITE, 56), (BLACK, 0)):
+        king_to.append((back + 6, back + 2))
+        rook_from.append((back + 7, back))
+        rook_to.append((back + 5, back + 3))
+        empty[color, 0, [back + 5, back + 6]] = True
+        empty[color, 1, [back + 1, back + 2, back + 3]] = True
+        safe[color, 0, [back + 4, back + 5, back + 6]] = True
+        safe[color, 1, [back + 4, back + 3, back + 2]] = True
+    return np.array([60, 4]), np.array(king_to), np.array(rook_from), np.array(rook_to), empty, safe
+
+
+CASTLING_KING, CASTLING_KING_TO, CASTLING_ROOK, CASTLING_ROOK_TO, CASTLING_EMPTY, CASTLING_SAFE = _castling_table()
+
+
+class BatchBoard:
+    def __init__(self, games, seed=None, max_pairs=MAX_PAIRS):
+        self.size = games
+        self.max_pairs = max_pairs
+        self.rng = np.random.default_rng(seed)
+        self.pieces = np.zeros((games, 8, 8), dtype=np.int8)
+        self.colors = np.zeros((games, 8, 8), dtype=np.int8)
+        # Flat views of the same memory, indexed by square
+        self._pieces = self.pieces.reshape(games, 64)
+        self._colors = self.colors.reshape(games, 64)
+        self.turn = np.zeros(games, dtype=np.int8)
+        self.castling = np.ones((games, 2, 2), dtype=bool)
+        # (from, to) squares of the last classical move, NO_SQUARE if none
+        self.last_move = np.full((games, 2), NO_SQUARE, dtype=np.int8)
+        # Superposed pairs: both squares per slot, and the slot on each square
+        self.pairs = np.full((games, max_pairs, 2), NO_SQUARE, dtype=np.int8)
+        self.timers = np.zeros((games, max_pairs), dtype=np.float32)
+        self.quantum = np.full((games, 64), NO_SQUARE, dtype=np.int8)
+        self.done = np.zeros(games, dtype=bool)
+        # Winning color, -1 for a draw or an unfinished game
+        self.winner = np.full(games, -1, dtype=np.int8)
+        self.plies = np.zeros(games, dtype=np.int32)
+        self.collapses = np.zeros(games, dtype=np.int32)
+        self.load(ChessEngine())
+
+    def load(self, engine, games=None):
+        # Copy an engine position into the given games, all of them by default
+        games = np.arange(self.size) if games is None else np.asarray(games)
+        # Engine codes are color << 3 | piece + 1, split here into two planes
+        board = np.frombuffer(bytes(engine.board), dtype=np.int8)
+        pieces = board & 7
+        colors = code_color(board)
+        if len(engine.quantum_states) > self.max_pairs:
+            raise ValueError(f"Position has more than {self.max_pairs} superposed pieces")
+
+        self._pieces[games] = pieces
+        self._colors[games] = colors
+        self.turn[games] = COLOR_INDEX[engine.turn]
+        for color in COLORS:
+            for side, name in enumerate(('kingside', 'queenside')):
+                self.castling[games, COLOR_INDEX[color], side] = engine.castling_rights[color][name]
+        self.last_move[games] = NO_SQUARE
+        # Only a double push the side to move can answer; after a split the
+        # engine still holds the move before it
+        if engine.en_passant_square(engine.turn) is not None:
+            from_row, from_col, to_row, to_col = engine.last_move
+            self.last_move[games] = (from_row * 8 + from_col, to_row * 8 + to_col)
+        self.pairs[games] = NO_SQUARE
+        self.timers[games] = 0
+        self.quantum[games] = NO_SQUARE
+        for slot, state in enumerate(engine.quantum_states):
+            pair = [row * 8 + col for row, col in state.positions]
+            self.pairs[games, slot] = pair
+            self.timers[games, slot] = engine.time_left(state)
+            self.quantum[games[:, None], pair] = slot
+        self.done[games] = False
+        self.winner[games] = -1
+        self.plies[games] = 0
+        self.collapses[games] = 0
+
+    def to_engine(self, game):
+        # Rebuild one game as a ChessEngine, for inspection and cross-checks
+        pieces = self._pieces[game]
+        board = bytearray(np.where(pieces != EMPTY, self._colors[game] << 3 | pieces, EMPTY).astype(np.uint8))
+        castling_rights = {
+            color: {'kingside': bool(self.castling[game, index, 0]),
+                    'queenside': bool(self.castling[game, index, 1])}
+            for index, color in enumerate(COLORS)
+        }
+        last_move = None
+        if self.last_move[game, 0] != NO_SQUARE:
+            last_move = tuple(divmod(int(self.last_move[game, 0]), 8) + divmod(int(self.last_move[game, 1]), 8))
+        engine = ChessEngine()
+        states = []
+        for slot in np.flatnonzero(self.pairs[game, :, 0] != NO_SQUARE):
+            pos1, pos2 = (divmod(int(sq), 8) for sq in self.pairs[game, slot])
+            states.append(engine.new_quantum_state(board[pos1[0] * 8 + pos1[1]], pos1, pos2,
+                                                   float(self.timers[game, slot])))
+        engine.set_position(board, COLORS[self.turn[game]], castling_rights, last_move, states)
+        return engine
+
+    def attacks(self, games):
+        # (n, 64, 64) mask of the squares each piece attacks
+        pieces = self._pieces[games]
+        occupied = (pieces != EMPTY).astype(np.float32)
+        clear = (occupied @ BETWEEN_MATRIX).reshape(-1, 64, 64) == 0
+
+        attacks = (pieces == KNIGHT)[:, :, None] & KNIGHT_TABLE
+        attacks |= (pieces == KING)[:, :, None] & KING_TABLE
+        attacks |= (pieces == PAWN)[:, :, None] & PAWN_TABLE[self._colors[games], np.arange(64)]
+        straight = (pieces == ROOK) | (pieces == QUEEN)
+        diagonal = (pieces == BISHOP) | (pieces == QUEEN)
+        attacks |= straight[:, :, None] & ROOK_LINES & clear
+        attacks |= diagonal[:, :, None] & BISHOP_LINES & clear
+        return attacks
+
+    def attacked(self, games, color, attacks=None):
+        # (n, 64) squares attacked by color, one color per game
+        if attacks is None:
+            attacks = self.attacks(games)
+        pieces = self._pieces[games]
+        attackers = (pieces != EMPTY) & (self._colors[games] == np.asarray(color)[:, None])
+        return (attacks & attackers[:, :, None]).any(axis=1)
+
+    def en_passant(self, games):
+        # En passant target square per game, NO_SQUARE if none
+        from_sq = self.last_move[games, 0].astype(np.intp)
+        to_sq = self.last_move[games, 1].astype(np.intp)
+        double_push = ((from_sq != NO_SQUARE) & (np.abs(from_sq - to_sq) == 16) &
+                       (self._pieces[games, to_sq] == PAWN) &
+                       (self._colors[games, to_sq] != self.turn[games]))
+        return np.where(double_push, (from_sq + to_sq) // 2, NO_SQUARE)
+
+    def moves(self, games, attacks=None):
+        # (n, 64, 64) pseudo-legal moves for the side to move, castling included
+        if attacks is None:
+            attacks = self.attacks(games)
+        n = len(games)
+        pieces = self._pieces[games]
+        colors = self._colors[games]
+        turn = self.turn[games].astype(np.intp)
+        occupied = pieces != EMPTY
+        own = occupied & (colors == turn[:, None])
+        enemy = occupied & ~own
+        en_passant = self.en_passant(games)
+        index = np.arange(n)
+
+        moves = attacks & own[:, :, None] & ~own[:, None, :]
+        pawns = own & (pieces == PAWN)
+        capturable = enemy.copy()
+        has_en_passant = en_passant != NO_SQUARE
+        capturable[index[has_en_passant], en_passant[has_en_passant]] = True
+        moves &= ~(pawns[:, :, None] & ~capturable[:, None, :])
+
+        empty = ~occupied
+        moves |= pawns[:, :, None] & PAWN_PUSHES[turn] & empty[:, None, :]
+        padded = np.concatenate([empty, np.zeros((n, 1), dtype=bool)], axis=1)
+        via_empty = padded[index[:, None], PAWN_DOUBLE_VIA[turn]]
+        moves |= (pawns & via_empty)[:, :, None] & PAWN_DOUBLE_PUSHES[turn] & empty[:, None, :]
+
+        enemy_attacks = self.attacked(games, 1 - turn, attacks)
+        king = CASTLING_KING[turn]
+        king_home = (pieces[index, king] == KING) & own[index, king]
+        for side in (0, 1):
+            rook = CASTLING_ROOK[turn, side]
+            allowed = (king_home & self.castling[games, turn, side] &
+                       (pieces[index, rook] == ROOK) & own[index, rook] &
+                       ~(occupied & CASTLING_EMPTY[turn, side]).any(axis=1) &
+                       ~(enemy_attacks & CASTLING_SAFE[turn, side]).any(axis=1))
+            moves[index[allowed], king[allowed], CASTLING_KING_TO[turn[allowed], side]] = True
+        return moves
+
+    def split_targets(self, games, moves):
+        # Quiet moves a piece could split across; kings, superposed pieces
+        # and pawns off their start row cannot split
+        pieces = self._pieces[games]
+        turn = self.turn[games].astype(np.intp)
+        can_split = ((pieces != KING) & (self.quantum[games] == NO_SQUARE) &
+                     ((pieces != PAWN) | PAWN_START_MASK[turn]))
+        quiet = moves & (pieces == EMPTY)[:, None, :] & can_split[:, :, None]
+        # A pawn's only diagonal move onto an empty square is en passant
+        quiet &= ~((pieces == PAWN)[:, :, None] & PAWN_TABLE[turn[:, None], np.arange(64)])
+        return quiet
+
+    def _random_choice(self, masks):
+        # Uniform random True index in each row, -1 for an all-False row.
+        # Masks are sparse, so pick among the nonzero entries directly.
+        rows, columns = np.nonzero(masks)
+        if not len(columns):
+            return np.full(len(masks), -1)
+        counts = np.bincount(rows, minlength=len(masks))
+        starts = np.cumsum(counts) - counts
+        picks = starts + (self.rng.random(len(masks)) * counts).astype(np.intp)
+        return np.where(counts > 0, columns[np.minimum(picks, len(columns) - 1)], -1)
+
+    def _resolve(self, games, slots, index):
+        # Collapse the pairs in (games, slots) onto pair index 0 or 1
+        kept = self.pairs[games, slots, index].astype(np.intp)
+        lost = self.pairs[games, slots, 1 - index].astype(np.intp)
+        self._pieces[games, lost] = EMPTY
+        self._release(games, slots)
+        np.add.at(self.collapses, games, 1)
+        return kept
+
+    def _release(self, games, slots):
+        # Free the slots; whatever stands on their squares becomes classical
+        for half in (0, 1):
+            self.quantum[games, self.pairs[games, slots, half].astype(np.intp)] = NO_SQUARE
+        self.pairs[games, slots] = NO_SQUARE
+
+    def collapse(self, games=None):
+        # Measure every superposed piece in the given games
+        games = np.arange(self.size) if games is None else np.asarray(games)
+        held = self.pairs[games, :, 0] != NO_SQUARE
+        game_index, slots = np.nonzero(held)
+        if len(slots):
+            self._resolve(games[game_index], slots, self.rng.integers(0, 2, len(slots)))
+
+    def tick(self, games, seconds):
+        held = self.pairs[games, :, 0] != NO_SQUARE
+        self.timers[games] -= np.where(held, seconds, 0).astype(np.float32)
+        game_index, slots = np.nonzero(held & (self.timers[games] <= 0))
+        if len(slots):
+            self._resolve(games[game_index], slots, self.rng.integers(0, 2, len(slots)))
+
+    def split(self, games, from_sq, pos1, pos2):
+        slots = (self.pairs[games, :, 0] == NO_SQUARE).argmax(axis=1)
+        for target in (pos1, pos2):
+            self._pieces[games, target] = self._pieces[games, from_sq]
+            self._colors[games, target] = self._colors[games, from_sq]
+        self._pieces[games, from_sq] = EMPTY
+        self.pairs[games, slots, 0] = pos1
+        self.pairs[games, slots, 1] = pos2
+        self.timers[games, slots] = QUANTUM_DURATION
+        self.quantum[games, pos1] = slots
+        self.quantum[games, pos2] = slots
+        self.last_move[games] = NO_SQUARE
+        self.turn[games] ^= 1
+
+    def make_moves(self, games, from_sq, to_sq):
+        # One move per game, with the engine's collapse rules: moving a
+        # superposed piece onto an occupied square, or moving onto a
+        # superposed piece, measures that piece first and the move only
+        # goes ahead if the piece turns out to be where the move needs it
+        games, from_sq, to_sq = np.asarray(games), np.asarray(from_sq), np.asarray(to_sq)
+        from_slot = self.quantum[games, from_sq].astype(np.intp)
+        to_slot = self.quantum[games, to_sq].astype(np.intp)
+        occupied = self._pieces[games, to_sq] != EMPTY
+        proceed = np.ones(len(games), dtype=bool)
+
+        mover_collapses = (from_slot != NO_SQUARE) & occupied
+        if mover_collapses.any():
+            picked = np.flatnonzero(mover_collapses)
+            index = self.rng.integers(0, 2, len(picked))
+            kept = self._resolve(games[picked], from_slot[picked], index)
+            proceed[picked] = kept == from_sq[picked]
+        # A superposed piece captured by a piece that collapsed onto its
+        # square leaves its other half behind as a classical piece
+        captured = mover_collapses & proceed & (to_slot != NO_SQUARE)
+        if captured.any():
+            self._release(games[captured], to_slot[captured])
+
+        target_collapses = (from_slot == NO_SQUARE) & (to_slot != NO_SQUARE)
+        if target_collapses.any():
+            picked = np.flatnonzero(target_collapses)
+            index = self.rng.integers(0, 2, len(picked))
+            kept = self._resolve(games[picked], to_slot[picked], index)
+            proceed[picked] = kept == to_sq[picked]
+
+        half_moves = (from_slot != NO_SQUARE) & ~occupied
+        if half_moves.any():
+            moved_games, slots = games[half_moves], from_slot[half_moves]
+            half = (self.pairs[moved_games, slots, 1] == from_sq[half_moves]).astype(np.intp)
+            self.pairs[moved_games, slots, half] = to_sq[half_moves]
+            self.quantum[moved_games, from_sq[half_moves]] = NO_SQUARE
+            self.quantum[moved_games, to_sq[half_moves]] = slots
+
+        self.last_move[games[~proceed]] = NO_SQUARE
+        self._apply(games[proceed], from_sq[proceed], to_sq[proceed])
+        self.turn[games] ^= 1
+
+    def _apply(self, games, from_sq, to_sq):
+        # Classical part of a move: en passant, castling, rights, promotion
+        piece = self._pieces[games, from_sq]
+        color = self._colors[games, from_sq].astype(np.intp)
+
+        en_passant = (piece == PAWN) & (to_sq == self.en_passant(games)) & (from_sq % 8 != to_sq % 8)
+        if en_passant.any():
+            captured_games = games[en_passant]
+            captured = self.last_move[captured_games, 1].astype(np.intp)
+            slots = self.quantum[captured_games, captured].astype(np.intp)
+            held = slots != NO_SQUARE
+            self._release(captured_games[held], slots[held])
+            self._pieces[captured_games, captured] = EMPTY
+
+        castles = (piece == KING) & (np.abs(to_sq - from_sq) == 2)
+        if castles.any():
+            castle_games = games[castles]
+            side = (to_sq[castles] < from_sq[castles]).astype(np.intp)
+            rook_from = CASTLING_ROOK[color[castles], side]
+            rook_to = CASTLING_ROOK_TO[color[castles], side]
+            self._pieces[castle_games, rook_to] = ROOK
+            self._colors[castle_games, rook_to] = color[castles]
+            self._pieces[castle_games, rook_from] = EMPTY
+            # A superposed rook takes its half along, as in the engine
+            slots = self.quantum[castle_games, rook_from].astype(np.intp)
+            held = slots != NO_SQUARE
+            if held.any():
+                held_games, slots = castle_games[held], slots[held]
+                half = (self.pairs[held_games, slots, 1] == rook_from[held]).astype(np.intp)
+                self.pairs[held_games, slots, half] = rook_to[held]
+                self.quantum[held_games, rook_from[held]] = NO_SQUARE
+                self.quantum[held_games, rook_to[held]] = slots
+
+        self.castling[games[piece == KING], color[piece == KING]] = False
+        for side in (0, 1):
+            rook_moves = (piece == ROOK) & (from_sq == CASTLING_ROOK[color, side])
+            self.castling[games[rook_moves], color[rook_moves], side] = False
+
+        self._pieces[games, to_sq] = piece
+        self._colors[games, to_sq] = color
+        self._pieces[games, from_sq] = EMPTY
+        promotes = (piece == PAWN) & ((to_sq < 8) | (to_sq >= 56))
+        self._pieces[games[promotes], to_sq[promotes]] = QUEEN
+        self.last_move[games, 0] = from_sq
+        self.last_move[games, 1] = to_sq
+
+    def step(self, split_rate=0.0, seconds_per_ply=5.0):
+        # Play one random ply in every unfinished game
+        games = np.flatnonzero(~self.done)
+        if not len(games):
+            return
+        moves = self.moves(games).reshape(len(games), 64 * 64)
+        chosen = self._random_choice(moves)
+
+        stuck = chosen < 0
+        self.done[games[stuck]] = True
+        games, moves, chosen = games[~stuck], moves[~stuck], chosen[~stuck]
+
+        splitting = np.zeros(len(games), dtype=bool)
+        if split_rate:
+            splitting = ((self.rng.random(len(games)) < split_rate) &
+                         (self.pairs[games, :, 0] == NO_SQUARE).any(axis=1))
+        if splitting.any():
+            picked = np.flatnonzero(splitting)
+            quiet = self.split_targets(games[picked], moves[picked].reshape(-1, 64, 64))
+            from_sq = self._random_choice(quiet.sum(axis=2) >= 2)
+            can_split = from_sq >= 0
+            picked, quiet, from_sq = picked[can_split], quiet[can_split], from_sq[can_split]
+            targets = quiet[np.arange(len(picked)), from_sq]
+            scores = self.rng.random(targets.shape, dtype=np.float32)
+            scores[~targets] = -1
+            pos1, pos2 = np.argsort(scores, axis=1)[:, -2:].T
+            self.split(games[picked], from_sq, pos1, pos2)
+            splitting[:] = False
+            splitting[picked] = True
+
+        moving = ~splitting
+        self.make_moves(games[moving], chosen[moving] // 64, chosen[moving] % 64)
+        self.tick(games, seconds_per_ply)
+        self.plies[games] += 1
+
+        kings = self._pieces[games] == KING
+        colors = self._colors[games]
+        white_king = (kings & (colors == WHITE)).any(axis=1)
+        black_king = (kings & (colors == BLACK)).any(axis=1)
+        self.winner[games[~black_king]] = WHITE
+        self.winner[games[~white_king]] = BLACK
+        self.done[games[~white_king | ~black_king]] = True
+
+    def play(self, max_plies=300, split_rate=0.0, seconds_per_ply=5.0):
+        while not self.done.all() and self.plies.max(initial=0) < max_plies:
+            self.step(split_rate, seconds_per_ply)
+        return self.winner
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batched random rollouts')
+    parser.add_argument('--games', type=int, default=1024)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-plies', type=int, default=300)
+    parser.add_argument('--split-rate', type=float, default=0.2)
+    parser.add_argument('--seconds-per-ply', type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    batch = BatchBoard(args.games, seed=args.seed)
+    winner = batch.play(args.max_plies, args.split_rate, args.seconds_per_ply)
+    elapsed = time.perf_counter() - start
+
+    games = args.games or 1
+    print(f"{args.games} games in {elapsed:.2f}s ({args.games / elapsed:.1f} games/s, "
+          f"{batch.plies.sum() / elapsed:.0f} plies/s)")
+    print(f"white {(winner == WHITE).sum() / games:.1%}  black {(winner == BLACK).sum() / games:.1%}  "
+          f"unfinished or drawn {(winner == -1).sum() / games:.1%}  "
+          f"average length {batch.plies.mean():.1f} plies  collapses {batch.collapses.sum()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,335 @@
+# Bitboard position and move generation tables
+# Squares are indexed row * 8 + col to match board[row][col]:
+# bit 0 is a8 (black's back rank), bit 63 is h1.
+
+COLORS = ('white', 'black')
+PIECE_TYPES = ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king')
+COLOR_INDEX = {color: index for index, color in enumerate(COLORS)}
+PIECE_INDEX = {piece: index for index, piece in enumerate(PIECE_TYPES)}
+
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+PAWN_DIRECTION = (-1, 1)
+PAWN_START_ROW = (6, 1)
+
+# Square contents are small integers: 0 for an empty square, otherwise
+# color << 3 | piece + 1, so white pieces are 1-6 and black pieces 9-14
+EMPTY = 0
+PIECE_CODES = [[color << 3 | piece + 1 for piece in range(len(PIECE_TYPES))] for color in range(len(COLORS))]
+CODE_NAMES = {PIECE_CODES[color][piece]: (COLORS[color], PIECE_TYPES[piece])
+              for color in range(len(COLORS)) for piece in range(len(PIECE_TYPES))}
+
+
+def piece_code(color_name, piece_name):
+    return PIECE_CODES[COLOR_INDEX[color_name]][PIECE_INDEX[piece_name]]
+
+
+def code_color(code):
+    return code >> 3
+
+
+def code_piece(code):
+    return (code & 7) - 1
+
+
+def squares(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _step_table(offsets):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        mask = 0
+        for dr, dc in offsets:
+            new_row, new_col = row + dr, col + dc
+            if 0 <= new_row < 8 and 0 <= new_col < 8:
+                mask |= 1 << (new_row * 8 + new_col)
+        table.append(mask)
+    return table
+
+
+def _ray_table(dr, dc):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        mask = 0
+        row, col = row + dr, col + dc
+        while 0 <= row < 8 and 0 <= col < 8:
+            mask |= 1 << (row * 8 + col)
+            row, col = row + dr, col + dc
+        table.append(mask)
+    return table
+
+
+KNIGHT_ATTACKS = _step_table([(-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                              (1, -2), (1, 2), (2, -1), (2, 1)])
+KING_ATTACKS = _step_table([(0, 1), (0, -1), (1, 0), (-1, 0),
+                            (1, 1), (1, -1), (-1, 1), (-1, -1)])
+PAWN_ATTACKS = (_step_table([(-1, -1), (-1, 1)]), _step_table([(1, -1), (1, 1)]))
+
+# Rays running towards higher square indexes are blocked by their lowest set
+# bit, rays running towards lower indexes by their highest.
+ROOK_RAYS_UP = (_ray_table(0, 1), _ray_table(1, 0))
+ROOK_RAYS_DOWN = (_ray_table(0, -1), _ray_table(-1, 0))
+BISHOP_RAYS_UP = (_ray_table(1, 1), _ray_table(1, -1))
+BISHOP_RAYS_DOWN = (_ray_table(-1, -1), _ray_table(-1, 1))
+
+
+def _between_table():
+    table = [[0] * 64 for _ in range(64)]
+    for rays in ROOK_RAYS_UP + ROOK_RAYS_DOWN + BISHOP_RAYS_UP + BISHOP_RAYS_DOWN:
+        for sq in range(64):
+            for target in squares(rays[sq]):
+                table[sq][target] = rays[sq] & ~rays[target] & ~(1 << target)
+    return table
+
+
+# Squares strictly between two squares sharing a line, 0 when not aligned
+BETWEEN = _between_table()
+
+
+def _slide(sq, occupied, rays_up, rays_down):
+    attacks = 0
+    for rays in rays_up:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[(blockers & -blockers).bit_length() - 1]
+        attacks |= ray
+    for rays in rays_down:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(sq, occupied):
+    return _slide(sq, occupied, ROOK_RAYS_UP, ROOK_RAYS_DOWN)
+
+
+def bishop_attacks(sq, occupied):
+    return _slide(sq, occupied, BISHOP_RAYS_UP, BISHOP_RAYS_DOWN)
+
+
+class Bitboards:
+    def __init__(self):
+        self.pieces = [[0] * len(PIECE_TYPES) for _ in COLORS]
+        self.occupied = [0, 0]
+        # Piece code on every square; the engine uses this as its board
+        self.mailbox = bytearray(64)
+        # Squares attacked by the piece on each square, and their union per color
+        self.attacks_from = [0] * 64
+        self.attack_map = [0, 0]
+        self._check_info = [None, None]
+
+    @classmethod
+    def from_board(cls, board):
+        # board is any sequence of 64 piece codes
+        bitboards = cls()
+        for sq, code in enumerate(board):
+            if code:
+                color, piece_type = code_color(code), code_piece(code)
+                bitboards.pieces[color][piece_type] |= 1 << sq
+                bitboards.occupied[color] |= 1 << sq
+                bitboards.mailbox[sq] = code
+        bitboards.refresh_attacks()
+        return bitboards
+
+    def copy(self):
+        bitboards = Bitboards.__new__(Bitboards)
+        bitboards.pieces = [list(pieces) for pieces in self.pieces]
+        bitboards.occupied = list(self.occupied)
+        bitboards.mailbox = self.mailbox[:]
+        bitboards.attacks_from = list(self.attacks_from)
+        bitboards.attack_map = list(self.attack_map)
+        bitboards._check_info = list(self._check_info)
+        return bitboards
+
+    def add(self, sq, color, piece):
+        bit = 1 << sq
+        self.pieces[color][piece] |= bit
+        self.occupied[color] |= bit
+        self.mailbox[sq] = color << 3 | piece + 1
+        self._check_info = [None, None]
+        self._update_attacks(sq, color)
+
+    def remove(self, sq, color, piece):
+        mask = ~(1 << sq)
+        self.pieces[color][piece] &= mask
+        self.occupied[color] &= mask
+        self.mailbox[sq] = EMPTY
+        self._check_info = [None, None]
+        self._update_attacks(sq, color)
+
+    def piece_attacks(self, sq, color, piece, occupied):
+        if piece == PAWN:
+            return PAWN_ATTACKS[color][sq]
+        if piece == KNIGHT:
+            return KNIGHT_ATTACKS[sq]
+        if piece == KING:
+            return KING_ATTACKS[sq]
+        if piece == BISHOP:
+            return bishop_attacks(sq, occupied)
+        if piece == ROOK:
+            return rook_attacks(sq, occupied)
+        return bishop_attacks(sq, occupied) | rook_attacks(sq, occupied)
+
+    def refresh_attacks(self):
+        occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        self.attack_map = [0, 0]
+        for sq in range(64):
+            code = self.mailbox[sq]
+            if code:
+                attacks = self.piece_attacks(sq, code_color(code), code_piece(code), occupied)
+                self.attacks_from[sq] = attacks
+                self.attack_map[code_color(code)] |= attacks
+            else:
+                self.attacks_from[sq] = 0
+
+    def _update_attacks(self, sq, color):
+        # Only the piece on sq and the sliders whose rays reach sq can change
+        occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        attacks_from = self.attacks_from
+        code = self.mailbox[sq]
+        attacks_from[sq] = self.piece_attacks(sq, code_color(code), code_piece(code), occupied) if code else 0
+
+        white, black = self.pieces
+        diagonal = white[BISHOP] | white[QUEEN] | black[BISHOP] | black[QUEEN]
+        straight = white[ROOK] | white[QUEEN] | black[ROOK] | black[QUEEN]
+        sliders = ((bishop_attacks(sq, occupied) & diagonal) |
+                   (rook_attacks(sq, occupied) & straight))
+        dirty = 1 << color
+        for slider in squares(sliders):
+            code = self.mailbox[slider]
+            attacks_from[slider] = self.piece_attacks(slider, code_color(code), code_piece(code), occupied)
+            dirty |= 1 << code_color(code)
+
+        for side in (WHITE, BLACK):
+            if dirty >> side & 1:
+                attack_map = 0
+                for piece_sq in squares(self.occupied[side]):
+                    attack_map |= attacks_from[piece_sq]
+                self.attack_map[side] = attack_map
+
+    def attackers_to(self, sq, color, occupied=None):
+        if occupied is None:
+            occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        pieces = self.pieces[color]
+        attackers = ((PAWN_ATTACKS[color ^ 1][sq] & pieces[PAWN]) |
+                     (KNIGHT_ATTACKS[sq] & pieces[KNIGHT]) |
+                     (KING_ATTACKS[sq] & pieces[KING]))
+        diagonal = pieces[BISHOP] | pieces[QUEEN]
+        if diagonal:
+            attackers |= bishop_attacks(sq, occupied) & diagonal
+        straight = pieces[ROOK] | pieces[QUEEN]
+        if straight:
+            attackers |= rook_attacks(sq, occupied) & straight
+        return attackers
+
+    def is_attacked(self, sq, color):
+        return self.attack_map[color] >> sq & 1 == 1
+
+    def check_info(self, color):
+        # King square, pieces giving check and pinned pieces mapped to the
+        # squares they may still move to, computed once per position
+        info = self._check_info[color]
+        if info is not None:
+            return info
+
+        king = self.pieces[color][KING]
+        if not king:
+            info = (None, 0, {})
+        else:
+            king_sq = king.bit_length() - 1
+            enemy = self.pieces[color ^ 1]
+            occupied = self.occupied[WHITE] | self.occupied[BLACK]
+            checkers = self.attackers_to(king_sq, color ^ 1, occupied)
+            pins = {}
+            snipers = ((rook_attacks(king_sq, 0) & (enemy[ROOK] | enemy[QUEEN])) |
+                       (bishop_attacks(king_sq, 0) & (enemy[BISHOP] | enemy[QUEEN])))
+            for sniper in squares(snipers):
+                blockers = BETWEEN[king_sq][sniper] & occupied
+                if blockers and not blockers & (blockers - 1) and blockers & self.occupied[color]:
+                    pins[blockers.bit_length() - 1] = BETWEEN[king_sq][sniper] | 1 << sniper
+            info = (king_sq, checkers, pins)
+
+        self._check_info[color] = info
+        return info
+
+    def legal_targets(self, sq, color, piece, targets, en_passant=None):
+        king_sq, checkers, pins = self.check_info(color)
+        if king_sq is None:
+            return targets
+        enemy = color ^ 1
+
+        if sq == king_sq:
+            targets &= ~self.attack_map[enemy]
+            if checkers:
+                # Squares behind the king on a checking ray are not in the
+                # attack map because the king itself blocks the ray
+                occupied = (self.occupied[WHITE] | self.occupied[BLACK]) & ~(1 << sq)
+                for target in squares(targets):
+                    if self.attackers_to(target, enemy, occupied):
+                        targets &= ~(1 << target)
+            return targets
+
+        en_passant_bit = 0
+        if piece == PAWN and en_passant is not None and targets >> en_passant & 1:
+            # Removing two pawns from one rank can expose the king, so test
+            # the resulting position directly
+            targets &= ~(1 << en_passant)
+            captured = en_passant - 8 * PAWN_DIRECTION[color]
+            occupied = ((self.occupied[WHITE] | self.occupied[BLACK]) &
+                        ~(1 << sq) & ~(1 << captured)) | 1 << en_passant
+            if not self.attackers_to(king_sq, enemy, occupied) & ~(1 << captured):
+                en_passant_bit = 1 << en_passant
+
+        if checkers:
+            if checkers & (checkers - 1):
+                return en_passant_bit
+            targets &= BETWEEN[king_sq][checkers.bit_length() - 1] | checkers
+        if sq in pins:
+            targets &= pins[sq]
+        return targets | en_passant_bit
+
+    def piece_moves(self, sq, color, piece, en_passant=None):
+        # Pseudo-legal target mask, castling excluded
+        own = self.occupied[color]
+        occupied = own | self.occupied[color ^ 1]
+
+        if piece == PAWN:
+            moves = 0
+            direction = PAWN_DIRECTION[color]
+            row = sq // 8
+            if 0 <= row + direction < 8:
+                step = 1 << (sq + 8 * direction)
+                if not step & occupied:
+                    moves |= step
+                    if row == PAWN_START_ROW[color]:
+                        double = 1 << (sq + 16 * direction)
+                        if not double & occupied:
+                            moves |= double
+            captures = PAWN_ATTACKS[color][sq]
+            moves |= captures & self.occupied[color ^ 1]
+            if en_passant is not None:
+                moves |= captures & (1 << en_passant) & ~occupied
+            return moves
+
+        if piece == KNIGHT:
+            return KNIGHT_ATTACKS[sq] & ~own
+        if piece == KING:
+            return KING_ATTACKS[sq] & ~own
+
+        moves = 0
+        if piece in (BISHOP, QUEEN):
+            moves |= bishop_attacks(sq, occupied)
+        if piece in (ROOK, QUEEN):
+            moves |= rook_attacks(sq, occupied)
+        return moves & ~own
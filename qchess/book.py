@@ -0,0 +1,196 @@
+# Opening book on disk, looked up through mmap
+#
+#   python -m qchess.simulate --games 5000 --white search --black search --log games.qlog
+#   python -m qchess.book build games.qlog -o opening.qbook --plies 12
+#   python -m qchess.book probe opening.qbook --fen "<fen>"
+#
+# A book is a 16-byte header followed by fixed 16-byte records sorted by
+# position key (ChessEngine.position_key, which covers superposed pairs but
+# not their timers), most played first within a key:
+#
+#   header    magic b'QCB1', record count, plies, games (little endian u32)
+#   record    key (u64), from square, to square, second split square or
+#             255 for a classical move, promotion piece index or 255,
+#             times played (u32)
+#
+# Squares are row * 8 + col. Lookups binary-search the mapped file, so
+# opening a book reads nothing but the header, and a probe touches a few
+# pages. Entries are checked against the rules before they are played, so
+# a hash collision cannot produce an illegal move.
+
+import argparse
+import mmap
+import struct
+import sys
+import time
+from collections import Counter
+
+from qchess.bitboard import PIECE_INDEX, PIECE_TYPES, PAWN, code_piece
+from qchess.engine import ChessEngine
+from qchess.fen import parse_fen, move_name, split_name
+from qchess.gamelog import MOVE, SPLIT, PROMOTE, UNDO, open_log, read_games, replay
+
+MAGIC = b'QCB1'
+HEADER = struct.Struct('<4sIII')
+RECORD = struct.Struct('<QBBBBI')
+KEY = struct.Struct('<Q')
+NONE = 255
+
+
+class BookEntry:
+    def __init__(self, from_sq, to_sq, split_sq, promotion, count):
+        self.from_pos = divmod(from_sq, 8)
+        self.to_pos = divmod(to_sq, 8)
+        # Second target of a split, or None for a classical move
+        self.split_pos = None if split_sq == NONE else divmod(split_sq, 8)
+        self.promotion = None if promotion == NONE else PIECE_TYPES[promotion]
+        self.count = count
+
+    @property
+    def is_split(self):
+        return self.split_pos is not None
+
+    def name(self):
+        if self.is_split:
+            return split_name(*self.from_pos, self.to_pos, self.split_pos)
+        return move_name(*self.from_pos, *self.to_pos)
+
+    def is_legal(self, engine):
+        if self.is_split:
+            return engine.is_legal_split(*self.from_pos, self.to_pos, self.split_pos)
+        return engine.is_legal_move(*self.from_pos, *self.to_pos)
+
+
+class OpeningBook:
+    def __init__(self, data):
+        # data is any bytes-like object, usually the mmap from open()
+        magic, self.size, self.plies, self.games = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not an opening book")
+        self.data = data
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as stream:
+            return cls(mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def key_at(self, index):
+        return KEY.unpack_from(self.data, HEADER.size + index * RECORD.size)[0]
+
+    def entries(self, key):
+        # Every entry for a position key, most played first
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        while low < self.size:
+            record_key, *fields = RECORD.unpack_from(self.data, HEADER.size + low * RECORD.size)
+            if record_key != key:
+                break
+            entries.append(BookEntry(*fields))
+            low += 1
+        return entries
+
+    def legal_entries(self, engine):
+        if engine.promotion_square:
+            return []
+        return [entry for entry in self.entries(engine.position_key()) if entry.is_legal(engine)]
+
+    def best_move(self, engine):
+        # The most played legal classical move, as (move, promotion), or None
+        for entry in self.legal_entries(engine):
+            if entry.is_split:
+                continue
+            promotion = entry.promotion
+            if (promotion is None and code_piece(engine.piece_at(*entry.from_pos)) == PAWN
+                    and entry.to_pos[0] in (0, 7)):
+                promotion = 'queen'
+            return (*entry.from_pos, *entry.to_pos), promotion
+        return None
+
+
+def count_moves(logs, plies):
+    # Counts (key, record fields) over the first plies of every logged game
+    counts = Counter()
+    # (key, fields) of every move and split still on the board, None past
+    # the first plies, so an undo takes back what it counted
+    played = []
+
+    def before(engine, opcode, args):
+        if opcode == UNDO:
+            if played and played[-1] is not None:
+                counts[played[-1]] -= 1
+            if played:
+                played.pop()
+        elif opcode == PROMOTE:
+            if played and played[-1] is not None:
+                key, fields = played.pop()
+                counts[key, fields] -= 1
+                played.append((key, fields[:3] + (PIECE_INDEX[args[0]],)))
+                counts[played[-1]] += 1
+        elif opcode in (MOVE, SPLIT):
+            if len(played) >= plies:
+                played.append(None)
+                return
+            if opcode == MOVE:
+                from_row, from_col, to_row, to_col, _ = args
+                fields = (from_row * 8 + from_col, to_row * 8 + to_col, NONE, NONE)
+            else:
+                from_row, from_col, pos1, pos2 = args
+                fields = (from_row * 8 + from_col, pos1[0] * 8 + pos1[1], pos2[0] * 8 + pos2[1], NONE)
+            played.append((engine.position_key(), fields))
+            counts[played[-1]] += 1
+
+    games = 0
+    for path in logs:
+        for game in read_games(open_log(path)):
+            games += 1
+            played.clear()
+            replay(game, before)
+    return counts, games
+
+
+def build(logs, output, plies=12, min_count=1):
+    # Writes a book from game logs and returns the number of records
+    counts, games = count_moves(logs, plies)
+    records = sorted(((key, fields, count) for (key, fields), count in counts.items() if count >= min_count),
+                     key=lambda record: (record[0], -record[2], record[1]))
+    output.write(HEADER.pack(MAGIC, len(records), plies, games))
+    for key, fields, count in records:
+        output.write(RECORD.pack(key, *fields, count))
+    return len(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Quantum chess opening book')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='build a book from game logs')
+    build_parser.add_argument('logs', nargs='+')
+    build_parser.add_argument('-o', '--output', required=True)
+    build_parser.add_argument('--plies', type=int, default=12, help='plies from the start of each game')
+    build_parser.add_argument('--min-count', type=int, default=2, help='times a move must be played to be kept')
+    probe_parser = commands.add_parser('probe', help='list the book moves for a position')
+    probe_parser.add_argument('book')
+    probe_parser.add_argument('--fen', help='position to look up instead of the start')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        with open(args.output, 'wb') as output:
+            records = build(args.logs, output, args.plies, args.min_count)
+        print(f"{records} entries written in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+        return 0
+
+    book = OpeningBook.open(args.book)
+    engine = parse_fen(args.fen) if args.fen else ChessEngine()
+    for entry in book.legal_entries(engine):
+        print(f"{entry.name()}{'' if entry.promotion is None else ' ' + entry.promotion}  {entry.count}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,703 @@
+import time
+import random
+from collections import OrderedDict
+
+from qchess.bitboard import (Bitboards, COLORS, COLOR_INDEX, PIECE_INDEX, PIECE_CODES, EMPTY,
+                              WHITE, BLACK, PAWN, ROOK, KING, code_color, code_piece, squares)
+from qchess.zobrist import (PIECE_KEYS, BLACK_TO_MOVE_KEY, CASTLING_KEYS,
+                            EN_PASSANT_KEYS, quantum_pair_key)
+from qchess.scheduler import DeadlineScheduler
+
+BOARD_SIZE = 8
+QUANTUM_DURATION = 90
+MOVE_CACHE_SIZE = 4096
+# Pieces a pawn can promote to
+PROMOTIONS = ('queen', 'rook', 'bishop', 'knight')
+
+# Undo journal entry kinds
+SQUARE_CHANGE, STATE_ADDED, STATE_REMOVED, STATE_MOVED, RNG_STATE = range(5)
+
+
+class ManualClock:
+    # Stand-in for time.monotonic that only moves when advanced, for simulations
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class QuantumState:
+    def __init__(self, piece, pos1, pos2, deadline):
+        self.piece = piece
+        self.positions = [pos1, pos2]
+        # When the state collapses, on the engine's timer time line
+        self.deadline = deadline
+
+    def collapse(self, position_index):
+        return self.positions[position_index]
+
+    def copy(self):
+        state = QuantumState.__new__(QuantumState)
+        state.__dict__.update(self.__dict__)
+        state.positions = list(self.positions)
+        return state
+
+
+class ChessEngine:
+    def __init__(self, seed=None, clock=time.monotonic):
+        # Collapse deadlines of the quantum states
+        self.timers = DeadlineScheduler(clock)
+        # Legal move lists keyed by position, square and quantum mode. Every
+        # board mutation changes zobrist_key, so stale entries are never hit
+        # and just age out of the LRU order.
+        self.move_cache = OrderedDict()
+        # Receives every action and collapse when set; see qchess.gamelog
+        self.log = None
+        self.reset(seed)
+
+
+    def reset(self, seed=None):
+        # Every game gets its own seeded RNG, so its collapses can be replayed
+        self.seed = random.randrange(1 << 63) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.set_position(self.create_board())
+
+
+    def set_position(self, board, turn='white', castling_rights=None, last_move=None, quantum_states=()):
+        # board holds 64 piece codes, indexed row * 8 + col
+        self.bitboards = Bitboards.from_board(board)
+        self.board = self.bitboards.mailbox
+        self.turn = turn
+        self.game_over = False
+        self.promotion_square = None
+        self.game_end_message = None
+        self.king_positions = {}
+        for color in (WHITE, BLACK):
+            king = self.bitboards.pieces[color][KING]
+            if king:
+                self.king_positions[COLORS[color]] = divmod(king.bit_length() - 1, 8)
+        self.castling_rights = castling_rights or {
+            'white': {'kingside': True, 'queenside': True},
+            'black': {'kingside': True, 'queenside': True}
+        }
+        self.last_move = last_move
+        self.quantum_states = []
+        # Square -> superposed states on it, oldest first. A piece that
+        # splits again leaves its old state on an empty square, so a square
+        # can briefly belong to more than one state.
+        self.quantum_index = {}
+        # Bitboard of the squares in quantum_index
+        self.quantum_mask = 0
+        self.timers.clear()
+        for state in quantum_states:
+            self.quantum_states.append(state)
+            self.index_quantum_state(state)
+            self.timers.schedule(state, state.deadline)
+        # Collapses so far, by what triggered them
+        self.collapse_counts = {'move': 0, 'observation': 0, 'timer': 0}
+        self.zobrist_key = self.compute_zobrist_key()
+        # One (header, changes) frame per move; see push_undo_frame
+        self.undo_stack = []
+        self.journal = None
+
+
+    def copy(self):
+        # The move cache is keyed by position and the RNG belongs to the
+        # game, so copies share them
+        engine = self.__class__.__new__(self.__class__)
+        engine.__dict__.update(self.__dict__)
+        engine.bitboards = self.bitboards.copy()
+        engine.board = engine.bitboards.mailbox
+        engine.king_positions = dict(self.king_positions)
+        engine.castling_rights = {color: dict(rights) for color, rights in self.castling_rights.items()}
+        engine.quantum_states = []
+        engine.quantum_index = {}
+        engine.quantum_mask = 0
+        copies = {}
+        for state in self.quantum_states:
+            copies[state] = state.copy()
+            engine.quantum_states.append(copies[state])
+            engine.index_quantum_state(copies[state])
+        engine.timers = self.timers.copy(copies)
+        engine.collapse_counts = dict(self.collapse_counts)
+        # Undo frames point at this engine's quantum states
+        engine.undo_stack = []
+        engine.journal = None
+        engine.log = None
+        return engine
+
+
+    def create_board(self):
+        board = bytearray(BOARD_SIZE * BOARD_SIZE)
+        pieces_ = ['rook', 'knight', 'bishop', 'queen', 'king', 'bishop', 'knight', 'rook']
+        
+        for col in range(BOARD_SIZE):
+            board[8 + col] = PIECE_CODES[BLACK][PAWN]
+            board[48 + col] = PIECE_CODES[WHITE][PAWN]
+            board[col] = PIECE_CODES[BLACK][PIECE_INDEX[pieces_[col]]]
+            board[56 + col] = PIECE_CODES[WHITE][PIECE_INDEX[pieces_[col]]]
+        
+        return board
+
+
+    def piece_at(self, row, col):
+        return self.board[row * 8 + col]
+
+
+    def is_quantum_piece(self, row, col):
+        return (row, col) in self.quantum_index
+
+
+    def get_quantum_state(self, row, col):
+        states = self.quantum_index.get((row, col))
+        return states[0] if states else None
+
+
+    def index_quantum_state(self, state, positions=None):
+        for pos in positions or state.positions:
+            states = self.quantum_index.setdefault(tuple(pos), [])
+            states.append(state)
+            self.quantum_mask |= 1 << (pos[0] * 8 + pos[1])
+            if len(states) > 1:
+                states.sort(key=self.quantum_states.index)
+
+
+    def unindex_quantum_state(self, state, positions=None):
+        for pos in positions or state.positions:
+            pos = tuple(pos)
+            states = self.quantum_index[pos]
+            states.remove(state)
+            if not states:
+                del self.quantum_index[pos]
+                self.quantum_mask &= ~(1 << (pos[0] * 8 + pos[1]))
+
+
+    def set_square(self, row, col, piece):
+        # The board is the bitboards' mailbox, so add and remove update it
+        sq = row * 8 + col
+        old_piece = self.board[sq]
+        if self.journal is not None:
+            self.journal.append((SQUARE_CHANGE, sq, old_piece))
+        if old_piece:
+            color, piece_type = code_color(old_piece), code_piece(old_piece)
+            self.bitboards.remove(sq, color, piece_type)
+            self.zobrist_key ^= PIECE_KEYS[color][piece_type][sq]
+        if piece:
+            color, piece_type = code_color(piece), code_piece(piece)
+            self.bitboards.add(sq, color, piece_type)
+            self.zobrist_key ^= PIECE_KEYS[color][piece_type][sq]
+
+
+    def add_quantum_state(self, state, index=None):
+        if self.journal is not None:
+            self.journal.append((STATE_ADDED, state))
+        if index is None:
+            self.quantum_states.append(state)
+        else:
+            self.quantum_states.insert(index, state)
+        self.index_quantum_state(state)
+        self.timers.schedule(state, state.deadline)
+        self.zobrist_key ^= quantum_pair_key(*state.positions)
+
+
+    def remove_quantum_state(self, state):
+        index = self.quantum_states.index(state)
+        if self.journal is not None:
+            self.journal.append((STATE_REMOVED, state, index))
+        del self.quantum_states[index]
+        self.unindex_quantum_state(state)
+        self.timers.cancel(state)
+        self.zobrist_key ^= quantum_pair_key(*state.positions)
+
+
+    def new_quantum_state(self, piece, pos1, pos2, timer=QUANTUM_DURATION):
+        return QuantumState(piece, pos1, pos2, self.timers.now() + timer)
+
+
+    def time_left(self, state):
+        return state.deadline - self.timers.now()
+
+
+    def move_quantum_half(self, state, old_pos, new_pos):
+        other_pos = state.positions[1] if old_pos == state.positions[0] else state.positions[0]
+        self.set_quantum_positions(state, [new_pos, other_pos])
+
+
+    def set_quantum_positions(self, state, positions):
+        if self.journal is not None:
+            self.journal.append((STATE_MOVED, state, state.positions))
+        self.zobrist_key ^= quantum_pair_key(*state.positions)
+        self.unindex_quantum_state(state)
+        state.positions = positions
+        self.index_quantum_state(state)
+        self.zobrist_key ^= quantum_pair_key(*state.positions)
+
+
+    def push_undo_frame(self):
+        # Every move opens a frame: a header with the scalar state, restored
+        # wholesale, and a journal of board, quantum state and collapse RNG
+        # changes, replayed backwards. Promotions and collapses between moves
+        # (timers, observations) land in the frame of the move before them.
+        header = (
+            self.turn,
+            tuple(rights[side] for rights in self.castling_rights.values()
+                  for side in ('kingside', 'queenside')),
+            self.last_move,
+            tuple(self.king_positions.items()),
+            self.promotion_square,
+            self.game_over,
+            self.game_end_message,
+            tuple(self.collapse_counts.values()),
+            self.zobrist_key,
+        )
+        self.journal = []
+        self.undo_stack.append((header, self.journal))
+
+
+    def unmake_move(self):
+        if not self.undo_stack:
+            return False
+        header, journal = self.undo_stack.pop()
+        self.journal = None
+        for change in reversed(journal):
+            if change[0] == SQUARE_CHANGE:
+                _, sq, piece = change
+                self.set_square(sq >> 3, sq & 7, piece)
+            elif change[0] == STATE_ADDED:
+                self.remove_quantum_state(change[1])
+            elif change[0] == STATE_REMOVED:
+                self.add_quantum_state(change[1], change[2])
+            elif change[0] == RNG_STATE:
+                self.rng.setstate(change[1])
+            else:
+                self.set_quantum_positions(change[1], change[2])
+
+        (self.turn, castling, self.last_move, king_positions, self.promotion_square,
+         self.game_over, self.game_end_message, collapse_counts, self.zobrist_key) = header
+        for index, color in enumerate(self.castling_rights):
+            self.castling_rights[color] = {'kingside': castling[2 * index], 'queenside': castling[2 * index + 1]}
+        self.king_positions = dict(king_positions)
+        self.collapse_counts = dict(zip(self.collapse_counts, collapse_counts))
+        self.journal = self.undo_stack[-1][1] if self.undo_stack else None
+        if self.log is not None:
+            self.log.undo()
+        return True
+
+
+    def castling_key(self):
+        key = 0
+        for color, rights in self.castling_rights.items():
+            if rights['kingside']:
+                key ^= CASTLING_KEYS[COLOR_INDEX[color]][0]
+            if rights['queenside']:
+                key ^= CASTLING_KEYS[COLOR_INDEX[color]][1]
+        return key
+
+
+    def compute_zobrist_key(self):
+        key = self.castling_key()
+        for sq, piece in enumerate(self.board):
+            if piece:
+                key ^= PIECE_KEYS[code_color(piece)][code_piece(piece)][sq]
+        if self.turn == 'black':
+            key ^= BLACK_TO_MOVE_KEY
+        for state in self.quantum_states:
+            key ^= quantum_pair_key(*state.positions)
+        return key
+
+
+    def position_key(self):
+        # zobrist_key is kept up to date on every mutation; en passant depends
+        # on last_move and the side to move, so it is folded in here
+        en_passant = self.en_passant_square(self.turn)
+        if en_passant is None:
+            return self.zobrist_key
+        return self.zobrist_key ^ EN_PASSANT_KEYS[en_passant]
+
+
+    def en_passant_square(self, color):
+        if not self.last_move:
+            return None
+        last_from_row, last_from_col, last_to_row, last_to_col = self.last_move
+        if (last_from_row != (1 if color == 'white' else 6) or
+            abs(last_from_row - last_to_row) != 2):
+            return None
+        if self.board[last_to_row * 8 + last_to_col] != PIECE_CODES[COLOR_INDEX[color] ^ 1][PAWN]:
+            return None
+        return ((last_from_row + last_to_row) // 2) * 8 + last_to_col
+
+
+    def calculate_moves(self, row, col, quantum=False):
+        piece = self.board[row * 8 + col]
+        if not piece:
+            return ()
+
+        en_passant = None if quantum else self.en_passant_square(COLORS[code_color(piece)])
+        cache_key = (self.zobrist_key, row * 8 + col, quantum, en_passant)
+        moves = self.move_cache.get(cache_key)
+        if moves is not None:
+            self.move_cache.move_to_end(cache_key)
+            return moves
+
+        moves = tuple(self.generate_moves(row, col, quantum, en_passant))
+        self.move_cache[cache_key] = moves
+        if len(self.move_cache) > MOVE_CACHE_SIZE:
+            self.move_cache.popitem(last=False)
+        return moves
+
+
+    def generate_moves(self, row, col, quantum, en_passant):
+        sq = row * 8 + col
+        piece = self.board[sq]
+        color, piece_type = code_color(piece), code_piece(piece)
+        targets = self.bitboards.piece_moves(sq, color, piece_type, en_passant)
+        targets = self.bitboards.legal_targets(sq, color, piece_type, targets, en_passant)
+        moves = [divmod(target, 8) for target in squares(targets)]
+
+        if piece_type == KING:
+            moves.extend(self.castling_moves(row, col, COLORS[color]))
+
+        if quantum:
+            moves = [(r, c) for r, c in moves if not self.board[r * 8 + c] and not self.get_quantum_state(r, c)]
+            
+            if piece_type == PAWN:
+                start_row = 6 if color == WHITE else 1
+                if row != start_row:
+                    moves = []
+
+        return moves
+
+
+    def castling_moves(self, row, col, color):
+        if self.is_in_check(color):
+            return []
+
+        moves = []
+        rook = PIECE_CODES[COLOR_INDEX[color]][ROOK]
+        back = row * 8
+        if self.castling_rights[color]['kingside'] and self.board[back + 7] == rook:
+            if (not self.board[back + 5] and not self.board[back + 6] and
+                not self.is_square_attacked(row, 5, color) and
+                not self.is_square_attacked(row, 6, color)):
+                moves.append((row, 6))
+        
+        if self.castling_rights[color]['queenside'] and self.board[back] == rook:
+            if (not self.board[back + 3] and not self.board[back + 2] and
+                not self.board[back + 1] and
+                not self.is_square_attacked(row, 3, color) and
+                not self.is_square_attacked(row, 2, color)):
+                moves.append((row, 2))
+
+        return moves
+
+
+    def iter_legal_moves(self, color=None):
+        # Classical legal moves as (from_row, from_col, to_row, to_col), one
+        # piece at a time; each probed piece's list lands in the move cache
+        color = color or self.turn
+        for sq in squares(self.bitboards.occupied[COLOR_INDEX[color]]):
+            row, col = divmod(sq, 8)
+            for move in self.calculate_moves(row, col):
+                yield (row, col) + move
+
+
+    def has_legal_move(self, color=None):
+        return next(self.iter_legal_moves(color), None) is not None
+
+
+    def is_legal_move(self, from_row, from_col, to_row, to_col):
+        piece = self.board[from_row * 8 + from_col]
+        if not piece or COLORS[code_color(piece)] != self.turn or self.promotion_square:
+            return False
+        return (to_row, to_col) in self.calculate_moves(from_row, from_col)
+
+
+    def is_legal_split(self, from_row, from_col, pos1, pos2):
+        piece = self.board[from_row * 8 + from_col]
+        if not piece or COLORS[code_color(piece)] != self.turn or self.promotion_square:
+            return False
+        if code_piece(piece) == KING or pos1 == pos2:
+            return False
+        targets = self.calculate_moves(from_row, from_col, quantum=True)
+        return pos1 in targets and pos2 in targets
+
+
+    def iter_split_moves(self, color=None):
+        # Quantum splits as (from_row, from_col, pos1, pos2), each unordered pair once
+        color = color or self.turn
+        for sq in squares(self.bitboards.occupied[COLOR_INDEX[color]]):
+            row, col = divmod(sq, 8)
+            if self.board[sq] == PIECE_CODES[COLOR_INDEX[color]][KING]:
+                continue
+            targets = self.calculate_moves(row, col, quantum=True)
+            for i, pos1 in enumerate(targets):
+                for pos2 in targets[i + 1:]:
+                    yield row, col, pos1, pos2
+
+
+    def move_collapses(self, from_row, from_col, to_row, to_col):
+        if self.get_quantum_state(to_row, to_col):
+            return True
+        return (self.get_quantum_state(from_row, from_col) is not None and
+                self.board[to_row * 8 + to_col] != EMPTY)
+
+
+    def is_square_attacked(self, row, col, defending_color):
+        return self.bitboards.is_attacked(row * 8 + col, COLOR_INDEX[defending_color] ^ 1)
+
+
+    def is_in_check(self, color):
+        return self.bitboards.check_info(COLOR_INDEX[color])[1] != 0
+
+
+    def status(self):
+        # Checked from the position rather than game_over, since a timer
+        # collapse between turns can take away a king or the last legal move
+        if not all(self.bitboards.pieces[color][KING] for color in (WHITE, BLACK)):
+            return 'king captured'
+        if self.promotion_square:
+            return 'promotion'
+        if not self.has_legal_move():
+            return 'checkmate' if self.is_in_check(self.turn) else 'stalemate'
+        return 'playing'
+
+
+    def split_move(self, from_row, from_col, pos1, pos2):
+        if self.log is not None:
+            self.log.split(from_row, from_col, pos1, pos2)
+        self.push_undo_frame()
+        piece = self.board[from_row * 8 + from_col]
+        new_state = self.new_quantum_state(piece, pos1, pos2)
+        self.add_quantum_state(new_state)
+        
+        self.set_square(pos1[0], pos1[1], piece)
+        self.set_square(pos2[0], pos2[1], piece)
+        if (from_row, from_col) not in (pos1, pos2):
+            self.set_square(from_row, from_col, EMPTY)
+        
+        self.next_turn()
+
+
+    def observed_position(self, state):
+        # The half of a superposed piece that an enemy piece attacks, read
+        # off the attack maps the bitboards keep up to date on every move.
+        # With several attackers, the first one in board order decides.
+        enemy = code_color(state.piece) ^ 1
+        attacked = self.bitboards.attack_map[enemy]
+        observed, first = None, 64
+        for pos in state.positions:
+            sq = pos[0] * 8 + pos[1]
+            if attacked >> sq & 1 and self.board[sq] == state.piece:
+                attackers = self.bitboards.attackers_to(sq, enemy)
+                attacker = (attackers & -attackers).bit_length() - 1
+                if attacker < first:
+                    observed, first = pos, attacker
+        return observed
+
+
+    def observed_states(self):
+        # Only superposed squares attacked by the other color can hold an
+        # observed state, which is usually none of them
+        attack_map, occupied = self.bitboards.attack_map, self.bitboards.occupied
+        candidates = self.quantum_mask & ((occupied[WHITE] & attack_map[BLACK]) |
+                                          (occupied[BLACK] & attack_map[WHITE]))
+        observed = []
+        for sq in squares(candidates):
+            for state in self.quantum_index[divmod(sq, 8)]:
+                if state not in observed and self.observed_position(state):
+                    observed.append(state)
+        observed.sort(key=self.quantum_states.index)
+        return observed
+
+
+    def check_quantum_collapse(self, row, col):
+        state = self.get_quantum_state(row, col)
+        if not state:
+            return False
+        return self.observe(state)
+
+
+    def observe(self, state):
+        pos = self.observed_position(state)
+        if pos is None:
+            return False
+        collapse_index = self.choose_collapse()
+        if state.positions[collapse_index] == pos:
+            # The observed half turns out empty
+            collapse_index ^= 1
+        if self.log is not None:
+            self.log.collapse('observation', state, collapse_index)
+        self.collapse_state(state, collapse_index, trigger='observation')
+        return True
+
+
+    def check_observations(self):
+        # Collapses every observed superposition and returns how many. Each
+        # collapse changes the attack maps, so a state is checked again just
+        # before it collapses, and the squares a collapse opened up are
+        # looked at again afterwards.
+        collapsed = 0
+        while True:
+            count = sum(self.observe(state) for state in self.observed_states())
+            if not count:
+                return collapsed
+            collapsed += count
+
+
+    def choose_collapse(self):
+        # The generator state is journaled before the draw, so a take back
+        # undoes the draw too: a collapse that happens again, such as an
+        # overdue timer, comes out the same instead of being re-rolled
+        if self.journal is not None:
+            self.journal.append((RNG_STATE, self.rng.getstate()))
+        return self.rng.choice([0, 1])
+
+
+    def make_move(self, from_row, from_col, to_row, to_col, collapse_index=None):
+        # Opened before the outcome is drawn, so the draw is undone with the move
+        self.push_undo_frame()
+        if self.log is not None:
+            # The outcome is drawn here rather than below so it can be logged;
+            # it is the same single draw either way
+            if self.move_collapses(from_row, from_col, to_row, to_col):
+                if collapse_index is None:
+                    collapse_index = self.choose_collapse()
+                self.log.move(from_row, from_col, to_row, to_col, collapse_index)
+            else:
+                self.log.move(from_row, from_col, to_row, to_col, None)
+        moving_piece = self.board[from_row * 8 + from_col]
+        target_piece = self.board[to_row * 8 + to_col]
+        mover_type = code_piece(moving_piece)
+        mover_color = COLORS[code_color(moving_piece)]
+        
+        quantum_state = self.get_quantum_state(from_row, from_col)
+        if quantum_state:
+            if target_piece != EMPTY or self.get_quantum_state(to_row, to_col):
+                if collapse_index is None:
+                    collapse_index = self.choose_collapse()
+                final_pos = quantum_state.collapse(collapse_index)
+                other_pos = quantum_state.positions[1] if final_pos == quantum_state.positions[0] else quantum_state.positions[0]
+                
+                self.set_square(quantum_state.positions[0][0], quantum_state.positions[0][1], EMPTY)
+                self.set_square(quantum_state.positions[1][0], quantum_state.positions[1][1], EMPTY)
+                
+                self.set_square(final_pos[0], final_pos[1], quantum_state.piece)
+                
+                self.remove_quantum_state(quantum_state)
+                self.collapse_counts['move'] += 1
+                
+                if final_pos == (from_row, from_col):
+                    self.set_square(to_row, to_col, moving_piece)
+                    self.set_square(from_row, from_col, EMPTY)
+            else:
+                self.move_quantum_half(quantum_state, (from_row, from_col), (to_row, to_col))
+                self.set_square(to_row, to_col, moving_piece)
+                self.set_square(from_row, from_col, EMPTY)
+            
+            self.next_turn()
+            return
+
+        target_quantum_state = self.get_quantum_state(to_row, to_col)
+        if target_quantum_state:
+            if collapse_index is None:
+                collapse_index = self.choose_collapse()
+            final_pos = target_quantum_state.collapse(collapse_index)
+            other_pos = target_quantum_state.positions[1] if final_pos == target_quantum_state.positions[0] else target_quantum_state.positions[0]
+            
+            self.set_square(target_quantum_state.positions[0][0], target_quantum_state.positions[0][1], EMPTY)
+            self.set_square(target_quantum_state.positions[1][0], target_quantum_state.positions[1][1], EMPTY)
+            
+            self.set_square(final_pos[0], final_pos[1], target_quantum_state.piece)
+            
+            self.remove_quantum_state(target_quantum_state)
+            self.collapse_counts['move'] += 1
+            
+            if final_pos == (to_row, to_col):
+                self.set_square(to_row, to_col, moving_piece)
+                self.set_square(from_row, from_col, EMPTY)
+                if mover_type == KING:
+                    self.king_positions[mover_color] = (to_row, to_col)
+
+            self.next_turn()
+            return
+
+        if mover_type == PAWN and abs(to_col - from_col) == 1 and not target_piece:
+            self.set_square(from_row, to_col, EMPTY)
+
+        if mover_type == KING and abs(to_col - from_col) == 2:
+            rook_row = to_row
+            old_rook_col = 7 if to_col > from_col else 0
+            new_rook_col = 5 if to_col > from_col else 3
+            rook_state = self.get_quantum_state(rook_row, old_rook_col)
+            self.set_square(rook_row, new_rook_col, self.board[rook_row * 8 + old_rook_col])
+            self.set_square(rook_row, old_rook_col, EMPTY)
+            # A superposed rook takes its half along
+            if rook_state:
+                self.move_quantum_half(rook_state, (rook_row, old_rook_col), (rook_row, new_rook_col))
+
+        self.zobrist_key ^= self.castling_key()
+        if mover_type == KING:
+            self.king_positions[mover_color] = (to_row, to_col)
+            self.castling_rights[mover_color] = {'kingside': False, 'queenside': False}
+        elif mover_type == ROOK:
+            if from_col == 0:
+                self.castling_rights[mover_color]['queenside'] = False
+            elif from_col == 7:
+                self.castling_rights[mover_color]['kingside'] = False
+        self.zobrist_key ^= self.castling_key()
+
+        self.set_square(to_row, to_col, moving_piece)
+        self.set_square(from_row, from_col, EMPTY)
+        self.last_move = (from_row, from_col, to_row, to_col)
+
+        if mover_type == PAWN and (to_row == 0 or to_row == 7):
+            self.promotion_square = (to_row, to_col)
+            return
+
+        self.next_turn()
+
+
+    def promote(self, choice):
+        if self.promotion_square:
+            if self.log is not None:
+                self.log.promote(choice)
+            row, col = self.promotion_square
+            color = code_color(self.board[row * 8 + col])
+            self.set_square(row, col, PIECE_CODES[color][PIECE_INDEX[choice]])
+            self.promotion_square = None
+            self.next_turn()
+
+
+    def next_turn(self):
+        self.turn = 'black' if self.turn == 'white' else 'white'
+        self.zobrist_key ^= BLACK_TO_MOVE_KEY
+        
+        if not self.has_legal_move():
+            if self.is_in_check(self.turn):
+                winner = 'black' if self.turn == 'white' else 'white'
+                self.game_end_message = f"{winner.capitalize()} wins by checkmate!"
+            else:
+                self.game_end_message = "Game drawn by stalemate!"
+            self.game_over = True
+
+
+    def update_quantum_timers(self):
+        # Collapses every state whose deadline has passed, earliest first
+        for state in self.timers.due():
+            collapse_index = self.choose_collapse()
+            if self.log is not None:
+                self.log.collapse('timer', state, collapse_index)
+            self.collapse_state(state, collapse_index)
+
+
+    def collapse_state(self, state, collapse_index, trigger='timer'):
+        final_pos = state.collapse(collapse_index)
+        other_pos = state.positions[1] if final_pos == state.positions[0] else state.positions[0]
+        self.set_square(other_pos[0], other_pos[1], EMPTY)
+        self.set_square(final_pos[0], final_pos[1], state.piece)
+        self.remove_quantum_state(state)
+        self.collapse_counts[trigger] += 1
@@ -0,0 +1,160 @@
+# FEN reading and writing, extended with superposed pieces
+#
+#   <placement> <side> <castling> <en passant> [halfmove fullmove] [quantum]
+#
+# Both halves of a superposed piece appear in the placement. The optional
+# quantum field lists each pair as two squares with an optional timer in
+# seconds, e.g. "b1c3:72.5,g8f6". Move clocks are accepted and ignored.
+
+from qchess.bitboard import CODE_NAMES
+from qchess.engine import ChessEngine, BOARD_SIZE
+
+PIECE_LETTERS = {'pawn': 'p', 'knight': 'n', 'bishop': 'b', 'rook': 'r', 'queen': 'q', 'king': 'k'}
+LETTER_PIECES = {letter: piece for piece, letter in PIECE_LETTERS.items()}
+# Piece code <-> FEN letter
+CODE_LETTERS = {code: PIECE_LETTERS[piece].upper() if color == 'white' else PIECE_LETTERS[piece]
+                for code, (color, piece) in CODE_NAMES.items()}
+LETTER_CODES = {letter: code for code, letter in CODE_LETTERS.items()}
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq -'
+
+
+def square_name(row, col):
+    return 'abcdefgh'[col] + str(BOARD_SIZE - row)
+
+
+def parse_square(name):
+    if len(name) != 2 or name[0] not in 'abcdefgh' or name[1] not in '12345678':
+        raise ValueError(f"Invalid square: {name!r}")
+    return BOARD_SIZE - int(name[1]), 'abcdefgh'.index(name[0])
+
+
+def move_name(from_row, from_col, to_row, to_col):
+    return square_name(from_row, from_col) + square_name(to_row, to_col)
+
+
+def parse_move(text):
+    # 'e2e4' -> (6, 4, 4, 4)
+    if len(text) != 4:
+        raise ValueError(f"Invalid move: {text!r}")
+    return parse_square(text[:2]) + parse_square(text[2:])
+
+
+def split_name(from_row, from_col, pos1, pos2):
+    return square_name(from_row, from_col) + square_name(*pos1) + square_name(*pos2)
+
+
+def parse_split(text):
+    # 'b1a3c3' -> (7, 1, (5, 0), (5, 2))
+    if len(text) != 6:
+        raise ValueError(f"Invalid split: {text!r}")
+    return parse_square(text[:2]) + (parse_square(text[2:4]), parse_square(text[4:]))
+
+
+def parse_fen(fen, engine=None):
+    fields = fen.split()
+    if len(fields) < 4:
+        raise ValueError(f"Invalid FEN: {fen!r}")
+    placement, side, castling, en_passant = fields[:4]
+    extra = [field for field in fields[4:] if not field.isdigit()]
+    if len(extra) > 1:
+        raise ValueError(f"Invalid FEN: {fen!r}")
+
+    ranks = placement.split('/')
+    if len(ranks) != BOARD_SIZE:
+        raise ValueError(f"Invalid FEN placement: {placement!r}")
+    board = bytearray(BOARD_SIZE * BOARD_SIZE)
+    for row, rank in enumerate(ranks):
+        col = 0
+        for char in rank:
+            if char.isdigit():
+                col += int(char)
+            elif char in LETTER_CODES and col < BOARD_SIZE:
+                board[row * BOARD_SIZE + col] = LETTER_CODES[char]
+                col += 1
+            else:
+                raise ValueError(f"Invalid FEN placement: {placement!r}")
+        if col != BOARD_SIZE:
+            raise ValueError(f"Invalid FEN placement: {placement!r}")
+
+    if side not in ('w', 'b'):
+        raise ValueError(f"Invalid side to move: {side!r}")
+    turn = 'white' if side == 'w' else 'black'
+
+    if castling != '-' and (not castling or set(castling) - set('KQkq')):
+        raise ValueError(f"Invalid castling field: {castling!r}")
+    castling_rights = {
+        'white': {'kingside': 'K' in castling, 'queenside': 'Q' in castling},
+        'black': {'kingside': 'k' in castling, 'queenside': 'q' in castling}
+    }
+
+    last_move = None
+    if en_passant != '-':
+        row, col = parse_square(en_passant)
+        # Reconstruct the double pawn push that allowed it
+        if row == 5:
+            last_move = (6, col, 4, col)
+        elif row == 2:
+            last_move = (1, col, 3, col)
+        else:
+            raise ValueError(f"Invalid en passant square: {en_passant!r}")
+
+    engine = engine or ChessEngine()
+    quantum_states = []
+    if extra and extra[0] != '-':
+        for entry in extra[0].split(','):
+            squares_, _, timer = entry.partition(':')
+            if len(squares_) != 4:
+                raise ValueError(f"Invalid quantum pair: {entry!r}")
+            pos1, pos2 = parse_square(squares_[:2]), parse_square(squares_[2:])
+            piece = board[pos1[0] * BOARD_SIZE + pos1[1]]
+            if pos1 == pos2 or not piece or board[pos2[0] * BOARD_SIZE + pos2[1]] != piece:
+                raise ValueError(f"Quantum pair {entry!r} does not hold one piece on both squares")
+            if timer:
+                state = engine.new_quantum_state(piece, pos1, pos2, float(timer))
+            else:
+                state = engine.new_quantum_state(piece, pos1, pos2)
+            quantum_states.append(state)
+
+    engine.set_position(board, turn, castling_rights, last_move, quantum_states)
+    return engine
+
+
+def to_fen(engine):
+    ranks = []
+    for row in range(BOARD_SIZE):
+        rank = ''
+        empty = 0
+        for col in range(BOARD_SIZE):
+            piece = engine.piece_at(row, col)
+            if not piece:
+                empty += 1
+                continue
+            if empty:
+                rank += str(empty)
+                empty = 0
+            rank += CODE_LETTERS[piece]
+        if empty:
+            rank += str(empty)
+        ranks.append(rank)
+
+    castling = ''
+    for color, kingside, queenside in (('white', 'K', 'Q'), ('black', 'k', 'q')):
+        if engine.castling_rights[color]['kingside']:
+            castling += kingside
+        if engine.castling_rights[color]['queenside']:
+            castling += queenside
+
+    en_passant = engine.en_passant_square(engine.turn)
+    fields = [
+        '/'.join(ranks),
+        'w' if engine.turn == 'white' else 'b',
+        castling or '-',
+        square_name(*divmod(en_passant, 8)) if en_passant is not None else '-'
+    ]
+    if engine.quantum_states:
+        fields.append(','.join(
+            f"{square_name(*state.positions[0])}{square_name(*state.positions[1])}:{engine.time_left(state):.1f}"
+            for state in engine.quantum_states
+        ))
+    return ' '.join(fields)
@@ -0,0 +1,259 @@
+# Compact binary game logs
+#
+#   python -m qchess.gamelog games.qlog            # replay every game, print a summary
+#   python -m qchess.gamelog games.qlog --fen      # and the final position of each
+#
+# A log is the 4-byte magic b'QCL2' followed by records. Every record is an
+# opcode byte, the milliseconds since the previous record of the game as a
+# varint, and a fixed payload. Squares are one byte, row * 8 + col.
+#
+#   GAME      seed (zigzag varint, so any integer fits), FEN length
+#             (varint), FEN (empty for the standard start)
+#   MOVE      from, to; the high nibble of the opcode is 0, or 1 + the
+#             collapse outcome when the move collapsed a superposition
+#   SPLIT     from, first square, second square
+#   PROMOTE   piece index (qchess.bitboard.PIECE_INDEX)
+#   COLLAPSE  first square, second square, outcome; the high nibble of the
+#             opcode is the trigger, 1 for a timer and 2 for an observation
+#   UNDO      no payload
+#   END       winner: 0 for none, 1 for white, 2 for black
+#
+# Games follow each other and never interleave. Collapse outcomes are stored,
+# not just the seed, so a replay does not depend on the order the engine
+# draws random numbers in. The log is read from any bytes-like object, so a
+# file can be memory-mapped and scanned without loading it.
+
+import argparse
+import mmap
+import sys
+import time
+
+from qchess.bitboard import PIECE_INDEX, PIECE_TYPES
+from qchess.engine import ChessEngine, ManualClock
+from qchess.fen import START_FEN, parse_fen, to_fen
+
+# QCL1 stored the seed in 8 unsigned bytes
+MAGIC = b'QCL2'
+GAME, MOVE, SPLIT, PROMOTE, COLLAPSE, UNDO, END = range(1, 8)
+TRIGGERS = {'timer': 1, 'observation': 2}
+TRIGGER_NAMES = {code: name for name, code in TRIGGERS.items()}
+WINNERS = {None: 0, 'white': 1, 'black': 2}
+WINNER_NAMES = {code: name for name, code in WINNERS.items()}
+
+
+def encode_varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return out
+
+
+def decode_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_signed(value):
+    # Zigzag: 0, -1, 1, -2, ... become 0, 1, 2, 3, ...
+    return encode_varint(value << 1 if value >= 0 else (-value << 1) - 1)
+
+
+def decode_signed(data, offset):
+    value, offset = decode_varint(data, offset)
+    return (value >> 1 if not value & 1 else -(value >> 1) - 1), offset
+
+
+def _square(pos):
+    return pos[0] * 8 + pos[1]
+
+
+class LogWriter:
+    # Attached to an engine with start(), which sets engine.log; the engine
+    # then reports every action and collapse to it as they happen
+    def __init__(self, stream, header=True):
+        self.stream = stream
+        self.engine = None
+        if header:
+            stream.write(MAGIC)
+
+    def start(self, engine):
+        self.engine = engine
+        engine.log = self
+        self.origin = engine.timers.now()
+        self.last_ms = 0
+        fen = to_fen(engine)
+        fen = b'' if fen == START_FEN else fen.encode()
+        self.write(GAME, encode_signed(engine.seed) + encode_varint(len(fen)) + fen)
+
+    def finish(self, winner=None):
+        self.write(END, bytes((WINNERS[winner],)))
+        self.engine.log = None
+        self.engine = None
+
+    def write(self, opcode, payload=b''):
+        ms = int((self.engine.timers.now() - self.origin) * 1000)
+        delta = max(ms - self.last_ms, 0)
+        self.last_ms += delta
+        self.stream.write(bytes((opcode,)) + encode_varint(delta) + payload)
+
+    def move(self, from_row, from_col, to_row, to_col, collapse_index):
+        opcode = MOVE if collapse_index is None else MOVE | (collapse_index + 1) << 4
+        self.write(opcode, bytes((from_row * 8 + from_col, to_row * 8 + to_col)))
+
+    def split(self, from_row, from_col, pos1, pos2):
+        self.write(SPLIT, bytes((from_row * 8 + from_col, _square(pos1), _square(pos2))))
+
+    def promote(self, choice):
+        self.write(PROMOTE, bytes((PIECE_INDEX[choice],)))
+
+    def collapse(self, trigger, state, collapse_index):
+        self.write(COLLAPSE | TRIGGERS[trigger] << 4,
+                   bytes((_square(state.positions[0]), _square(state.positions[1]), collapse_index)))
+
+    def undo(self):
+        self.write(UNDO)
+
+
+class LoggedGame:
+    def __init__(self, seed, fen):
+        self.seed = seed
+        self.fen = fen
+        # (milliseconds since the start, opcode, arguments)
+        self.actions = []
+        self.winner = None
+        self.finished = False
+
+
+def read_games(data):
+    # Yields every game in a log, from bytes, a memoryview or an mmap
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a game log")
+    offset = len(MAGIC)
+    game = None
+    now = 0
+    while offset < len(data):
+        opcode = data[offset]
+        nibble, opcode = opcode >> 4, opcode & 0x0F
+        delta, offset = decode_varint(data, offset + 1)
+        now += delta
+        if opcode == GAME:
+            if game is not None:
+                yield game
+            seed, offset = decode_signed(data, offset)
+            length, offset = decode_varint(data, offset)
+            fen = bytes(data[offset:offset + length]).decode() or START_FEN
+            offset += length
+            game, now = LoggedGame(seed, fen), 0
+            continue
+        if game is None:
+            raise ValueError(f"Record at offset {offset} comes before any game")
+        if opcode == MOVE:
+            from_sq, to_sq = data[offset], data[offset + 1]
+            offset += 2
+            args = divmod(from_sq, 8) + divmod(to_sq, 8) + (nibble - 1 if nibble else None,)
+        elif opcode == SPLIT:
+            from_sq, sq1, sq2 = data[offset:offset + 3]
+            offset += 3
+            args = divmod(from_sq, 8) + (divmod(sq1, 8), divmod(sq2, 8))
+        elif opcode == PROMOTE:
+            args = (PIECE_TYPES[data[offset]],)
+            offset += 1
+        elif opcode == COLLAPSE:
+            sq1, sq2, index = data[offset:offset + 3]
+            offset += 3
+            args = (TRIGGER_NAMES[nibble], divmod(sq1, 8), divmod(sq2, 8), index)
+        elif opcode == UNDO:
+            args = ()
+        elif opcode == END:
+            game.winner = WINNER_NAMES[data[offset]]
+            game.finished = True
+            offset += 1
+            continue
+        else:
+            raise ValueError(f"Unknown record {opcode} at offset {offset}")
+        game.actions.append((now, opcode, args))
+    if game is not None:
+        yield game
+
+
+def replay(game, before=None):
+    # Plays a logged game through a fresh engine with its recorded seed and
+    # times, applying the logged collapse outcomes, and returns the engine.
+    # before, if given, is called with the engine, opcode and arguments
+    # ahead of every action.
+    clock = ManualClock()
+    engine = ChessEngine(seed=game.seed, clock=clock)
+    parse_fen(game.fen, engine)
+    for ms, opcode, args in game.actions:
+        clock.now = ms / 1000
+        if before is not None:
+            before(engine, opcode, args)
+        if opcode == MOVE:
+            engine.make_move(*args)
+        elif opcode == SPLIT:
+            engine.split_move(*args)
+        elif opcode == PROMOTE:
+            engine.promote(args[0])
+        elif opcode == COLLAPSE:
+            trigger, pos1, pos2, index = args
+            state = next((state for state in engine.quantum_index.get(pos1, ())
+                          if [tuple(pos) for pos in state.positions] == [pos1, pos2]), None)
+            if state is None:
+                raise ValueError(f"No superposition on {pos1} and {pos2} to collapse at {ms} ms")
+            engine.collapse_state(state, index, trigger)
+        elif opcode == UNDO:
+            engine.unmake_move()
+    return engine
+
+
+def append_log(path):
+    # A LogWriter that appends games to a log file, starting it if it is new
+    stream = open(path, 'ab')
+    if stream.tell():
+        with open(path, 'rb') as existing:
+            if existing.read(len(MAGIC)) != MAGIC:
+                stream.close()
+                raise ValueError(f"{path} is not a {MAGIC.decode()} game log")
+    return LogWriter(stream, header=stream.tell() == 0)
+
+
+def open_log(path):
+    # Memory-maps a log file for read_games
+    with open(path, 'rb') as stream:
+        return mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay quantum chess game logs')
+    parser.add_argument('log')
+    parser.add_argument('--fen', action='store_true', help='print the final position of every game')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    data = open_log(args.log)
+    games = actions = 0
+    results = {'white': 0, 'black': 0, None: 0}
+    for game in read_games(data):
+        engine = replay(game)
+        games += 1
+        actions += len(game.actions)
+        results[game.winner] += 1
+        if args.fen:
+            print(to_fen(engine))
+    elapsed = time.perf_counter() - start
+    print(f"{games} games, {actions} actions replayed in {elapsed:.2f}s "
+          f"({actions / elapsed if elapsed else 0:.0f} actions/s)", file=sys.stderr)
+    print(f"white {results['white']}  black {results['black']}  other {results[None]}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+# Optional counters and timers for the hot paths
+#
+#   QCHESS_PROFILE=1 python quantum_chess.py                   # counters, shown in an overlay
+#   QCHESS_PROFILE=stats.json python -m qchess.simulate ...    # also written as JSON at exit
+#   QCHESS_PROFILE=run.prof python quantum_chess.py            # plus a cProfile dump, for pstats
+#
+# Nothing is wrapped until enable() runs, so while profiling is off the hot
+# methods are the plain functions and cost nothing extra. enable() replaces
+# each instrumented method on its class with a wrapper that counts calls
+# and adds up inclusive wall time. Wrapped engine calls made on the main
+# thread are also added up per turn, from one change of side to the next,
+# as the rules time of that turn.
+#
+# Pool workers exit without running exit handlers, so profile
+# qchess.simulate with --workers 1.
+
+import atexit
+import cProfile
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from qchess.bitboard import Bitboards
+from qchess.engine import ChessEngine
+
+ENV = 'QCHESS_PROFILE'
+ENGINE_METHODS = ('calculate_moves', 'is_square_attacked', 'is_in_check', 'make_move', 'split_move',
+                  'next_turn', 'check_quantum_collapse', 'check_observations', 'update_quantum_timers')
+# check_info and legal_targets are where moves that would leave the king in
+# check are filtered out
+BITBOARD_METHODS = ('check_info', 'legal_targets', 'attackers_to')
+# Frames and turns kept for the summaries
+HISTORY = 600
+
+# The Stats of the running process, or None while profiling is off
+stats = None
+
+
+class Stats:
+    def __init__(self):
+        # name -> [calls, seconds]
+        self.counters = {}
+        # Seconds per rendered frame and rules seconds per turn
+        self.frames = deque(maxlen=HISTORY)
+        self.turns = deque(maxlen=HISTORY)
+        self.thread = threading.get_ident()
+        # Nesting of wrapped engine calls on the main thread
+        self.depth = 0
+        self.rules = 0.0
+        self.turn = None
+
+    def end_rules(self, engine, seconds):
+        self.rules += seconds
+        if engine.turn != self.turn:
+            if self.turn is not None:
+                self.turns.append(self.rules)
+            self.turn = engine.turn
+            self.rules = 0.0
+
+    def top(self, count=None):
+        # (name, calls, seconds), most time first
+        rows = sorted(((name, calls, seconds) for name, (calls, seconds) in self.counters.items() if calls),
+                      key=lambda row: -row[2])
+        return rows[:count]
+
+    def summary(self):
+        return {
+            'counters': {name: {'calls': calls, 'seconds': seconds, 'mean_us': seconds / calls * 1e6}
+                         for name, calls, seconds in self.top()},
+            'frames': summarise(self.frames),
+            'turns': summarise(self.turns),
+        }
+
+
+def summarise(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'mean_ms': sum(samples) / len(samples) * 1000,
+        'p50_ms': samples[len(samples) // 2] * 1000,
+        'p99_ms': samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1000,
+        'max_ms': samples[-1] * 1000,
+    }
+
+
+def wrap(cls, name, samples=None):
+    # Replaces cls.name with a counting wrapper; samples, if given, gets the
+    # duration of every call
+    function = getattr(cls, name)
+    counter = stats.counters.setdefault(f"{cls.__name__}.{name}", [0, 0.0])
+    clock = time.perf_counter
+    owner = stats
+
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            seconds = clock() - start
+            counter[0] += 1
+            counter[1] += seconds
+            if samples is not None:
+                samples.append(seconds)
+
+    def engine_wrapper(self, *args, **kwargs):
+        main = threading.get_ident() == owner.thread
+        if main:
+            owner.depth += 1
+        start = clock()
+        try:
+            return function(self, *args, **kwargs)
+        finally:
+            seconds = clock() - start
+            counter[0] += 1
+            counter[1] += seconds
+            if main:
+                owner.depth -= 1
+                if not owner.depth:
+                    owner.end_rules(self, seconds)
+
+    chosen = engine_wrapper if issubclass(cls, ChessEngine) else wrapper
+    chosen.__name__ = name
+    chosen.__wrapped__ = function
+    setattr(cls, name, chosen)
+
+
+def enable(path=None):
+    # Instruments the engine; path, if given, is written at exit as JSON,
+    # or as cProfile stats when it ends in .prof
+    global stats
+    if stats is not None:
+        return stats
+    stats = Stats()
+    for name in ENGINE_METHODS:
+        wrap(ChessEngine, name)
+    for name in BITBOARD_METHODS:
+        wrap(Bitboards, name)
+    if path and path.endswith('.prof'):
+        profile = cProfile.Profile()
+        profile.enable()
+
+        def dump_profile():
+            profile.disable()
+            profile.dump_stats(path)
+
+        atexit.register(dump_profile)
+    elif path:
+        atexit.register(dump, path)
+    return stats
+
+
+def dump(path):
+    with open(path, 'w') as stream:
+        json.dump(stats.summary(), stream, indent=2)
+
+
+def enable_from_environment():
+    value = os.environ.get(ENV)
+    if value and value != '0':
+        enable(None if value == '1' else value)
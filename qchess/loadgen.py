@@ -0,0 +1,131 @@
+# Load generator for the game server
+#
+#   python -m qchess.loadgen --concurrency 200 --seconds 20
+#   python -m qchess.loadgen --port 8765 --concurrency 50   # an already running server
+#
+# Starts a server on a free port unless one is given, then runs the given
+# number of players at once. Each player holds its own connection and plays
+# games one after another with random moves and splits, timing every request
+# from send to reply. Reports throughput, move latency percentiles and games
+# per core: how many concurrent games one core of server CPU time keeps up
+# with at this move rate.
+
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+
+
+class Client:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = 0
+
+    @classmethod
+    async def connect(cls, host, port):
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def request(self, cmd, **fields):
+        self.ids += 1
+        self.writer.write(json.dumps({'cmd': cmd, 'id': self.ids, **fields}).encode() + b'\n')
+        while True:
+            reply = json.loads(await self.reader.readline())
+            # Events from other players of a joined game come in between
+            if reply.get('id') == self.ids:
+                return reply
+
+    def close(self):
+        self.writer.close()
+
+
+async def player(host, port, rng, stop, args, stats):
+    client = await Client.connect(host, port)
+    try:
+        while time.perf_counter() < stop:
+            game = (await client.request('new', seed=rng.getrandbits(32)))['game']
+            for _ in range(args.plies):
+                if time.perf_counter() >= stop:
+                    break
+                options = await client.request('moves', game=game)
+                if not options['moves']:
+                    break
+                if options['splits'] and rng.random() < args.split_rate:
+                    cmd, fields = 'split', {'split': rng.choice(options['splits'])}
+                else:
+                    cmd, fields = 'move', {'move': rng.choice(options['moves']), 'promotion': 'queen'}
+                start = time.perf_counter()
+                reply = await client.request(cmd, game=game, **fields)
+                stats['latencies'].append(time.perf_counter() - start)
+                if not reply['ok']:
+                    # A collapse timer fired between listing and playing
+                    stats['rejected'] += 1
+                elif reply['status'] != 'playing':
+                    break
+                if args.think:
+                    await asyncio.sleep(args.think)
+            await client.request('close', game=game)
+            stats['games'] += 1
+    finally:
+        client.close()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+async def run(args):
+    server = None
+    port = args.port
+    if port is None:
+        server = subprocess.Popen([sys.executable, '-m', 'qchess.server', '--port', '0', '--workers', '1'],
+                                  stdout=subprocess.PIPE, text=True)
+        # "listening on host:port"
+        port = int(server.stdout.readline().rsplit(':', 1)[1])
+    try:
+        monitor = await Client.connect(args.host, port)
+        cpu_before = (await monitor.request('stats'))['cpu_seconds']
+        stats = {'latencies': [], 'games': 0, 'rejected': 0}
+        start = time.perf_counter()
+        stop = start + args.seconds
+        await asyncio.gather(*(player(args.host, port, random.Random(f"{args.seed}:{index}"), stop, args, stats)
+                               for index in range(args.concurrency)))
+        wall = time.perf_counter() - start
+        server_cpu = (await monitor.request('stats'))['cpu_seconds'] - cpu_before
+        monitor.close()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    latencies = stats['latencies']
+    print(f"{args.concurrency} players, {wall:.1f}s: {len(latencies)} moves ({len(latencies) / wall:.0f}/s), "
+          f"{stats['games']} games, {stats['rejected']} rejected")
+    print(f"move latency  p50 {percentile(latencies, 0.5) * 1000:.2f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:.2f} ms  max {max(latencies, default=0) * 1000:.2f} ms")
+    load = server_cpu / wall
+    print(f"server CPU {server_cpu:.2f}s ({load * 100:.0f}% of a core), "
+          f"games per core {args.concurrency / load if load else float('inf'):.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load generator for the quantum chess server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help='use a running server instead of starting one')
+    parser.add_argument('--concurrency', type=int, default=100, help='players at once')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--plies', type=int, default=200, help='plies per game before starting another')
+    parser.add_argument('--split-rate', type=float, default=0.1)
+    parser.add_argument('--think', type=float, default=0.0, help='seconds each player waits between moves')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    asyncio.run(run(args))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,284 @@
+# Perft: count leaf nodes of the move tree to a fixed depth
+#
+#   python -m qchess.perft                       # built-in suite, depth 3
+#   python -m qchess.perft --quantum --depth 2   # include splits and collapses
+#   python -m qchess.perft --fen "<fen>" --divide
+#   python -m qchess.perft --validate            # cross-check every node
+#
+# In quantum mode every split pair is a move, and a move that forces a
+# collapse counts once per outcome. Promotions count once per piece.
+
+import argparse
+import sys
+import time
+
+from qchess.bitboard import CODE_NAMES, PIECE_CODES, WHITE, BLACK, PAWN
+from qchess.engine import PROMOTIONS
+from qchess.fen import parse_fen, square_name, START_FEN
+
+PAWNS = (PIECE_CODES[WHITE][PAWN], PIECE_CODES[BLACK][PAWN])
+
+# Classical node counts; these match standard chess perft results
+SUITE = [
+    ('start', START_FEN, [20, 400, 8902, 197281]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq -', [48, 2039, 97862]),
+    ('endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - -', [14, 191, 2812, 43238]),
+    # A bishop landing on the en passant square does not capture the pawn
+    ('ep-evasion', '8/8/8/4k3/5Pb1/8/8/4K3 b - f3', [8, 30, 417, 2343]),
+    ('superposed', 'rnbqkb1r/pppppppp/5n1n/8/8/N1N5/PPPPPPPP/R1BQKBNR w KQkq - a3c3,f6h6', []),
+]
+
+
+def is_promotion(engine, from_row, from_col, to_row):
+    return engine.piece_at(from_row, from_col) in PAWNS and to_row in (0, 7)
+
+
+def branches(engine, quantum=False):
+    # Plays every move, promotion choice and collapse outcome on engine in
+    # turn, yielding its label while the child position is on the board
+    for from_row, from_col, to_row, to_col in list(engine.iter_legal_moves()):
+        label = square_name(from_row, from_col) + square_name(to_row, to_col)
+        if quantum and engine.move_collapses(from_row, from_col, to_row, to_col):
+            for index in (0, 1):
+                engine.make_move(from_row, from_col, to_row, to_col, collapse_index=index)
+                yield f"{label}/{index}"
+                engine.unmake_move()
+        elif is_promotion(engine, from_row, from_col, to_row):
+            for choice in PROMOTIONS:
+                engine.make_move(from_row, from_col, to_row, to_col)
+                engine.promote(choice)
+                yield label + ('n' if choice == 'knight' else choice[0])
+                engine.unmake_move()
+        else:
+            engine.make_move(from_row, from_col, to_row, to_col, collapse_index=0)
+            yield label
+            engine.unmake_move()
+
+    if quantum:
+        for from_row, from_col, pos1, pos2 in list(engine.iter_split_moves()):
+            engine.split_move(from_row, from_col, pos1, pos2)
+            yield f"{square_name(from_row, from_col)}~{square_name(*pos1)}{square_name(*pos2)}"
+            engine.unmake_move()
+
+
+def count_branches(engine, quantum=False):
+    count = 0
+    for from_row, from_col, to_row, to_col in engine.iter_legal_moves():
+        if quantum and engine.move_collapses(from_row, from_col, to_row, to_col):
+            count += 2
+        elif is_promotion(engine, from_row, from_col, to_row):
+            count += len(PROMOTIONS)
+        else:
+            count += 1
+    if quantum:
+        count += sum(1 for _ in engine.iter_split_moves())
+    return count
+
+
+def perft(engine, depth, quantum=False, validate=False):
+    if validate:
+        validate_position(engine)
+    if depth == 0:
+        return 1
+    if depth == 1 and not validate:
+        return count_branches(engine, quantum)
+    return sum(perft(engine, depth - 1, quantum, validate) for _ in branches(engine, quantum))
+
+
+def divide(engine, depth, quantum=False):
+    return [(label, perft(engine, depth - 1, quantum)) for label in branches(engine, quantum)]
+
+
+# Reference generator: scans a grid of {'piece', 'color'} dicts square by
+# square like the original calculate_moves and checks legality by playing
+# each move on a scratch copy. Slow, but independent of the bitboard code
+# and the piece encoding.
+
+KNIGHT_OFFSETS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
+KING_OFFSETS = [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+STRAIGHT = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+DIAGONAL = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+
+def _attacked(board, row, col, by_color):
+    direction = 1 if by_color == 'black' else -1
+    for dc in (-1, 1):
+        r, c = row - direction, col + dc
+        if 0 <= r < 8 and 0 <= c < 8 and board[r][c] == {'piece': 'pawn', 'color': by_color}:
+            return True
+    for offsets, piece_type in ((KNIGHT_OFFSETS, 'knight'), (KING_OFFSETS, 'king')):
+        for dr, dc in offsets:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8 and board[r][c] == {'piece': piece_type, 'color': by_color}:
+                return True
+    for directions, sliders in ((STRAIGHT, ('rook', 'queen')), (DIAGONAL, ('bishop', 'queen'))):
+        for dr, dc in directions:
+            r, c = row + dr, col + dc
+            while 0 <= r < 8 and 0 <= c < 8:
+                target = board[r][c]
+                if target:
+                    if target['color'] == by_color and target['piece'] in sliders:
+                        return True
+                    break
+                r, c = r + dr, c + dc
+    return False
+
+
+def _king_square(board, color):
+    for row in range(8):
+        for col in range(8):
+            if board[row][col] == {'piece': 'king', 'color': color}:
+                return row, col
+    return None
+
+
+def _grid(engine):
+    grid = [[None] * 8 for _ in range(8)]
+    for sq, code in enumerate(engine.board):
+        if code:
+            color, piece_type = CODE_NAMES[code]
+            grid[sq // 8][sq % 8] = {'piece': piece_type, 'color': color}
+    return grid
+
+
+def reference_moves(engine, row, col, board=None):
+    board = board or _grid(engine)
+    piece = board[row][col]
+    color = piece['color']
+    enemy = 'black' if color == 'white' else 'white'
+    piece_type = piece['piece']
+    moves = []
+
+    if piece_type == 'pawn':
+        direction = 1 if color == 'black' else -1
+        start_row = 1 if color == 'black' else 6
+        if 0 <= row + direction < 8 and not board[row + direction][col]:
+            moves.append((row + direction, col))
+            if row == start_row and not board[row + 2 * direction][col]:
+                moves.append((row + 2 * direction, col))
+        for new_col in (col - 1, col + 1):
+            if 0 <= new_col < 8 and 0 <= row + direction < 8:
+                target = board[row + direction][new_col]
+                if target and target['color'] != color:
+                    moves.append((row + direction, new_col))
+                elif not target and engine.last_move and board[row][new_col] == {'piece': 'pawn', 'color': enemy}:
+                    last_from_row, _, last_to_row, last_to_col = engine.last_move
+                    if (last_from_row == (1 if color == 'white' else 6) and
+                        last_to_row == row and last_to_col == new_col and
+                        abs(last_from_row - last_to_row) == 2):
+                        moves.append((row + direction, new_col))
+    elif piece_type in ('knight', 'king'):
+        for dr, dc in KNIGHT_OFFSETS if piece_type == 'knight' else KING_OFFSETS:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8 and (not board[r][c] or board[r][c]['color'] != color):
+                moves.append((r, c))
+    else:
+        directions = []
+        if piece_type in ('rook', 'queen'):
+            directions += STRAIGHT
+        if piece_type in ('bishop', 'queen'):
+            directions += DIAGONAL
+        for dr, dc in directions:
+            r, c = row + dr, col + dc
+            while 0 <= r < 8 and 0 <= c < 8:
+                if board[r][c]:
+                    if board[r][c]['color'] != color:
+                        moves.append((r, c))
+                    break
+                moves.append((r, c))
+                r, c = r + dr, c + dc
+
+    legal = []
+    for to_row, to_col in moves:
+        scratch = [line[:] for line in board]
+        if piece_type == 'pawn' and to_col != col and not scratch[to_row][to_col]:
+            scratch[row][to_col] = None
+        scratch[to_row][to_col] = piece
+        scratch[row][col] = None
+        king = _king_square(scratch, color)
+        if king is None or not _attacked(scratch, *king, enemy):
+            legal.append((to_row, to_col))
+
+    if piece_type == 'king' and not _attacked(board, row, col, enemy):
+        rook = {'piece': 'rook', 'color': color}
+        rights = engine.castling_rights[color]
+        if (rights['kingside'] and board[row][7] == rook and
+            not board[row][5] and not board[row][6] and
+            not _attacked(board, row, 5, enemy) and not _attacked(board, row, 6, enemy)):
+            legal.append((row, 6))
+        if (rights['queenside'] and board[row][0] == rook and
+            not board[row][3] and not board[row][2] and not board[row][1] and
+            not _attacked(board, row, 3, enemy) and not _attacked(board, row, 2, enemy)):
+            legal.append((row, 2))
+
+    return sorted(legal)
+
+
+def validate_position(engine):
+    board = _grid(engine)
+    if _king_square(board, engine.turn) is None:
+        return
+    for row in range(8):
+        for col in range(8):
+            piece = board[row][col]
+            if piece and piece['color'] == engine.turn:
+                expected = reference_moves(engine, row, col, board)
+                actual = sorted(engine.calculate_moves(row, col))
+                if actual != expected:
+                    from qchess.fen import to_fen
+                    raise AssertionError(
+                        f"{to_fen(engine)}: {square_name(row, col)} generates "
+                        f"{[square_name(*move) for move in actual]}, expected "
+                        f"{[square_name(*move) for move in expected]}"
+                    )
+
+
+def run_suite(depth, quantum=False, validate=False):
+    failed = False
+    for name, fen, expected in SUITE:
+        for current in range(1, depth + 1):
+            engine = parse_fen(fen)
+            start = time.perf_counter()
+            nodes = perft(engine, current, quantum, validate)
+            elapsed = time.perf_counter() - start
+            status = ''
+            if not quantum and current <= len(expected):
+                if nodes == expected[current - 1]:
+                    status = 'ok'
+                else:
+                    status = f"FAIL (expected {expected[current - 1]})"
+                    failed = True
+            nps = nodes / elapsed if elapsed else 0
+            print(f"{name:<12} depth {current}  {nodes:>10} nodes  {elapsed:8.3f}s  {nps:>10.0f} nps  {status}")
+    return not failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Quantum chess perft')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fen', help='position to search instead of the built-in suite')
+    parser.add_argument('--quantum', action='store_true', help='include quantum splits and collapse outcomes')
+    parser.add_argument('--divide', action='store_true', help='print node counts per root move')
+    parser.add_argument('--validate', action='store_true',
+                        help='compare every node against the reference move generator')
+    args = parser.parse_args(argv)
+
+    if not args.fen:
+        return 0 if run_suite(args.depth, args.quantum, args.validate) else 1
+
+    engine = parse_fen(args.fen)
+    start = time.perf_counter()
+    if args.divide:
+        results = divide(engine, args.depth, args.quantum)
+        for label, nodes in results:
+            print(f"{label}: {nodes}")
+        total = sum(nodes for _, nodes in results)
+    else:
+        total = perft(engine, args.depth, args.quantum, args.validate)
+    elapsed = time.perf_counter() - start
+    print(f"nodes {total}  time {elapsed:.3f}s  nps {total / elapsed if elapsed else 0:.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,296 @@
+# Line protocol for driving games over stdin/stdout
+#
+#   python -m qchess.protocol
+#   python -m qchess.protocol --realtime < commands.txt
+#
+# Modelled on UCI: one command per line in, one reply line out per command.
+# Squares are algebraic; moves are "e2e4", with a promotion letter as
+# "e7e8q", and splits are the source and both targets, "b1a3c3".
+#
+#   qci                               id name Quantum Chess, then qciok
+#   isready                           readyok
+#   newgame [seed]                    ok
+#   position startpos|fen <fen> [moves <move or split> ...]
+#                                     ok
+#   move <move>                       ok
+#   split <split>                     ok
+#   promote <piece or letter>         ok
+#   undo                              ok
+#   moves                             moves <move> ...
+#   splits                            splits <split> ...
+#   quantum                           quantum <sq1><sq2>:<seconds> ... (or -)
+#   clock <seconds>                   ok, after collapsing what came due
+#   fen                               fen <fen>
+#   status                            status playing|promotion|checkmate|stalemate|king captured [winner]
+#   book                              book <move or split>:<times played> ... (or -)
+#   go [movetime <ms>] [depth <n>]    info depth <n> [score <cp>] nodes <n> (or info book), then
+#                                     bestmove <move> (or none)
+#   quit
+#
+# A command that fails replies "error <reason>" instead. Every collapse is
+# reported before the reply as "collapse <trigger> <sq1> <sq2> <final>",
+# where the trigger is move, timer or observation.
+#
+# The clock is a ManualClock that only moves on "clock", so a game driven
+# through the protocol replays exactly from its seed. With --realtime the
+# timers run on the wall clock and collapse before each command instead.
+# With --book, "go" plays the opening book's most played move when there is
+# one, without searching.
+
+import argparse
+import math
+import sys
+import time
+
+from qchess.ai import EnginePlayer
+from qchess.bitboard import WHITE, PAWN, KING, code_piece
+from qchess.book import OpeningBook
+from qchess.engine import ChessEngine, ManualClock, PROMOTIONS
+from qchess.fen import (START_FEN, PIECE_LETTERS, LETTER_PIECES, parse_fen, to_fen, square_name, move_name,
+                        parse_move, split_name, parse_split)
+
+
+class ProtocolError(Exception):
+    # Also raised by qchess.server for a bad request
+    pass
+
+
+def argument(args):
+    if len(args) != 1:
+        raise ProtocolError("expected one argument")
+    return args[0]
+
+
+class CollapseReporter:
+    # Attached as engine.log; only collapses are reported
+    def __init__(self, protocol):
+        self.protocol = protocol
+
+    def move(self, from_row, from_col, to_row, to_col, collapse_index):
+        if collapse_index is not None:
+            engine = self.protocol.engine
+            # Called before the move is made, so the state is still indexed
+            state = (engine.get_quantum_state(from_row, from_col) or
+                     engine.get_quantum_state(to_row, to_col))
+            self.collapse('move', state, collapse_index)
+
+    def split(self, from_row, from_col, pos1, pos2):
+        pass
+
+    def promote(self, choice):
+        pass
+
+    def collapse(self, trigger, state, collapse_index):
+        self.protocol.send(f"collapse {trigger} {square_name(*state.positions[0])} "
+                           f"{square_name(*state.positions[1])} {square_name(*state.positions[collapse_index])}")
+
+    def undo(self):
+        pass
+
+
+class Protocol:
+    def __init__(self, output, realtime=False, book=None):
+        self.output = output
+        self.book = book
+        self.clock = time.monotonic if realtime else ManualClock()
+        self.realtime = realtime
+        self.reporter = CollapseReporter(self)
+        self.new_engine()
+
+    def new_engine(self, seed=None):
+        self.engine = ChessEngine(seed=seed, clock=self.clock)
+        self.engine.log = self.reporter
+
+    def send(self, line):
+        self.output.write(line + '\n')
+
+    def run(self, lines):
+        for line in lines:
+            if not self.handle(line):
+                break
+            self.output.flush()
+
+    def handle(self, line):
+        # Returns False on quit
+        words = line.split()
+        if not words:
+            return True
+        if words[0] == 'quit':
+            return False
+        handler = getattr(self, 'cmd_' + words[0], None)
+        try:
+            if handler is None:
+                raise ProtocolError(f"unknown command {words[0]}")
+            if self.realtime:
+                self.engine.update_quantum_timers()
+            self.send(handler(words[1:]))
+        except (ProtocolError, ValueError) as error:
+            self.send(f"error {error}")
+        return True
+
+    def cmd_qci(self, args):
+        self.send("id name Quantum Chess")
+        return "qciok"
+
+    def cmd_isready(self, args):
+        return "readyok"
+
+    def cmd_newgame(self, args):
+        self.new_engine(int(args[0]) if args else None)
+        return "ok"
+
+    def cmd_position(self, args):
+        if 'moves' in args:
+            split_at = args.index('moves')
+            args, actions = args[:split_at], args[split_at + 1:]
+        else:
+            actions = []
+        if args == ['startpos']:
+            fen = START_FEN
+        elif args[:1] == ['fen']:
+            fen = ' '.join(args[1:])
+        else:
+            raise ProtocolError("expected startpos or fen")
+        # Keeps the game's seed
+        parse_fen(fen, self.engine)
+        for action in actions:
+            self.play(action)
+        return "ok"
+
+    def play(self, action):
+        if len(action) == 6:
+            self.split(action)
+        else:
+            self.move(action)
+
+    def move(self, text):
+        if len(text) not in (4, 5):
+            raise ProtocolError(f"invalid move {text}")
+        move = parse_move(text[:4])
+        if not self.engine.is_legal_move(*move):
+            raise ProtocolError(f"illegal move {text}")
+        choice = None
+        if len(text) == 5:
+            choice = LETTER_PIECES.get(text[4])
+            if choice not in PROMOTIONS:
+                raise ProtocolError(f"cannot promote to {text[4]}")
+            if code_piece(self.engine.board[move[0] * 8 + move[1]]) != PAWN or move[2] not in (0, 7):
+                raise ProtocolError(f"{text[:4]} is not a promotion")
+        self.engine.make_move(*move)
+        # A collapse can leave the pawn on its other square, with nothing to promote
+        if choice and self.engine.promotion_square:
+            self.engine.promote(choice)
+
+    def split(self, text):
+        split = parse_split(text)
+        if not self.engine.is_legal_split(*split):
+            raise ProtocolError(f"illegal split {text}")
+        self.engine.split_move(*split)
+
+    def promote(self, choice):
+        choice = LETTER_PIECES.get(choice, choice)
+        if choice not in PROMOTIONS:
+            raise ProtocolError(f"cannot promote to {choice}")
+        if not self.engine.promotion_square:
+            raise ProtocolError("no promotion pending")
+        self.engine.promote(choice)
+
+    def cmd_move(self, args):
+        self.move(argument(args))
+        return "ok"
+
+    def cmd_split(self, args):
+        self.split(argument(args))
+        return "ok"
+
+    def cmd_promote(self, args):
+        self.promote(argument(args))
+        return "ok"
+
+    def cmd_undo(self, args):
+        if not self.engine.unmake_move():
+            raise ProtocolError("nothing to undo")
+        return "ok"
+
+    def cmd_moves(self, args):
+        if self.engine.promotion_square:
+            return "moves"
+        return ' '.join(['moves'] + [move_name(*move) for move in self.engine.iter_legal_moves()])
+
+    def cmd_splits(self, args):
+        if self.engine.promotion_square:
+            return "splits"
+        return ' '.join(['splits'] + [split_name(*split) for split in self.engine.iter_split_moves()])
+
+    def cmd_quantum(self, args):
+        states = [f"{square_name(*state.positions[0])}{square_name(*state.positions[1])}:"
+                  f"{self.engine.time_left(state):.3f}" for state in self.engine.quantum_states]
+        return ' '.join(['quantum'] + (states or ['-']))
+
+    def cmd_clock(self, args):
+        if self.realtime:
+            raise ProtocolError("the clock runs in real time")
+        seconds = float(argument(args))
+        if not math.isfinite(seconds):
+            raise ProtocolError(f"invalid time {args[0]}")
+        if seconds < 0:
+            raise ProtocolError("the clock only runs forward")
+        self.clock.advance(seconds)
+        self.engine.update_quantum_timers()
+        return "ok"
+
+    def cmd_fen(self, args):
+        return "fen " + to_fen(self.engine)
+
+    def cmd_status(self, args):
+        engine = self.engine
+        status = engine.status()
+        if status == 'king captured':
+            winner = 'white' if engine.bitboards.pieces[WHITE][KING] else 'black'
+        elif status == 'checkmate':
+            winner = 'black' if engine.turn == 'white' else 'white'
+        else:
+            return "status " + status
+        return f"status {status} {winner}"
+
+    def cmd_book(self, args):
+        if self.book is None:
+            raise ProtocolError("no book loaded")
+        entries = [f"{entry.name()}:{entry.count}" for entry in self.book.legal_entries(self.engine)]
+        return ' '.join(['book'] + (entries or ['-']))
+
+    def cmd_go(self, args):
+        options = dict(zip(args[::2], args[1::2]))
+        seconds = int(options['movetime']) / 1000 if 'movetime' in options else None
+        depth = int(options.get('depth', 32))
+        if seconds is None and 'depth' not in options:
+            seconds = 1.0
+        if self.engine.promotion_square:
+            raise ProtocolError("a promotion is pending")
+        result = EnginePlayer(time_budget=seconds, max_depth=depth, book=self.book).choose_move(self.engine)
+        if result is None:
+            return "bestmove none"
+        if result.get('book'):
+            self.send("info book")
+        elif result['score'] is None:
+            # Nothing was searched, e.g. at depth 0
+            self.send(f"info depth {result['depth']} nodes {result['nodes']}")
+        else:
+            self.send(f"info depth {result['depth']} score {result['score']} nodes {result['nodes']}")
+        move = move_name(*result['move'])
+        if result['promotion']:
+            move += PIECE_LETTERS[result['promotion']]
+        return "bestmove " + move
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Quantum chess line protocol on stdin/stdout')
+    parser.add_argument('--realtime', action='store_true', help='run collapse timers on the wall clock')
+    parser.add_argument('--book', help='opening book for "go" (see qchess.book)')
+    args = parser.parse_args(argv)
+    Protocol(sys.stdout, args.realtime, args.book and OpeningBook.open(args.book)).run(sys.stdin)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+# Deadline scheduler for quantum collapse timers
+#
+# Items sit in a heap keyed by absolute deadline on the scheduler's own time
+# line, which follows the clock except while paused. Finding what is due is a
+# look at the top of the heap, so polling it every frame costs nothing when
+# nothing is due. The clock is injectable: simulations pass a ManualClock and
+# fast-forward it between plies.
+
+import heapq
+import itertools
+import time
+
+
+class DeadlineScheduler:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        # Clock time spent paused, and the clock time a pause started at
+        self.paused_for = 0.0
+        self.paused_at = None
+        self.heap = []
+        # item -> its heap entry [deadline, order, item]; cancelled entries
+        # stay in the heap with item set to None until popped or compacted
+        self.entries = {}
+        self.counter = itertools.count()
+
+    def now(self):
+        if self.paused_at is not None:
+            return self.paused_at - self.paused_for
+        return self.clock() - self.paused_for
+
+    def pause(self):
+        if self.paused_at is None:
+            self.paused_at = self.clock()
+
+    def resume(self):
+        if self.paused_at is not None:
+            self.paused_for += self.clock() - self.paused_at
+            self.paused_at = None
+
+    @property
+    def paused(self):
+        return self.paused_at is not None
+
+    def schedule(self, item, deadline):
+        # Items due at the same time come out in the order they were scheduled
+        self.cancel(item)
+        entry = [deadline, next(self.counter), item]
+        self.entries[item] = entry
+        heapq.heappush(self.heap, entry)
+
+    def cancel(self, item):
+        entry = self.entries.pop(item, None)
+        if entry is None:
+            return
+        entry[2] = None
+        if len(self.heap) > 2 * len(self.entries) + 16:
+            self.heap = [entry for entry in self.heap if entry[2] is not None]
+            heapq.heapify(self.heap)
+
+    def clear(self):
+        self.heap = []
+        self.entries = {}
+
+    def peek(self):
+        # The item with the earliest deadline, or None
+        while self.heap and self.heap[0][2] is None:
+            heapq.heappop(self.heap)
+        return self.heap[0][2] if self.heap else None
+
+    def due(self):
+        # Pops the items whose deadline has passed, earliest first
+        now = self.now()
+        items = []
+        while True:
+            item = self.peek()
+            if item is None or self.heap[0][0] > now:
+                return items
+            heapq.heappop(self.heap)
+            del self.entries[item]
+            items.append(item)
+
+    def copy(self, items=None):
+        # A scheduler on the same time line; items maps old items to the
+        # ones that replace them in the copy
+        scheduler = DeadlineScheduler(self.clock)
+        scheduler.paused_for = self.paused_for
+        scheduler.paused_at = self.paused_at
+        for deadline, _, item in sorted(self.heap, key=lambda entry: entry[:2]):
+            if item is not None:
+                scheduler.schedule(items[item] if items else item, deadline)
+        return scheduler
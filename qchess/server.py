@@ -0,0 +1,325 @@
+# asyncio game server
+#
+#   python -m qchess.server --port 8765 --workers 4
+#
+# Clients speak newline-delimited JSON over TCP, one request per line. A
+# request names a "cmd" and, for most commands, a "game"; an "id", if given,
+# is echoed in the reply. Replies carry "ok" and either the result fields or
+# an "error". Squares and moves use algebraic names ("e2e4", splits as
+# "b1a3c3").
+#
+#   new      [fen] [seed]            -> game, fen, turn, status
+#   join     game                    -> fen, turn, status
+#   state    game                    -> fen, turn, status, quantum
+#   moves    game                    -> moves, splits
+#   move     game move [promotion]   -> fen, turn, status
+#   split    game split              -> fen, turn, status
+#   promote  game piece              -> fen, turn, status
+#   undo     game                    -> fen, turn, status
+#   play     game [seconds]          -> move, fen, turn, status
+#   close    game
+#   stats                            -> games, connections, requests, cpu_seconds
+#
+# Every connection that created or joined a game is sent
+# {"event": ..., "game": ...} lines when another connection or a collapse
+# timer changes it. Timers are scheduled with loop.call_at for each game's
+# next deadline instead of being polled. Computer moves ("play") are
+# searched in a process pool from the game's FEN, so a long search never
+# holds up the event loop. The result is applied only if the game has not
+# changed in the meantime. With --book, positions in the opening book are
+# answered from it on the event loop, without a search.
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from qchess.ai import EnginePlayer
+from qchess.book import OpeningBook
+from qchess.engine import ChessEngine, PROMOTIONS
+from qchess.fen import (parse_fen, to_fen, move_name, parse_move, split_name, parse_split,
+                        square_name)
+from qchess.protocol import ProtocolError
+
+# Longest search a client can ask for
+MAX_SEARCH_SECONDS = 10.0
+
+
+def field(request, name, kinds, default=None):
+    # A request field, which must be one of kinds when it is given
+    value = request.get(name, default)
+    if value is not None and (isinstance(value, bool) or not isinstance(value, kinds)):
+        raise ProtocolError(f"Invalid {name} {value!r}")
+    return value
+
+
+def search_position(fen, seconds):
+    # Runs in a worker process
+    result = EnginePlayer(time_budget=seconds).choose_move(parse_fen(fen))
+    return None if result is None else (result['move'], result['promotion'])
+
+
+class ServerGame:
+    def __init__(self, game_id, engine):
+        self.id = game_id
+        self.engine = engine
+        self.subscribers = set()
+        self.timer = None
+        # Bumped on every change, so a search can tell it went stale
+        self.version = 0
+
+    def summary(self):
+        return {'fen': to_fen(self.engine), 'turn': self.engine.turn, 'status': self.engine.status()}
+
+    def changed(self, event, source=None):
+        self.version += 1
+        self.schedule_timer()
+        message = {'event': event, 'game': self.id, **self.summary()}
+        for connection in self.subscribers:
+            if connection is not source:
+                connection.send(message)
+
+    def schedule_timer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        state = self.engine.timers.peek()
+        if state is not None:
+            loop = asyncio.get_running_loop()
+            self.timer = loop.call_at(loop.time() + self.engine.time_left(state), self.expire)
+
+    def expire(self):
+        self.timer = None
+        collapses = self.engine.collapse_counts['timer']
+        self.engine.update_quantum_timers()
+        if self.engine.collapse_counts['timer'] != collapses:
+            self.changed('collapse')
+        else:
+            self.schedule_timer()
+
+    def close(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+
+class Connection:
+    def __init__(self, writer):
+        self.writer = writer
+        self.games = set()
+
+    def send(self, message):
+        self.writer.write(json.dumps(message).encode() + b'\n')
+
+
+class GameServer:
+    def __init__(self, workers=None, book=None):
+        self.games = {}
+        self.book = book
+        self.ids = itertools.count(1)
+        self.pool = ProcessPoolExecutor(workers)
+        self.connections = 0
+        self.requests = 0
+
+    async def handle(self, reader, writer):
+        connection = Connection(writer)
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                connection.send(await self.dispatch(connection, line))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            for game in connection.games:
+                game.subscribers.discard(connection)
+                if not game.subscribers:
+                    self.close_game(game)
+            writer.close()
+
+    async def dispatch(self, connection, line):
+        self.requests += 1
+        request = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ProtocolError("Expected a JSON object")
+            handler = getattr(self, 'cmd_' + str(request.get('cmd')), None)
+            if handler is None:
+                raise ProtocolError(f"Unknown command {request.get('cmd')!r}")
+            reply = {'ok': True, **await handler(connection, request)}
+        except (ProtocolError, ValueError, KeyError, TypeError) as error:
+            reply = {'ok': False, 'error': str(error)}
+        except Exception as error:
+            # A bug in a handler fails the request, not the connection
+            traceback.print_exc()
+            reply = {'ok': False, 'error': f"Internal error: {error!r}"}
+        if isinstance(request, dict) and 'id' in request:
+            reply['id'] = request['id']
+        return reply
+
+    def game(self, request):
+        game = self.games.get(request.get('game'))
+        if game is None:
+            raise ProtocolError(f"No game {request.get('game')!r}")
+        return game
+
+    def playable(self, request):
+        game = self.game(request)
+        if game.engine.status() not in ('playing', 'promotion'):
+            raise ProtocolError("The game is over")
+        return game
+
+    def close_game(self, game):
+        game.close()
+        self.games.pop(game.id, None)
+
+    async def cmd_new(self, connection, request):
+        fen = field(request, 'fen', str)
+        engine = ChessEngine(seed=field(request, 'seed', int), clock=asyncio.get_running_loop().time)
+        if fen:
+            parse_fen(fen, engine)
+        game = ServerGame(next(self.ids), engine)
+        self.games[game.id] = game
+        game.subscribers.add(connection)
+        connection.games.add(game)
+        game.schedule_timer()
+        return {'game': game.id, **game.summary()}
+
+    async def cmd_join(self, connection, request):
+        game = self.game(request)
+        game.subscribers.add(connection)
+        connection.games.add(game)
+        return game.summary()
+
+    async def cmd_state(self, connection, request):
+        game = self.game(request)
+        quantum = [{'squares': [square_name(*pos) for pos in state.positions],
+                    'seconds': round(game.engine.time_left(state), 3)}
+                   for state in game.engine.quantum_states]
+        return {**game.summary(), 'quantum': quantum}
+
+    async def cmd_moves(self, connection, request):
+        engine = self.game(request).engine
+        if engine.promotion_square:
+            return {'moves': [], 'splits': []}
+        return {'moves': [move_name(*move) for move in engine.iter_legal_moves()],
+                'splits': [split_name(*split) for split in engine.iter_split_moves()]}
+
+    async def cmd_move(self, connection, request):
+        game = self.playable(request)
+        move = parse_move(field(request, 'move', str, ''))
+        promotion = field(request, 'promotion', str)
+        # Checked before the move is made, so a bad choice changes nothing
+        if promotion is not None and promotion not in PROMOTIONS:
+            raise ProtocolError(f"Cannot promote to {promotion!r}")
+        if not game.engine.is_legal_move(*move):
+            raise ProtocolError(f"Illegal move {request['move']}")
+        game.engine.make_move(*move)
+        if game.engine.promotion_square and promotion:
+            game.engine.promote(promotion)
+        game.changed('move', connection)
+        return game.summary()
+
+    async def cmd_split(self, connection, request):
+        game = self.playable(request)
+        split = parse_split(field(request, 'split', str, ''))
+        if not game.engine.is_legal_split(*split):
+            raise ProtocolError(f"Illegal split {request['split']}")
+        game.engine.split_move(*split)
+        game.changed('split', connection)
+        return game.summary()
+
+    async def cmd_promote(self, connection, request):
+        game = self.playable(request)
+        if not game.engine.promotion_square:
+            raise ProtocolError("No promotion pending")
+        piece = request.get('piece')
+        if piece not in PROMOTIONS:
+            raise ProtocolError(f"Cannot promote to {piece!r}")
+        game.engine.promote(piece)
+        game.changed('promote', connection)
+        return game.summary()
+
+    async def cmd_undo(self, connection, request):
+        game = self.game(request)
+        if not game.engine.unmake_move():
+            raise ProtocolError("Nothing to undo")
+        game.changed('undo', connection)
+        return game.summary()
+
+    async def cmd_play(self, connection, request):
+        game = self.playable(request)
+        if game.engine.promotion_square:
+            raise ProtocolError("A promotion is pending")
+        seconds = field(request, 'seconds', (int, float), 1.0)
+        if isinstance(seconds, int):
+            # Clamped first, since a very large integer does not fit in a float
+            seconds = min(seconds, MAX_SEARCH_SECONDS)
+        if not (math.isfinite(seconds) and seconds > 0):
+            raise ProtocolError(f"Invalid search time {request.get('seconds')!r}")
+        seconds = min(float(seconds), MAX_SEARCH_SECONDS)
+        result = self.book.best_move(game.engine) if self.book else None
+        if result is None:
+            version = game.version
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.pool, search_position, to_fen(game.engine), seconds)
+            if self.games.get(game.id) is not game or game.version != version:
+                raise ProtocolError("The game changed during the search")
+        if result is None:
+            raise ProtocolError("No legal move")
+        move, promotion = result
+        game.engine.make_move(*move)
+        if game.engine.promotion_square:
+            game.engine.promote(promotion)
+        game.changed('move', connection)
+        return {'move': move_name(*move), **game.summary()}
+
+    async def cmd_close(self, connection, request):
+        game = self.game(request)
+        for subscriber in game.subscribers:
+            subscriber.games.discard(game)
+        self.close_game(game)
+        return {}
+
+    async def cmd_stats(self, connection, request):
+        return {'games': len(self.games), 'connections': self.connections,
+                'requests': self.requests, 'cpu_seconds': time.process_time()}
+
+
+async def serve(host, port, workers=None, book=None):
+    server = GameServer(workers, book)
+    tcp = await asyncio.start_server(server.handle, host, port)
+    host, port = tcp.sockets[0].getsockname()[:2]
+    # The load generator reads the port from this line
+    print(f"listening on {host}:{port}", flush=True)
+    async with tcp:
+        await tcp.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Quantum chess game server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help='0 picks a free port')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='search processes')
+    parser.add_argument('--book', help='opening book to answer "play" from (see qchess.book)')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.book and OpeningBook.open(args.book)))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+# Batch self-play across a process pool
+#
+#   python -m qchess.simulate --games 1000 --white random --black capture -o results.jsonl
+#
+# Every game gets its own seed, derived from --seed and the game number, for
+# both the collapse RNG and the move policies, so any game can be replayed
+# from its result line. Time is simulated: the collapse clock advances
+# --seconds-per-ply after every move. Results are written as JSON lines in
+# completion order while the batch is running. With --log, every game is
+# also appended to a binary game log (see qchess.gamelog) that replays it
+# move for move. With --observe, superpositions that an enemy piece attacks
+# collapse after every ply.
+
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+from contextlib import nullcontext
+from multiprocessing import Pool
+
+from qchess.ai import EnginePlayer
+from qchess.bitboard import WHITE, BLACK, KING
+from qchess.engine import ChessEngine, ManualClock, PROMOTIONS
+from qchess.gamelog import MAGIC, LogWriter
+
+
+def legal_actions(engine, quantum=True):
+    actions = [('move',) + move for move in engine.iter_legal_moves()]
+    if quantum:
+        actions.extend(('split',) + split for split in engine.iter_split_moves())
+    return actions
+
+
+def apply_action(engine, action):
+    if action[0] == 'split':
+        engine.split_move(*action[1:])
+    else:
+        engine.make_move(*action[1:])
+
+
+# Policies take the engine and the game's policy RNG and return an action
+
+def random_policy(engine, rng, split_rate=0.2):
+    if rng.random() < split_rate:
+        splits = list(engine.iter_split_moves())
+        if splits:
+            return ('split',) + rng.choice(splits)
+    return ('move',) + rng.choice(list(engine.iter_legal_moves()))
+
+
+def classical_policy(engine, rng):
+    return random_policy(engine, rng, split_rate=0)
+
+
+def capture_policy(engine, rng):
+    moves = list(engine.iter_legal_moves())
+    captures = [move for move in moves if engine.piece_at(move[2], move[3])]
+    if captures:
+        return ('move',) + rng.choice(captures)
+    return random_policy(engine, rng)
+
+
+def search_policy(engine, rng):
+    # Fixed depth rather than a time budget, so games replay exactly
+    result = EnginePlayer(time_budget=None, max_depth=2).choose_move(engine)
+    return ('move',) + result['move']
+
+
+POLICIES = {
+    'random': random_policy,
+    'classical': classical_policy,
+    'capture': capture_policy,
+    'search': search_policy,
+}
+
+
+def game_seed(seed, game):
+    return seed * 1_000_003 + game
+
+
+def play_game(game, seed=0, white='random', black='random', max_plies=300, seconds_per_ply=5.0, log=False,
+              observe=False):
+    start = time.perf_counter()
+    seed = game_seed(seed, game)
+    clock = ManualClock()
+    engine = ChessEngine(seed=seed, clock=clock)
+    if log:
+        buffer = io.BytesIO()
+        writer = LogWriter(buffer, header=False)
+        writer.start(engine)
+    rng = random.Random(f"{seed}:policy")
+    policies = {'white': POLICIES[white], 'black': POLICIES[black]}
+
+    splits = 0
+    plies = 0
+    winner = None
+    reason = 'move limit'
+    while plies < max_plies:
+        kings = [engine.bitboards.pieces[color][KING] for color in (WHITE, BLACK)]
+        if not all(kings):
+            # A collapse can leave a king in check on the opponent's turn
+            winner = 'white' if kings[WHITE] else 'black'
+            reason = 'king captured'
+            break
+        # Checked here rather than through engine.game_over, since a timer
+        # collapse between turns can take away the last legal move
+        if not engine.has_legal_move():
+            if engine.is_in_check(engine.turn):
+                winner = 'black' if engine.turn == 'white' else 'white'
+                reason = 'checkmate'
+            else:
+                reason = 'stalemate'
+            break
+
+        action = policies[engine.turn](engine, rng)
+        if action[0] == 'split':
+            splits += 1
+        apply_action(engine, action)
+        if engine.promotion_square:
+            engine.promote(rng.choice(PROMOTIONS))
+        plies += 1
+
+        clock.advance(seconds_per_ply)
+        engine.update_quantum_timers()
+        if observe:
+            engine.check_observations()
+
+    result = {
+        'game': game,
+        'seed': seed,
+        'white': white,
+        'black': black,
+        'winner': winner,
+        'reason': reason,
+        'plies': plies,
+        'splits': splits,
+        'collapses': engine.collapse_counts,
+        'unresolved': len(engine.quantum_states),
+        'seconds': round(time.perf_counter() - start, 4),
+    }
+    if log:
+        writer.finish(winner)
+        result['log'] = buffer.getvalue()
+    return result
+
+
+def _play(args):
+    return play_game(*args)
+
+
+def simulate(games, output, seed=0, white='random', black='random', workers=None,
+             max_plies=300, seconds_per_ply=5.0, log=None, observe=False):
+    # log is a binary stream that receives every game's log
+    tasks = ((game, seed, white, black, max_plies, seconds_per_ply, log is not None, observe)
+             for game in range(games))
+    summary = {'games': 0, 'white': 0, 'black': 0, 'draw': 0, 'plies': 0,
+               'collapses': {'move': 0, 'observation': 0, 'timer': 0}}
+    # One worker plays in this process, which also lets qchess.instrument
+    # see the games
+    with Pool(workers) if workers != 1 else nullcontext() as pool:
+        # Games are independent, so small chunks keep every worker busy
+        # until the end of the batch
+        if log is not None:
+            log.write(MAGIC)
+        results = pool.imap_unordered(_play, tasks, chunksize=4) if pool else map(_play, tasks)
+        for result in results:
+            if log is not None:
+                log.write(result.pop('log'))
+            output.write(json.dumps(result) + '\n')
+            summary['games'] += 1
+            summary[result['winner'] or 'draw'] += 1
+            summary['plies'] += result['plies']
+            for trigger, count in result['collapses'].items():
+                summary['collapses'][trigger] += count
+    output.flush()
+    if log is not None:
+        log.flush()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Quantum chess self-play')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--white', choices=sorted(POLICIES), default='random')
+    parser.add_argument('--black', choices=sorted(POLICIES), default='random')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--max-plies', type=int, default=300)
+    parser.add_argument('--seconds-per-ply', type=float, default=5.0)
+    parser.add_argument('-o', '--output', default='-', help='JSON lines file, - for stdout')
+    parser.add_argument('--log', help='binary game log to write every game to')
+    parser.add_argument('--observe', action='store_true',
+                        help='collapse superpositions attacked by an enemy piece after every ply')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    log = open(args.log, 'wb') if args.log else None
+    try:
+        summary = simulate(args.games, output, args.seed, args.white, args.black, args.workers,
+                           args.max_plies, args.seconds_per_ply, log, args.observe)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if log is not None:
+            log.close()
+    elapsed = time.perf_counter() - start
+
+    games = summary['games'] or 1
+    print(f"{summary['games']} games in {elapsed:.1f}s ({summary['games'] / elapsed:.1f} games/s)", file=sys.stderr)
+    print(f"white {summary['white'] / games:.1%}  black {summary['black'] / games:.1%}  "
+          f"draw {summary['draw'] / games:.1%}  average length {summary['plies'] / games:.1f} plies", file=sys.stderr)
+    print("collapses: " + ', '.join(f"{trigger} {count}" for trigger, count in summary['collapses'].items()),
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+# Sparse state-vector backend for superposed and entangled pieces
+#
+#   python -m qchess.statevector --bench
+#
+# The quantum state is a list of branches. Each branch places every tracked
+# piece on a square and carries a complex amplitude. Only branches with a
+# non-zero amplitude are stored: a (branches, pieces) uint8 array of squares
+# and a complex amplitude array, never a dense 2^n vector.
+#
+# A split sends a piece to two squares with amplitudes a and b, where
+# |a|^2 + |b|^2 = 1, and doubles its branches. A move that slides through
+# squares a superposed piece may occupy happens only in the branches where
+# the path is clear, which entangles the mover with the blocker. Branches
+# that end up in the same configuration are merged by adding amplitudes, so
+# paths interfere. Measurement samples by the marginal probability of the
+# measured outcome and keeps the matching branches.
+#
+# Branches whose probability falls under the threshold are pruned, and at
+# most max_branches of the most likely ones are kept, so memory and
+# measurement time stay bounded however many pieces are entangled.
+
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+from qchess.bitboard import BETWEEN, squares
+
+# Square of a captured piece
+CAPTURED = 64
+SPLIT_AMPLITUDES = (1 / np.sqrt(2), 1j / np.sqrt(2))
+
+
+class StateVector:
+    def __init__(self, threshold=1e-9, max_branches=1 << 16):
+        self.threshold = threshold
+        self.max_branches = max_branches
+        self.configs = np.zeros((1, 0), dtype=np.uint8)
+        self.amplitudes = np.ones(1, dtype=np.complex128)
+
+    @property
+    def pieces(self):
+        return self.configs.shape[1]
+
+    @property
+    def branches(self):
+        return len(self.amplitudes)
+
+    def nbytes(self):
+        return self.configs.nbytes + self.amplitudes.nbytes
+
+    def add_piece(self, square):
+        # A piece on one square in every branch; returns its index
+        column = np.full((self.branches, 1), square, dtype=np.uint8)
+        self.configs = np.hstack([self.configs, column])
+        return self.pieces - 1
+
+    def occupied(self, square):
+        # Per branch, whether any piece is on the square
+        return (self.configs == square).any(axis=1)
+
+    def split(self, piece, source, pos1, pos2, amplitudes=SPLIT_AMPLITUDES):
+        # Sends the piece from source to pos1 and pos2 in the branches where
+        # it is on source, which doubles them
+        first, second = amplitudes
+        if not np.isclose(abs(first) ** 2 + abs(second) ** 2, 1):
+            raise ValueError("Split amplitudes must be normalised")
+        splitting = self.configs[:, piece] == source
+        to_first = self.configs[splitting]
+        to_second = to_first.copy()
+        to_first[:, piece] = pos1
+        to_second[:, piece] = pos2
+        amplitudes = self.amplitudes[splitting]
+        self.configs = np.concatenate([self.configs[~splitting], to_first, to_second])
+        self.amplitudes = np.concatenate([self.amplitudes[~splitting], amplitudes * first, amplitudes * second])
+        self.merge()
+
+    def move(self, piece, source, target):
+        # Moves the piece in the branches where it is on source and nothing
+        # blocks the squares between; a piece on target in those branches is
+        # captured
+        path = BETWEEN[source][target]
+        moving = self.configs[:, piece] == source
+        for sq in squares(path):
+            moving &= ~self.occupied(sq)
+        captured = moving[:, None] & (self.configs == target)
+        self.configs[captured] = CAPTURED
+        self.configs[moving, piece] = target
+        self.merge()
+
+    def merge(self):
+        # Adds up branches with the same configuration, then prunes. Rows
+        # are compared as opaque byte strings, much faster than
+        # np.unique(axis=0).
+        rows = np.ascontiguousarray(self.configs).view(np.dtype((np.void, self.pieces)))
+        _, first, inverse = np.unique(rows.reshape(-1), return_index=True, return_inverse=True)
+        if len(first) < self.branches:
+            configs = self.configs[first]
+            amplitudes = (np.bincount(inverse, self.amplitudes.real, len(configs)) +
+                          1j * np.bincount(inverse, self.amplitudes.imag, len(configs)))
+            self.configs, self.amplitudes = configs, amplitudes
+        self.prune()
+
+    def prune(self):
+        probabilities = np.abs(self.amplitudes) ** 2
+        keep = probabilities >= self.threshold
+        if keep.sum() > self.max_branches:
+            keep = np.zeros(self.branches, dtype=bool)
+            keep[np.argpartition(probabilities, -self.max_branches)[-self.max_branches:]] = True
+        if not keep.all():
+            self.configs = self.configs[keep]
+            self.amplitudes = self.amplitudes[keep]
+            self.normalise()
+
+    def normalise(self):
+        self.amplitudes /= np.sqrt((np.abs(self.amplitudes) ** 2).sum())
+
+    def probabilities(self, piece):
+        # Marginal distribution of the piece's square, CAPTURED included
+        weights = np.bincount(self.configs[:, piece], np.abs(self.amplitudes) ** 2, CAPTURED + 1)
+        return {sq: float(weight) for sq, weight in enumerate(weights) if weight > 0}
+
+    def occupancy(self):
+        # Probability that each of the 64 squares is occupied
+        weights = np.abs(self.amplitudes) ** 2
+        occupancy = np.zeros(CAPTURED + 1)
+        for piece in range(self.pieces):
+            occupancy += np.bincount(self.configs[:, piece], weights, CAPTURED + 1)
+        return occupancy[:CAPTURED]
+
+    def measure_square(self, square, rng=random):
+        # Observes whether the square is occupied and returns the outcome
+        occupied = self.occupied(square)
+        probability = (np.abs(self.amplitudes[occupied]) ** 2).sum()
+        outcome = rng.random() < probability
+        self.keep(occupied if outcome else ~occupied)
+        return outcome
+
+    def measure_piece(self, piece, rng=random):
+        # Samples the piece's square from its marginal and returns it
+        outcomes = self.probabilities(piece)
+        cumulative = np.cumsum(list(outcomes.values()))
+        index = min(int(np.searchsorted(cumulative, rng.random() * cumulative[-1], side='right')),
+                    len(outcomes) - 1)
+        square = list(outcomes)[index]
+        self.keep(self.configs[:, piece] == square)
+        return square
+
+    def keep(self, branches):
+        self.configs = self.configs[branches]
+        self.amplitudes = self.amplitudes[branches]
+        self.normalise()
+
+
+def benchmark(qubits, max_branches=1 << 16, seed=0):
+    # Splits one knight per qubit, slides a rook up each file the knights
+    # may have moved into, which entangles it with four of them, then
+    # measures every piece. Returns timings and sizes.
+    rng = random.Random(seed)
+    state = StateVector(max_branches=max_branches)
+    start = time.perf_counter()
+    knights = []
+    for index in range(qubits):
+        # Knights on rows 2-5 of every file, split one step sideways
+        row, col = 2 + index % 4, index // 4 * 2
+        knights.append(state.add_piece(row * 8 + col))
+        state.split(knights[-1], row * 8 + col, row * 8 + col, row * 8 + col + 1)
+    rooks = []
+    for col in range(1, 2 * ((qubits + 3) // 4), 2):
+        rooks.append(state.add_piece(7 * 8 + col))
+        state.move(rooks[-1], 7 * 8 + col, 1 * 8 + col)
+    split_seconds = time.perf_counter() - start
+    branches, nbytes = state.branches, state.nbytes()
+
+    start = time.perf_counter()
+    marginals = [state.probabilities(piece) for piece in knights + rooks]
+    marginal_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for piece in knights + rooks:
+        state.measure_piece(piece, rng)
+    measure_seconds = time.perf_counter() - start
+    return {
+        'qubits': qubits,
+        'branches': branches,
+        'bytes': nbytes,
+        'split_seconds': split_seconds,
+        'marginal_seconds': marginal_seconds,
+        'measure_seconds': measure_seconds,
+        'rook_blocked': marginals[len(knights)].get(7 * 8 + 1, 0.0),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sparse state-vector backend')
+    parser.add_argument('--bench', action='store_true', help='time 4, 8 and 16 entangled qubits')
+    parser.add_argument('--max-branches', type=int, default=1 << 16)
+    args = parser.parse_args(argv)
+    if not args.bench:
+        parser.print_help()
+        return 0
+    for qubits in (4, 8, 16):
+        result = benchmark(qubits, args.max_branches)
+        print(f"{qubits:2d} qubits  {result['branches']:6d} branches  {result['bytes'] / 1024:8.1f} KiB  "
+              f"build {result['split_seconds'] * 1000:7.2f} ms  marginals {result['marginal_seconds'] * 1000:6.2f} ms  "
+              f"measure all {result['measure_seconds'] * 1000:7.2f} ms  "
+              f"P(rook blocked) {result['rook_blocked']:.4f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
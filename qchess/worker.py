@@ -0,0 +1,106 @@
+# Background jobs for the UI
+#
+# A single daemon thread runs jobs one at a time on copies of the engine, so
+# the render loop keeps drawing and ticking quantum timers while a search
+# runs. Submitting a job cancels the one before it. A finished job is handed
+# to the post callback together with its result; the UI turns it into a
+# pygame event and applies it on the main thread, after checking that the
+# position it was computed for is still on the board.
+
+import queue
+import threading
+from collections import OrderedDict
+
+from qchess.bitboard import COLOR_INDEX, squares
+
+
+class Job:
+    def __init__(self, kind, key, run):
+        self.kind = kind
+        # position_key of the engine the job was started from
+        self.key = key
+        self.run = run
+        self.cancelled = threading.Event()
+        self.progress = None
+        self.error = None
+
+    def report(self, progress):
+        self.progress = progress
+
+
+class Worker:
+    def __init__(self, post):
+        self.post = post
+        self.jobs = queue.Queue()
+        # The last submitted job, until it is cancelled
+        self.current = None
+        self.thread = threading.Thread(target=self.loop, name='qchess-worker', daemon=True)
+        self.thread.start()
+
+    def submit(self, kind, key, run):
+        self.cancel()
+        job = Job(kind, key, run)
+        self.current = job
+        self.jobs.put(job)
+        return job
+
+    def cancel(self):
+        if self.current is not None:
+            self.current.cancelled.set()
+            self.current = None
+
+    def stop(self):
+        self.cancel()
+        self.jobs.put(None)
+        self.thread.join()
+
+    def loop(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            if job.cancelled.is_set():
+                continue
+            try:
+                result = job.run(job)
+            except Exception as error:
+                # Reported on the main thread when the result is applied
+                job.error = error
+                result = None
+            if not job.cancelled.is_set():
+                self.post(job, result)
+
+
+def snapshot(engine):
+    # The move cache is shared between copies and is not safe to use from
+    # two threads, so the worker's copy gets its own
+    engine = engine.copy()
+    engine.move_cache = OrderedDict()
+    return engine
+
+
+def analysis_job(engine):
+    # Classical and quantum moves for every piece of the side to move, keyed
+    # by square, so selecting a piece in the UI is a lookup
+    engine = snapshot(engine)
+
+    def run(job):
+        pieces = [divmod(sq, 8) for sq in squares(engine.bitboards.occupied[COLOR_INDEX[engine.turn]])]
+        moves = {}
+        for done, (row, col) in enumerate(pieces):
+            if job.cancelled.is_set():
+                return None
+            moves[(row, col)] = (engine.calculate_moves(row, col), engine.calculate_moves(row, col, True))
+            job.report({'squares': done + 1, 'total': len(pieces)})
+        return moves
+
+    return run
+
+
+def search_job(engine, player):
+    engine = snapshot(engine)
+
+    def run(job):
+        return player.choose_move(engine, stop=job.cancelled, progress=job.report)
+
+    return run
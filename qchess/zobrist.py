@@ -0,0 +1,22 @@
+# Zobrist keys for position hashing
+# Keys come from a fixed seed so hashes agree across processes and runs.
+
+import random
+
+_rng = random.Random(0x5EED_C4E55)
+
+PIECE_KEYS = [[[_rng.getrandbits(64) for _ in range(64)] for _ in range(6)] for _ in range(2)]
+BLACK_TO_MOVE_KEY = _rng.getrandbits(64)
+# [color][0 = kingside, 1 = queenside]
+CASTLING_KEYS = [[_rng.getrandbits(64) for _ in range(2)] for _ in range(2)]
+EN_PASSANT_KEYS = [_rng.getrandbits(64) for _ in range(64)]
+# Superposed pairs are keyed on both squares; the pieces themselves are
+# already hashed through PIECE_KEYS. Timers are not part of the key.
+QUANTUM_PAIR_KEYS = [[0] * 64 for _ in range(64)]
+for _sq1 in range(64):
+    for _sq2 in range(_sq1 + 1, 64):
+        QUANTUM_PAIR_KEYS[_sq1][_sq2] = QUANTUM_PAIR_KEYS[_sq2][_sq1] = _rng.getrandbits(64)
+
+
+def quantum_pair_key(pos1, pos2):
+    return QUANTUM_PAIR_KEYS[pos1[0] * 8 + pos1[1]][pos2[0] * 8 + pos2[1]]
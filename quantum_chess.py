@@ -5,20 +5,30 @@
 # TODO: Only classical moves when king in check
 # TODO: Quantum piece attack quantum piece
 
+import argparse
 import sys
 import time
-import random
-from threading import Timer
+import traceback
 
 from os import environ
 environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
 import pygame
 pygame.init()
 
+from qchess import instrument
+from qchess.ai import EnginePlayer
+from qchess.book import OpeningBook
+from qchess.bitboard import CODE_NAMES, piece_code
+from qchess.engine import ChessEngine, BOARD_SIZE, QUANTUM_DURATION
+from qchess.gamelog import append_log
+from qchess.worker import Worker, analysis_job, search_job
+
 # Constants
 WINDOW_SIZE = 800
-BOARD_SIZE = 8
 SQUARE_SIZE = WINDOW_SIZE // BOARD_SIZE
+FPS = 60
+# Posted by the worker thread when a job finishes
+ENGINE_RESULT = pygame.event.custom_type()
 
 # Colors
 WHITE = (255, 255, 255)
@@ -33,6 +43,12 @@ MENU_BG = (240, 240, 240)
 MESSAGE_BG = (0, 0, 0, 180)
 TIMER_COLOR = (255, 0, 0)
 INSTRUCTION_BG = (0, 0, 0, 220)
+STATS_BG = (0, 0, 0, 170)
+
+# Profiling overlay, shown when qchess.instrument is on
+STATS_RECT = pygame.Rect(0, WINDOW_SIZE - 150, 400, 150)
+STATS_INTERVAL = 0.25
+STATS_ROWS = 6
 
 # Pieces unicodes
 PIECES = {
@@ -53,390 +69,147 @@ PIECES = {
         'pawn': '\u265F'
     }
 }
-
-class QuantumState:
-    def __init__(self, piece_type, color, pos1, pos2):
-        self.piece_type = piece_type
-        self.color = color
-        self.positions = [pos1, pos2]
-        self.timer = 90
-        self.last_update = time.time()
-        
-    def update_timer(self):
-        current_time = time.time()
-        elapsed = current_time - self.last_update
-        self.timer -= elapsed
-        self.last_update = current_time
-        return self.timer <= 0
-
-    def collapse(self, position_index):
-        return self.positions[position_index]
+PIECE_SYMBOLS = {code: PIECES[color][piece] for code, (color, piece) in CODE_NAMES.items()}
+
+INSTRUCTIONS = [
+    "Quantum Chess Instructions:",
+    "",
+    "",
+    "1. Basic Rules:",
+    "   - All standard chess rules apply",
+    "   - Press 'Q' when a piece is selected to enter quantum mode",
+    "   - Only classical moves are allowed when king is in check",
+    "",
+    "2. Quantum Mode:",
+    "   - Pieces can superimpose in two positions simultaneously",
+    "   - Cannot capture pieces to initiate quantum mode",
+    "   - Pawns can make quantum moves only on their first move",
+    "   - King does not enter quantum state",
+    "   - Quantum states collapse after 90 seconds or when observed",
+    "   - Quantum pieces are observed when they attack or are attacked",
+    "",
+    "3. Controls:",
+    "   - Click to select and move pieces",
+    "   - Press 'Q' for quantum moves",
+    "   - Press 'U' to take back a move",
+    "   - Press 'P' to pause the game and its timers",
+    "   - Press 'I' to toggle instructions",
+    "",
+    "",
+    "Press 'I' to close instructions"
+]
 
 
 class ChessGame:
-    def __init__(self):
+    def __init__(self, computer=None, think_time=1.0, log_path=None, book=None):
         self.screen = pygame.display.set_mode((WINDOW_SIZE, WINDOW_SIZE))
         pygame.display.set_caption('Quantum Chess')
         self.font = pygame.font.SysFont('segoeuisymbol', SQUARE_SIZE - 20)
         self.message_font = pygame.font.SysFont('times', 36)
         self.instruction_font = pygame.font.SysFont('arial', 22)
         self.show_instructions = True 
+        self.engine = ChessEngine()
+        # Color played by the engine player, or None for two players
+        self.computer = computer
+        self.player = EnginePlayer(time_budget=think_time, book=book)
+        self.worker = Worker(self.post_result)
+        # The last job that raised, shown in the title while its position is up
+        self.failed_job = None
+        self.frame_clock = pygame.time.Clock()
+        self.caption = None
+        self.render_layers()
+        # What each square showed in the last frame, and which overlays
+        # were up, so draw_board only redraws what changed
+        self.drawn_squares = None
+        self.drawn_overlays = None
+        # Every game is appended to the log file, when there is one
+        self.log_writer = None
+        if log_path:
+            self.log_writer = append_log(log_path)
         self.reset()
 
 
-    def reset(self):
-        self.board = self.create_board()
-        self.active_piece = None
-        self.valid_moves = []
-        self.turn = 'white'
-        self.game_over = False
-        self.promotion_menu_active = False
-        self.promotion_square = None
-        self.game_end_message = None
-        self.king_positions = {'white': (7, 4), 'black': (0, 4)}
-        self.castling_rights = {
-            'white': {'kingside': True, 'queenside': True},
-            'black': {'kingside': True, 'queenside': True}
-        }
-        self.last_move = None
-        self.promotion_menu_pos = None
-        
-        self.quantum_mode = False
-        self.quantum_states = []
-        self.quantum_selection = []
+    def render_layers(self):
+        # Everything that does not change between frames is rendered once
+        self.background = pygame.Surface((WINDOW_SIZE, WINDOW_SIZE))
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                color = WHITE if (row + col) % 2 == 0 else GRAY
+                pygame.draw.rect(self.background, color,
+                               (col * SQUARE_SIZE, row * SQUARE_SIZE, 
+                                SQUARE_SIZE, SQUARE_SIZE))
 
+        self.glyphs = {}
+        for code, symbol in PIECE_SYMBOLS.items():
+            text = self.font.render(symbol, True, BLACK)
+            self.glyphs[code] = (text, text.get_rect(center=(SQUARE_SIZE // 2, SQUARE_SIZE // 2)))
 
-    def create_board(self):
-        board = [[None for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
-        pieces_ = ['rook', 'knight', 'bishop', 'queen', 'king', 'bishop', 'knight', 'rook']
-        
-        for col in range(BOARD_SIZE):
-            board[1][col] = {'piece': 'pawn', 'color': 'black'}
-            board[6][col] = {'piece': 'pawn', 'color': 'white'}
-            board[0][col] = {'piece': pieces_[col], 'color': 'black'}
-            board[7][col] = {'piece': pieces_[col], 'color': 'white'}
-        
-        return board
+        self.tiles = {}
+        for color in (QUANTUM_SQUARE, HIGHLIGHT, MOVE_HIGHLIGHT, QUANTUM_HIGHLIGHT):
+            s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
+            pygame.draw.rect(s, color, s.get_rect())
+            self.tiles[color] = s
 
+        self.shade = pygame.Surface((WINDOW_SIZE, WINDOW_SIZE), pygame.SRCALPHA)
+        self.shade.fill((0, 0, 0, 128))
 
-    def is_quantum_piece(self, row, col):
-        for state in self.quantum_states:
-            if (row, col) in state.positions:
-                return True
-        return False
+        self.instruction_panel = pygame.Surface((WINDOW_SIZE, WINDOW_SIZE), pygame.SRCALPHA)
+        self.instruction_panel.fill(INSTRUCTION_BG)
+        y_offset = 50
+        for line in INSTRUCTIONS:
+            text = self.instruction_font.render(line, True, WHITE)
+            text_rect = text.get_rect(x=50, y=y_offset)
+            self.instruction_panel.blit(text, text_rect)
+            y_offset += 30
 
+        # Game end messages, rendered the first time they are shown
+        self.message_surfaces = {}
 
-    def get_quantum_state(self, row, col):
-        for state in self.quantum_states:
-            if (row, col) in state.positions:
-                return state
-        return None
+        self.stats_font = pygame.font.SysFont('monospace', 15) if instrument.stats else None
+        self.stats_panel = None
+        self.stats_time = 0.0
 
 
-    def calculate_moves(self, row, col, check_castling=True, check_check=False):
-        piece = self.board[row][col]
-        if not piece:
-            return []
+    def reset(self):
+        if self.log_writer and self.log_writer.engine:
+            self.log_writer.finish(self.winner())
+        self.engine.reset()
+        if self.log_writer:
+            self.log_writer.start(self.engine)
+        # (position_key, moves by square) from the last analysis job
+        self.analysis = None
+        self.active_piece = None
+        self.valid_moves = []
+        self.promotion_menu_pos = None
         
-        moves = []
-        color = piece['color']
-        piece_type = piece['piece']
-
-        # Pawn
-        if piece_type == 'pawn':
-            direction = 1 if color == 'black' else -1
-            start_row = 1 if color == 'black' else 6
-
-            # Forward moves
-            if 0 <= row + direction < 8 and not self.board[row + direction][col]:
-                moves.append((row + direction, col))
-                if row == start_row and not self.board[row + 2 * direction][col]:
-                    moves.append((row + 2 * direction, col))
-
-            for col_offset in [-1, 1]:
-                new_col = col + col_offset
-                if 0 <= new_col < 8 and 0 <= row + direction < 8:
-                    target = self.board[row + direction][new_col]
-                    if target and target['color'] != color:
-                        moves.append((row + direction, new_col))
-                    elif (self.last_move and self.board[row][new_col] and 
-                          self.board[row][new_col]['piece'] == 'pawn' and 
-                          self.board[row][new_col]['color'] != color):
-                        last_from_row, last_from_col, last_to_row, last_to_col = self.last_move
-                        if (last_from_row == (1 if color == 'white' else 6) and
-                            last_to_row == row and last_to_col == new_col and
-                            abs(last_from_row - last_to_row) == 2):
-                            moves.append((row + direction, new_col))
-
-        # Knight
-        elif piece_type == 'knight':
-            offsets = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
-                      (1, -2), (1, 2), (2, -1), (2, 1)]
-            for dr, dc in offsets:
-                new_row, new_col = row + dr, col + dc
-                if (0 <= new_row < 8 and 0 <= new_col < 8 and
-                    (not self.board[new_row][new_col] or 
-                     self.board[new_row][new_col]['color'] != color)):
-                    moves.append((new_row, new_col))
-
-        # Bishop/Queen/Rook
-        if piece_type in ['bishop', 'queen', 'rook']:
-            directions = []
-            if piece_type in ['rook', 'queen']:
-                directions.extend([(0, 1), (0, -1), (1, 0), (-1, 0)])
-            if piece_type in ['bishop', 'queen']:
-                directions.extend([(1, 1), (1, -1), (-1, 1), (-1, -1)])
-
-            for dr, dc in directions:
-                new_row, new_col = row + dr, col + dc
-                while 0 <= new_row < 8 and 0 <= new_col < 8:
-                    target = self.board[new_row][new_col]
-                    if not target:
-                        moves.append((new_row, new_col))
-                    else:
-                        if target['color'] != color:
-                            moves.append((new_row, new_col))
-                        break
-                    new_row += dr
-                    new_col += dc
-
-        # King
-        elif piece_type == 'king':
-            offsets = [(0, 1), (0, -1), (1, 0), (-1, 0),
-                      (1, 1), (1, -1), (-1, 1), (-1, -1)]
-            for dr, dc in offsets:
-                new_row, new_col = row + dr, col + dc
-                if (0 <= new_row < 8 and 0 <= new_col < 8 and
-                    (not self.board[new_row][new_col] or 
-                     self.board[new_row][new_col]['color'] != color)):
-                    moves.append((new_row, new_col))
-
-            if check_castling and not check_check and not self.is_in_check(color):
-                if self.castling_rights[color]['kingside']:
-                    if (not self.board[row][5] and not self.board[row][6] and
-                        not self.is_square_attacked(row, 5, color) and
-                        not self.is_square_attacked(row, 6, color)):
-                        moves.append((row, 6))
-                
-                if self.castling_rights[color]['queenside']:
-                    if (not self.board[row][3] and not self.board[row][2] and
-                        not self.board[row][1] and
-                        not self.is_square_attacked(row, 3, color) and
-                        not self.is_square_attacked(row, 2, color)):
-                        moves.append((row, 2))
-
-        if self.quantum_mode:
-            moves = [(r, c) for r, c in moves if not self.board[r][c] and not self.get_quantum_state(r, c)]
-            
-            if piece_type == 'pawn':
-                start_row = 6 if color == 'white' else 1
-                if row != start_row:
-                    moves = []
-
-        if not check_check:
-            legal_moves = []
-            for move_row, move_col in moves:
-                if not self.would_be_in_check(row, col, move_row, move_col):
-                    legal_moves.append((move_row, move_col))
-            return legal_moves
-
-        return moves
-
-
-    def is_square_attacked(self, row, col, defending_color):
-        for r in range(8):
-            for c in range(8):
-                piece = self.board[r][c]
-                if piece and piece['color'] != defending_color:
-                    if (row, col) in self.calculate_moves(r, c, check_castling=False, check_check=True):
-                        return True
-        return False
-
-
-    def would_be_in_check(self, from_row, from_col, to_row, to_col):
-        original_piece = self.board[to_row][to_col]
-        moving_piece = self.board[from_row][from_col]
-        self.board[to_row][to_col] = moving_piece
-        self.board[from_row][from_col] = None
-
-        original_king_pos = None
-        if moving_piece['piece'] == 'king':
-            original_king_pos = self.king_positions[moving_piece['color']]
-            self.king_positions[moving_piece['color']] = (to_row, to_col)
-
-        king_pos = self.king_positions[moving_piece['color']]
-        is_check = self.is_square_attacked(*king_pos, moving_piece['color'])
-
-        self.board[from_row][from_col] = moving_piece
-        self.board[to_row][to_col] = original_piece
-        if original_king_pos:
-            self.king_positions[moving_piece['color']] = original_king_pos
-
-        return is_check
+        self.quantum_mode = False
+        self.quantum_selection = []
 
 
-    def is_in_check(self, color):
-        return self.is_square_attacked(*self.king_positions[color], color)
+    def winner(self):
+        if self.engine.game_over and self.engine.is_in_check(self.engine.turn):
+            return 'black' if self.engine.turn == 'white' else 'white'
+        return None
 
 
     def handle_quantum_selection(self, row, col):
         if len(self.quantum_selection) == 0:
-            if self.board[row][col] is not None:
+            if self.engine.piece_at(row, col):
                 return  
             self.quantum_selection.append((row, col))
             
         elif len(self.quantum_selection) == 1:
-            if self.board[row][col] is not None:
+            if self.engine.piece_at(row, col):
                 return 
             if (row, col) != self.quantum_selection[0]:
                 self.quantum_selection.append((row, col))
-                piece = self.board[self.active_piece[0]][self.active_piece[1]]
-                new_state = QuantumState(
-                    piece['piece'],
-                    piece['color'],
-                    self.quantum_selection[0],
-                    self.quantum_selection[1]
-                )
-                self.quantum_states.append(new_state)
-                
-                self.board[self.quantum_selection[0][0]][self.quantum_selection[0][1]] = piece.copy()
-                self.board[self.quantum_selection[1][0]][self.quantum_selection[1][1]] = piece.copy()
-                if (self.active_piece[0], self.active_piece[1]) not in self.quantum_selection:
-                    self.board[self.active_piece[0]][self.active_piece[1]] = None
+                self.engine.split_move(self.active_piece[0], self.active_piece[1],
+                                       self.quantum_selection[0], self.quantum_selection[1])
                 
                 self.quantum_selection = []
                 self.active_piece = None
                 self.valid_moves = []
                 self.quantum_mode = False
-                self.next_turn()
-
-
-    def check_quantum_collapse(self, row, col):
-        state = self.get_quantum_state(row, col)
-        if not state:
-            return False
-        
-        for r in range(BOARD_SIZE):
-            for c in range(BOARD_SIZE):
-                piece = self.board[r][c]
-                if piece and piece['color'] != state.color:
-                    moves = self.calculate_moves(r, c)
-                    for pos in state.positions:
-                        if pos in moves:
-                            final_pos = state.collapse(random.choice([0, 1]))
-                            other_pos = state.positions[1] if final_pos == state.positions[0] else state.positions[0]
-                            
-                            if pos == final_pos:
-                                self.board[final_pos[0]][final_pos[1]] = None
-                                self.board[other_pos[0]][other_pos[1]] = {
-                                    'piece': state.piece_type,
-                                    'color': state.color
-                                }
-                            else:
-                                self.board[final_pos[0]][final_pos[1]] = {
-                                    'piece': state.piece_type,
-                                    'color': state.color
-                                }
-                                self.board[other_pos[0]][other_pos[1]] = None
-                                
-                            self.quantum_states.remove(state)
-                            return True
-        return False
-
-
-    def make_move(self, from_row, from_col, to_row, to_col):
-        moving_piece = self.board[from_row][from_col]
-        target_piece = self.board[to_row][to_col]
-        
-        quantum_state = self.get_quantum_state(from_row, from_col)
-        if quantum_state:
-            if target_piece is not None or self.get_quantum_state(to_row, to_col):
-                final_pos = quantum_state.collapse(random.choice([0, 1]))
-                other_pos = quantum_state.positions[1] if final_pos == quantum_state.positions[0] else quantum_state.positions[0]
-                
-                self.board[quantum_state.positions[0][0]][quantum_state.positions[0][1]] = None
-                self.board[quantum_state.positions[1][0]][quantum_state.positions[1][1]] = None
-                
-                self.board[final_pos[0]][final_pos[1]] = {
-                    'piece': quantum_state.piece_type,
-                    'color': quantum_state.color
-                }
-                
-                self.quantum_states.remove(quantum_state)
-                
-                if final_pos == (from_row, from_col):
-                    self.board[to_row][to_col] = moving_piece
-                    self.board[from_row][from_col] = None
-            else:
-                other_pos = [pos for pos in quantum_state.positions 
-                            if pos != (from_row, from_col)][0]
-                quantum_state.positions = [(to_row, to_col), other_pos]
-                self.board[to_row][to_col] = moving_piece
-                self.board[from_row][from_col] = None
-            
-            self.next_turn()
-            return
-
-        target_quantum_state = self.get_quantum_state(to_row, to_col)
-        if target_quantum_state:
-            final_pos = target_quantum_state.collapse(random.choice([0, 1]))
-            other_pos = target_quantum_state.positions[1] if final_pos == target_quantum_state.positions[0] else target_quantum_state.positions[0]
-            
-            self.board[target_quantum_state.positions[0][0]][target_quantum_state.positions[0][1]] = None
-            self.board[target_quantum_state.positions[1][0]][target_quantum_state.positions[1][1]] = None
-            
-            self.board[final_pos[0]][final_pos[1]] = {
-                'piece': target_quantum_state.piece_type,
-                'color': target_quantum_state.color
-            }
-            
-            self.quantum_states.remove(target_quantum_state)
-            
-            if final_pos == (to_row, to_col):
-                self.board[to_row][to_col] = moving_piece
-                self.board[from_row][from_col] = None
-
-            self.next_turn()
-            return
-
-        if moving_piece['piece'] == 'pawn' and abs(to_col - from_col) == 1 and not self.board[to_row][to_col]:
-            self.board[from_row][to_col] = None
-
-        if moving_piece['piece'] == 'king' and abs(to_col - from_col) == 2:
-            rook_row = to_row
-            old_rook_col = 7 if to_col > from_col else 0
-            new_rook_col = 5 if to_col > from_col else 3
-            self.board[rook_row][new_rook_col] = self.board[rook_row][old_rook_col]
-            self.board[rook_row][old_rook_col] = None
-
-        if moving_piece['piece'] == 'king':
-            self.king_positions[moving_piece['color']] = (to_row, to_col)
-            self.castling_rights[moving_piece['color']] = {'kingside': False, 'queenside': False}
-        elif moving_piece['piece'] == 'rook':
-            if from_col == 0:
-                self.castling_rights[moving_piece['color']]['queenside'] = False
-            elif from_col == 7:
-                self.castling_rights[moving_piece['color']]['kingside'] = False
-
-        self.board[to_row][to_col] = moving_piece
-        self.board[from_row][from_col] = None
-        self.last_move = (from_row, from_col, to_row, to_col)
-
-        if moving_piece['piece'] == 'pawn' and (to_row == 0 or to_row == 7):
-            self.promotion_menu_active = True
-            self.promotion_square = (to_row, to_col)
-            return
-
-        self.next_turn()
-
-
-    def handle_promotion(self, choice):
-        if self.promotion_square:
-            row, col = self.promotion_square
-            self.board[row][col]['piece'] = choice
-            self.promotion_menu_active = False
-            self.promotion_square = None
-            self.next_turn()
 
 
     def handle_promotion_click(self, x, y):
@@ -445,108 +218,220 @@ class ChessGame:
             choice_index = (y - menu_y) // SQUARE_SIZE
             choices = ['queen', 'rook', 'bishop', 'knight']
             if 0 <= choice_index < len(choices):
-                self.handle_promotion(choices[choice_index])
+                self.engine.promote(choices[choice_index])
 
 
-    def next_turn(self):
-        self.turn = 'black' if self.turn == 'white' else 'white'
-        
-        if not any(self.calculate_moves(r, c) for r in range(8) for c in range(8)
-                  if self.board[r][c] and self.board[r][c]['color'] == self.turn):
-            if self.is_in_check(self.turn):
-                winner = 'black' if self.turn == 'white' else 'white'
-                self.game_end_message = f"{winner.capitalize()} wins by checkmate!"
-            else:
-                self.game_end_message = "Game drawn by stalemate!"
-            self.game_over = True
-
-
-    def update_quantum_timers(self):
-        for state in self.quantum_states[:]:
-            if state.update_timer():
-                final_pos = state.collapse(random.choice([0, 1]))
-                other_pos = state.positions[1] if final_pos == state.positions[0] else state.positions[0]
-                self.board[other_pos[0]][other_pos[1]] = None
-                self.board[final_pos[0]][final_pos[1]] = {
-                    'piece': state.piece_type,
-                    'color': state.color
-                }
-                self.quantum_states.remove(state)
+    def post_result(self, job, result):
+        # Called on the worker thread; pygame.event.post is thread safe
+        pygame.event.post(pygame.event.Event(ENGINE_RESULT, job=job, result=result))
 
 
+    def schedule_work(self):
+        # Keeps one job running for the position on the board: a search on
+        # the computer's turn, otherwise the move analysis for the player
+        if self.engine.game_over or self.engine.promotion_square or self.engine.timers.paused:
+            self.worker.cancel()
+            return
+        kind = 'search' if self.engine.turn == self.computer else 'analysis'
+        key = self.engine.position_key()
+        job = self.worker.current
+        if job and job.kind == kind and job.key == key:
+            return
+        if kind == 'analysis' and self.analysis and self.analysis[0] == key:
+            return
+        if kind == 'search':
+            self.worker.submit(kind, key, search_job(self.engine, self.player))
+        else:
+            self.worker.submit(kind, key, analysis_job(self.engine))
+
+
+    def apply_result(self, job, result):
+        if job.error:
+            # Reported and dropped rather than ending the game; without an
+            # analysis the player's moves are computed here as before
+            print(f"{job.kind} job failed:", file=sys.stderr)
+            traceback.print_exception(job.error)
+            self.failed_job = job
+            return
+        # Results for a position that has since changed, by a move, a take
+        # back or a timer collapse, are dropped and the job runs again
+        if job is not self.worker.current or job.key != self.engine.position_key():
+            return
+        if job.kind == 'analysis':
+            self.analysis = (job.key, result)
+        elif result is not None:
+            self.engine.make_move(*result['move'])
+            if self.engine.promotion_square:
+                self.engine.promote(result['promotion'])
+
+
+    def moves_for(self, row, col):
+        if self.analysis and self.analysis[0] == self.engine.position_key():
+            moves = self.analysis[1].get((row, col))
+            if moves is not None:
+                return moves[self.quantum_mode]
+        return self.engine.calculate_moves(row, col, self.quantum_mode)
+
+
+    def show_progress(self):
+        caption = 'Quantum Chess'
+        job = self.worker.current
+        if self.engine.timers.paused:
+            caption += " - paused"
+        elif self.failed_job and self.failed_job.key == self.engine.position_key():
+            caption += f" - {self.failed_job.kind} failed"
+        elif job and job.kind == 'search':
+            progress = job.progress
+            caption += f" - thinking, depth {progress['depth']}" if progress else " - thinking"
+        if caption != self.caption:
+            pygame.display.set_caption(caption)
+            self.caption = caption
+
+
+    def take_back(self):
+        # Against the computer, take back to the player's own turn
+        if not self.engine.unmake_move():
+            return
+        while self.engine.turn == self.computer and self.engine.unmake_move():
+            pass
+        self.active_piece = None
+        self.valid_moves = []
+        self.quantum_mode = False
+        self.quantum_selection = []
+
+
+    def refresh_selection(self):
+        # Moves are cached per position, so this only recomputes after the
+        # board changed under the selection, e.g. a timer collapse
+        row, col = self.active_piece
+        piece = self.engine.piece_at(row, col)
+        if piece and CODE_NAMES[piece][0] == self.engine.turn:
+            self.valid_moves = self.moves_for(row, col)
+            self.quantum_selection = [pos for pos in self.quantum_selection if pos in self.valid_moves]
+        else:
+            self.active_piece = None
+            self.valid_moves = []
+            self.quantum_mode = False
+            self.quantum_selection = []
+
 
     def draw_board(self):
-        self.screen.fill(WHITE)
-        self.update_quantum_timers()
-        
-        
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                color = WHITE if (row + col) % 2 == 0 else GRAY
-                pygame.draw.rect(self.screen, color,
-                               (col * SQUARE_SIZE, row * SQUARE_SIZE, 
-                                SQUARE_SIZE, SQUARE_SIZE))
-                
-                quantum_state = self.get_quantum_state(row, col)
-                if quantum_state:
-                    s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-                    pygame.draw.rect(s, QUANTUM_SQUARE, s.get_rect())
-                    self.screen.blit(s, (col * SQUARE_SIZE, row * SQUARE_SIZE))
-
-                    timer_width = (quantum_state.timer / 90) * SQUARE_SIZE
-                    pygame.draw.rect(self.screen, TIMER_COLOR,
-                                   (col * SQUARE_SIZE, 
-                                    (row + 1) * SQUARE_SIZE - 5,
-                                    timer_width, 5))
-                
-                piece = self.board[row][col]
-                if piece:
-                    text = self.font.render(PIECES[piece['color']][piece['piece']], True, BLACK)
-                    text_rect = text.get_rect(center=(col * SQUARE_SIZE + SQUARE_SIZE // 2,
-                                                    row * SQUARE_SIZE + SQUARE_SIZE // 2))
-                    self.screen.blit(text, text_rect)
+        self.engine.update_quantum_timers()
+        if self.active_piece:
+            self.refresh_selection()
 
+        highlights = {}
         if self.active_piece:
-            row, col = self.active_piece
-            s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-            pygame.draw.rect(s, HIGHLIGHT, s.get_rect())
-            self.screen.blit(s, (col * SQUARE_SIZE, row * SQUARE_SIZE))
-            
             highlight_color = QUANTUM_HIGHLIGHT if self.quantum_mode else MOVE_HIGHLIGHT
-            for move_row, move_col in self.valid_moves:
-                s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-                pygame.draw.rect(s, highlight_color, s.get_rect())
-                self.screen.blit(s, (move_col * SQUARE_SIZE, move_row * SQUARE_SIZE))
-
-        for row, col in self.quantum_selection:
-            pygame.draw.circle(self.screen, QUANTUM_DOT,
-                             (col * SQUARE_SIZE + SQUARE_SIZE // 2,
-                              row * SQUARE_SIZE + SQUARE_SIZE // 2),
-                             10)
-
-        if self.promotion_menu_active:
-            self.draw_promotion_menu()
-        
-        if self.game_end_message:
-            self.draw_game_end_message()
-            
-        if self.show_instructions:
-            self.draw_instructions()
+            for move in self.valid_moves:
+                highlights[move] = highlight_color
+            highlights[self.active_piece] = HIGHLIGHT
 
-        pygame.display.flip()
+        squares = {}
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                quantum_state = self.engine.get_quantum_state(row, col)
+                timer_width = None
+                if quantum_state:
+                    timer_width = int((self.engine.time_left(quantum_state) / QUANTUM_DURATION) * SQUARE_SIZE)
+                squares[(row, col)] = (self.engine.piece_at(row, col), timer_width,
+                                       highlights.get((row, col)), (row, col) in self.quantum_selection)
+
+        overlays = (self.engine.promotion_square and self.engine.turn,
+                    self.engine.game_end_message, self.show_instructions)
+        if self.drawn_squares is None:
+            changed = list(squares)
+        else:
+            changed = [square for square, key in squares.items() if self.drawn_squares[square] != key]
+
+        # Squares under an overlay need the overlay drawn over them again,
+        # so anything that changes while one is up redraws the whole window
+        if overlays != self.drawn_overlays or (changed and any(overlays)):
+            self.screen.blit(self.background, (0, 0))
+            for square, key in squares.items():
+                self.draw_square(square, key)
+            if self.engine.promotion_square:
+                self.draw_promotion_menu()
+            if self.engine.game_end_message:
+                self.draw_game_end_message()
+            if self.show_instructions:
+                self.draw_instructions()
+            if instrument.stats:
+                self.draw_stats(squares)
+            pygame.display.flip()
+        else:
+            rects = [self.draw_square(square, squares[square]) for square in changed]
+            if instrument.stats and (changed or time.perf_counter() - self.stats_time >= STATS_INTERVAL):
+                rects.append(self.draw_stats(squares))
+            if rects:
+                pygame.display.update(rects)
+
+        self.drawn_squares = squares
+        self.drawn_overlays = overlays
+
+
+    def draw_square(self, square, key):
+        row, col = square
+        piece, timer_width, highlight, selected = key
+        rect = pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+        self.screen.blit(self.background, rect, rect)
+
+        if timer_width is not None:
+            self.screen.blit(self.tiles[QUANTUM_SQUARE], rect)
+            pygame.draw.rect(self.screen, TIMER_COLOR,
+                           (rect.x, rect.bottom - 5, timer_width, 5))
+
+        if piece:
+            text, text_rect = self.glyphs[piece]
+            self.screen.blit(text, text_rect.move(rect.topleft))
+
+        if highlight:
+            self.screen.blit(self.tiles[highlight], rect)
+
+        if selected:
+            pygame.draw.circle(self.screen, QUANTUM_DOT, rect.center, 10)
+        return rect
+
+
+    def draw_stats(self, squares):
+        # The panel is redrawn every frame anything under it changes, and
+        # its text a few times a second
+        now = time.perf_counter()
+        if self.stats_panel is None or now - self.stats_time >= STATS_INTERVAL:
+            self.stats_panel = self.render_stats()
+            self.stats_time = now
+        for row in range(STATS_RECT.top // SQUARE_SIZE, (STATS_RECT.bottom - 1) // SQUARE_SIZE + 1):
+            for col in range(STATS_RECT.left // SQUARE_SIZE, (STATS_RECT.right - 1) // SQUARE_SIZE + 1):
+                self.draw_square((row, col), squares[(row, col)])
+        self.screen.blit(self.stats_panel, STATS_RECT)
+        return STATS_RECT
+
+
+    def render_stats(self):
+        stats = instrument.stats
+        frames = instrument.summarise(stats.frames)
+        turns = instrument.summarise(stats.turns)
+        lines = [f"frame  p50 {frames.get('p50_ms', 0):6.2f} ms  max {frames.get('max_ms', 0):6.2f} ms",
+                 f"turn   p50 {turns.get('p50_ms', 0):6.2f} ms  max {turns.get('max_ms', 0):6.2f} ms"]
+        for name, calls, seconds in stats.top(STATS_ROWS):
+            lines.append(f"{name.split('.')[-1][:22]:22} {calls:7d} {seconds * 1000:8.1f} ms")
+
+        panel = pygame.Surface(STATS_RECT.size, pygame.SRCALPHA)
+        panel.fill(STATS_BG)
+        for index, line in enumerate(lines):
+            panel.blit(self.stats_font.render(line, True, WHITE), (8, 6 + index * 17))
+        return panel
 
 
     def draw_promotion_menu(self):
-        if not self.promotion_square:
+        if not self.engine.promotion_square:
             return
             
-        row, col = self.promotion_square
+        row, col = self.engine.promotion_square
         pieces = ['queen', 'rook', 'bishop', 'knight']
         menu_height = SQUARE_SIZE * len(pieces)
         
-        overlay = pygame.Surface((WINDOW_SIZE, WINDOW_SIZE), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 128))
-        self.screen.blit(overlay, (0, 0))
+        self.screen.blit(self.shade, (0, 0))
         
         menu_x = min(col * SQUARE_SIZE, WINDOW_SIZE - SQUARE_SIZE)
         menu_y = SQUARE_SIZE if row == 0 else max(0, WINDOW_SIZE - menu_height - SQUARE_SIZE)
@@ -558,67 +443,31 @@ class ChessGame:
                         (menu_x, menu_y, SQUARE_SIZE, menu_height), 2)
         
         for i, piece in enumerate(pieces):
-            text = self.font.render(PIECES[self.turn][piece], True, BLACK)
-            text_rect = text.get_rect(center=(menu_x + SQUARE_SIZE // 2,
-                                            menu_y + SQUARE_SIZE // 2 + i * SQUARE_SIZE))
-            self.screen.blit(text, text_rect)
+            text, text_rect = self.glyphs[piece_code(self.engine.turn, piece)]
+            self.screen.blit(text, text_rect.move(menu_x, menu_y + i * SQUARE_SIZE))
             
             pygame.draw.rect(self.screen, BLACK,
                            (menu_x, menu_y + i * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE), 1)
 
 
     def draw_game_end_message(self):
-        overlay = pygame.Surface((WINDOW_SIZE, WINDOW_SIZE), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 128))
-        self.screen.blit(overlay, (0, 0))
+        self.screen.blit(self.shade, (0, 0))
         
-        message_surf = pygame.Surface((400, 100), pygame.SRCALPHA)
-        message_surf.fill(MESSAGE_BG)
-        text = self.message_font.render(self.game_end_message, True, WHITE)
-        text_rect = text.get_rect(center=(200, 50))
-        message_surf.blit(text, text_rect)
+        message = self.engine.game_end_message
+        message_surf = self.message_surfaces.get(message)
+        if message_surf is None:
+            message_surf = pygame.Surface((400, 100), pygame.SRCALPHA)
+            message_surf.fill(MESSAGE_BG)
+            text = self.message_font.render(message, True, WHITE)
+            text_rect = text.get_rect(center=(200, 50))
+            message_surf.blit(text, text_rect)
+            self.message_surfaces[message] = message_surf
         message_rect = message_surf.get_rect(center=(WINDOW_SIZE // 2, WINDOW_SIZE // 2))
         self.screen.blit(message_surf, message_rect)
 
 
     def draw_instructions(self):
-        overlay = pygame.Surface((WINDOW_SIZE, WINDOW_SIZE), pygame.SRCALPHA)
-        overlay.fill(INSTRUCTION_BG)
-        self.screen.blit(overlay, (0, 0))
-        
-        instructions = [
-            "Quantum Chess Instructions:",
-            "",
-            "",
-            "1. Basic Rules:",
-            "   - All standard chess rules apply",
-            "   - Press 'Q' when a piece is selected to enter quantum mode",
-            "   - Only classical moves are allowed when king is in check",
-            "",
-            "2. Quantum Mode:",
-            "   - Pieces can superimpose in two positions simultaneously",
-            "   - Cannot capture pieces to initiate quantum mode",
-            "   - Pawns can make quantum moves only on their first move",
-            "   - King does not enter quantum state",
-            "   - Quantum states collapse after 90 seconds or when observed",
-            "   - Quantum pieces are observed when they attack or are attacked",  
-            "",
-            "3. Controls:",
-            "   - Click to select and move pieces",
-            "   - Press 'Q' for quantum moves",
-            "   - Press 'I' to toggle instructions",
-            "",
-            "",
-            "Press 'I' to close instructions"
-        ]
-        
-        y_offset = 50
-        for line in instructions:
-            text = self.instruction_font.render(line, True, WHITE)
-            text_rect = text.get_rect(x=50, y=y_offset)
-            self.screen.blit(text, text_rect)
-            y_offset += 30
-
+        self.screen.blit(self.instruction_panel, (0, 0))
 
 
     def run(self):
@@ -630,27 +479,45 @@ class ChessGame:
                 if event.type == pygame.QUIT:
                     running = False
                     continue
+
+                if event.type == pygame.WINDOWEXPOSED:
+                    self.drawn_overlays = None
+                    continue
+
+                if event.type == ENGINE_RESULT:
+                    self.apply_result(event.job, event.result)
+                    continue
                 
-                if not self.game_over:
+                if not self.engine.game_over:
                     if event.type == pygame.KEYDOWN:
                         if event.key == pygame.K_q:
                             if self.active_piece:
                                 row, col = self.active_piece
-                                piece = self.board[row][col]
-                                if piece and piece['piece'] != 'king':
+                                piece = self.engine.piece_at(row, col)
+                                if piece and CODE_NAMES[piece][1] != 'king':
                                     self.quantum_mode = not self.quantum_mode
                                     self.quantum_selection = []
-                                    self.valid_moves = self.calculate_moves(row, col)
+                                    self.valid_moves = self.moves_for(row, col)
                         
                         elif event.key == pygame.K_i:
                             self.show_instructions = not self.show_instructions
+
+                        elif event.key == pygame.K_u:
+                            self.take_back()
+
+                        elif event.key == pygame.K_p:
+                            if self.engine.timers.paused:
+                                self.engine.timers.resume()
+                            else:
+                                self.engine.timers.pause()
                     
-                    elif event.type == pygame.MOUSEBUTTONDOWN:
+                    elif (event.type == pygame.MOUSEBUTTONDOWN and self.engine.turn != self.computer
+                          and not self.engine.timers.paused):
                         x, y = event.pos
                         col = x // SQUARE_SIZE
                         row = y // SQUARE_SIZE
                         
-                        if self.promotion_menu_active:
+                        if self.engine.promotion_square:
                             self.handle_promotion_click(x, y)
                             continue
 
@@ -661,28 +528,31 @@ class ChessGame:
 
                         if self.active_piece:
                             if (row, col) in self.valid_moves:
-                                self.make_move(self.active_piece[0], 
+                                self.engine.make_move(self.active_piece[0], 
                                             self.active_piece[1], row, col)
                                 self.active_piece = None
                                 self.valid_moves = []
                                 self.quantum_mode = False
                             else:
-                                piece = self.board[row][col]
-                                if piece and piece['color'] == self.turn:
+                                piece = self.engine.piece_at(row, col)
+                                if piece and CODE_NAMES[piece][0] == self.engine.turn:
                                     self.active_piece = (row, col)
-                                    self.valid_moves = self.calculate_moves(row, col)
+                                    self.valid_moves = self.moves_for(row, col)
                                     self.quantum_mode = False
                                 else:
                                     self.active_piece = None
                                     self.valid_moves = []
                                     self.quantum_mode = False
                         else:
-                            piece = self.board[row][col]
-                            if piece and piece['color'] == self.turn:
+                            piece = self.engine.piece_at(row, col)
+                            if piece and CODE_NAMES[piece][0] == self.engine.turn:
                                 self.active_piece = (row, col)
-                                self.valid_moves = self.calculate_moves(row, col)
+                                self.valid_moves = self.moves_for(row, col)
+
+            self.schedule_work()
+            self.show_progress()
 
-            if self.game_over:
+            if self.engine.game_over:
                 if game_over_timestamp is None:
                     game_over_timestamp = time.time()
                 elif time.time() - game_over_timestamp >= 5:
@@ -690,11 +560,28 @@ class ChessGame:
                     game_over_timestamp = None
             
             self.draw_board()
+            self.frame_clock.tick(FPS)
 
+        self.worker.stop()
+        if self.log_writer:
+            self.log_writer.finish(self.winner())
+            self.log_writer.stream.close()
         pygame.quit()
         sys.exit()
 
 
 if __name__ == "__main__":
-    game = ChessGame()
+    parser = argparse.ArgumentParser(description='Quantum Chess')
+    parser.add_argument('--computer', choices=['white', 'black'], help='color played by the computer')
+    parser.add_argument('--think', type=float, default=1.0, help='computer thinking time per move in seconds')
+    parser.add_argument('--log', help='binary game log to append every game to')
+    parser.add_argument('--book', help='opening book for the computer player (see qchess.book)')
+    parser.add_argument('--profile', nargs='?', const='', metavar='PATH',
+                        help='show hot-path counters; write them at exit to PATH (.json or .prof)')
+    args = parser.parse_args()
+    if args.profile is not None:
+        instrument.enable(args.profile or None)
+    if instrument.stats:
+        instrument.wrap(ChessGame, 'draw_board', instrument.stats.frames)
+    game = ChessGame(args.computer, args.think, args.log, args.book and OpeningBook.open(args.book))
     game.run()
\ No newline at end of file
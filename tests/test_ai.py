@@ -0,0 +1,29 @@
+from qchess.ai import EnginePlayer
+from qchess.fen import parse_fen
+
+
+def choose(fen, depth):
+    return EnginePlayer(time_budget=None, max_depth=depth).choose_move(parse_fen(fen))
+
+
+def test_finds_mate_in_one():
+    result = choose('6k1/5ppp/8/8/8/8/8/R5K1 w - -', 3)
+    assert result['move'] == (7, 0, 0, 0) and result['score'] > 0
+
+
+def test_takes_a_hanging_queen():
+    assert choose('4k3/8/8/3q4/8/8/3R4/4K3 w - -', 2)['move'] == (6, 3, 3, 3)
+
+
+def test_promotion_choice_is_returned():
+    result = choose('7k/4P3/8/8/8/8/8/K7 w - -', 2)
+    assert result['move'] == (1, 4, 0, 4) and result['promotion'] == 'queen'
+
+
+def test_depth_zero_has_no_score():
+    result = choose('7k/8/8/8/8/8/8/K7 w - -', 0)
+    assert result['depth'] == 0 and result['score'] is None and result['nodes'] == 0
+
+
+def test_no_legal_move():
+    assert choose('7k/5Q2/6K1/8/8/8/8/8 b - -', 2) is None
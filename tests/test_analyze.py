@@ -0,0 +1,34 @@
+import io
+import json
+
+from qchess.analyze import analyze
+from qchess.fen import START_FEN
+
+POSITIONS = f"""# comment
+{START_FEN}
+
+4k3/8/8/4b3/8/N1N5/8/4K3 w - - a3c3:30
+not a position
+7k/5Q2/6K1/8/8/8/8/8 b - -
+"""
+
+
+def run(workers, chunk_size):
+    output = io.StringIO()
+    summary = analyze(io.StringIO(POSITIONS), output, workers=workers, chunk_size=chunk_size, window=1)
+    return summary, [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_annotations_in_input_order():
+    (positions, errors), results = run(1, 2)
+    assert (positions, errors) == (4, 1)
+    assert [result['line'] for result in results] == [2, 4, 5, 6]
+    start, observed, bad, stalemate = results
+    assert start['moves'] == 20 and start['status'] == 'playing' and not start['check']
+    assert observed['quantum'] == [{'squares': 'a3c3', 'seconds': 30.0, 'observed': 'c3'}]
+    assert 'error' in bad
+    assert stalemate['status'] == 'stalemate' and stalemate['moves'] == 0
+
+
+def test_pool_gives_the_same_results():
+    assert run(2, 1) == run(1, 3)
@@ -0,0 +1,48 @@
+import numpy as np
+
+from qchess.batch import BatchBoard
+from qchess.engine import ChessEngine
+from qchess.fen import parse_fen
+
+
+def batch_moves(engine):
+    batch = BatchBoard(1, seed=0)
+    batch.load(engine)
+    from_sq, to_sq = np.nonzero(batch.moves(np.arange(1))[0])
+    return {(*divmod(int(a), 8), *divmod(int(b), 8)) for a, b in zip(from_sq, to_sq)}
+
+
+def test_split_after_double_push_has_no_en_passant():
+    engine = ChessEngine(seed=0)
+    engine.make_move(6, 4, 4, 4)                 # e2-e4
+    engine.split_move(0, 1, (2, 0), (2, 2))      # knight b8 to a6 and c6
+    moves = batch_moves(engine)
+    # d2 must not take its own pawn en passant on e3
+    assert (6, 3, 5, 4) not in moves
+    assert moves == set(engine.iter_legal_moves())
+
+
+def test_double_push_gives_en_passant():
+    engine = ChessEngine(seed=0)
+    for move in ((6, 4, 4, 4), (1, 0, 2, 0), (4, 4, 3, 4), (1, 3, 3, 3)):
+        engine.make_move(*move)
+    moves = batch_moves(engine)
+    assert (3, 4, 2, 3) in moves
+    assert moves == set(engine.iter_legal_moves())
+
+
+def test_castling_with_a_superposed_rook():
+    for fen, castle in (('4k3/8/8/8/8/8/7R/4K2R w K - h1h2', (7, 4, 7, 6)),
+                        ('4k3/8/8/8/8/8/R7/R3K3 w Q - a1a2', (7, 4, 7, 2)),
+                        ('r3k3/r7/8/8/8/8/8/4K3 b q - a8a7', (0, 4, 0, 2))):
+        engine = parse_fen(fen)
+        moves = batch_moves(engine)
+        assert castle in moves
+        assert moves == set(engine.iter_legal_moves())
+        batch = BatchBoard(1, seed=0)
+        batch.load(engine)
+        batch.make_moves([0], [castle[0] * 8 + castle[1]], [castle[2] * 8 + castle[3]])
+        engine.make_move(*castle)
+        assert batch.to_engine(0).position_key() == engine.position_key()
+        assert [state.positions for state in batch.to_engine(0).quantum_states] == \
+            [state.positions for state in engine.quantum_states]
@@ -0,0 +1,59 @@
+import io
+
+from qchess.book import OpeningBook, build, main
+from qchess.engine import ChessEngine
+from qchess.gamelog import MAGIC, LogWriter
+from qchess.simulate import play_game
+
+
+def write_log(path, games):
+    data = MAGIC + b''.join(play_game(game, max_plies=12, log=True)['log'] for game in range(games))
+    path.write_bytes(data)
+
+
+def test_build_and_probe(tmp_path, capsys):
+    log = tmp_path / 'games.qlog'
+    write_log(log, 30)
+    output = io.BytesIO()
+    records = build([log], output, plies=4)
+    book = OpeningBook(output.getvalue())
+    assert book.size == records and book.plies == 4 and book.games == 30
+
+    engine = ChessEngine()
+    entries = book.entries(engine.position_key())
+    # Every game starts from the same position, so its first ply is in the book
+    assert sum(entry.count for entry in entries) == 30
+    assert [entry.count for entry in entries] == sorted((entry.count for entry in entries), reverse=True)
+    assert all(entry.is_legal(engine) for entry in entries)
+    move, promotion = book.best_move(engine)
+    assert engine.is_legal_move(*move) and promotion is None
+
+    path = tmp_path / 'opening.qbook'
+    path.write_bytes(output.getvalue())
+    assert main(['probe', str(path)]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == len(entries)
+
+
+def test_undone_moves_are_not_counted(tmp_path):
+    stream = io.BytesIO()
+    writer = LogWriter(stream)
+    engine = ChessEngine(seed=0)
+    writer.start(engine)
+    engine.make_move(6, 4, 4, 4)
+    engine.unmake_move()
+    engine.make_move(6, 3, 4, 3)
+    writer.finish()
+    log = tmp_path / 'undo.qlog'
+    log.write_bytes(stream.getvalue())
+    output = io.BytesIO()
+    build([log], output)
+    entries = OpeningBook(output.getvalue()).entries(ChessEngine().position_key())
+    assert [(entry.name(), entry.count) for entry in entries] == [('d2d4', 1)]
+
+
+def test_unknown_position_has_no_entries():
+    output = io.BytesIO()
+    build([], output)
+    book = OpeningBook(output.getvalue())
+    assert book.legal_entries(ChessEngine()) == [] and book.best_move(ChessEngine()) is None
@@ -0,0 +1,29 @@
+import io
+
+import pytest
+
+from qchess.engine import ChessEngine, ManualClock
+from qchess.gamelog import LogWriter, append_log, read_games, replay
+from qchess.simulate import game_seed
+
+
+@pytest.mark.parametrize('seed', [0, 1, -1, -2 ** 63, 2 ** 63, 2 ** 64 + 5, -3 ** 50, game_seed(-1, 7)])
+def test_seeds_round_trip(seed):
+    stream = io.BytesIO()
+    writer = LogWriter(stream)
+    engine = ChessEngine(seed=seed, clock=ManualClock())
+    writer.start(engine)
+    engine.make_move(6, 4, 4, 4)
+    engine.split_move(0, 1, (2, 0), (2, 2))
+    writer.finish('white')
+    (game,) = read_games(stream.getvalue())
+    assert game.seed == seed
+    assert game.winner == 'white'
+    assert replay(game).position_key() == engine.position_key()
+
+
+def test_append_log_refuses_other_files(tmp_path):
+    path = tmp_path / 'old.qlog'
+    path.write_bytes(b'QCL1' + bytes(9))
+    with pytest.raises(ValueError):
+        append_log(path)
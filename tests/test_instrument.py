@@ -0,0 +1,35 @@
+import json
+import os
+import subprocess
+import sys
+
+from qchess import instrument
+from qchess.engine import ChessEngine
+
+
+def test_disabled_by_default():
+    # Importing qchess without QCHESS_PROFILE must leave the hot methods alone
+    if os.environ.get(instrument.ENV, '0') != '0':
+        return
+    assert instrument.stats is None
+    assert not hasattr(ChessEngine.calculate_moves, '__wrapped__')
+
+
+def test_profile_written_at_exit(tmp_path):
+    path = tmp_path / 'stats.json'
+    environment = dict(os.environ, QCHESS_PROFILE=str(path))
+    subprocess.run([sys.executable, '-m', 'qchess.simulate', '--games', '2', '--workers', '1',
+                    '--max-plies', '20', '-o', os.devnull],
+                   env=environment, check=True, capture_output=True, timeout=120)
+    summary = json.loads(path.read_text())
+    counters = summary['counters']
+    assert counters['ChessEngine.make_move']['calls'] > 0
+    assert counters['Bitboards.legal_targets']['calls'] > 0
+    assert summary['turns']['count'] > 0
+
+
+def test_summarise():
+    assert instrument.summarise([]) == {'count': 0}
+    summary = instrument.summarise([0.003, 0.001, 0.002])
+    assert summary['count'] == 3
+    assert summary['p50_ms'] == 2.0 and summary['max_ms'] == 3.0
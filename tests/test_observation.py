@@ -0,0 +1,50 @@
+import random
+
+from qchess.bitboard import Bitboards, code_color
+from qchess.engine import ChessEngine, ManualClock
+from qchess.fen import parse_fen
+from qchess.simulate import apply_action, random_policy
+
+
+def scanned_states(engine):
+    # Every superposition with a half an enemy piece attacks, from fresh
+    # bitboards rather than the incrementally kept attack maps
+    bitboards = Bitboards.from_board(engine.board)
+    observed = []
+    for state in engine.quantum_states:
+        enemy = code_color(state.piece) ^ 1
+        if any(engine.board[row * 8 + col] == state.piece and bitboards.attackers_to(row * 8 + col, enemy)
+               for row, col in state.positions):
+            observed.append(state)
+    return observed
+
+
+def test_observed_states_match_a_full_scan():
+    observed = 0
+    for seed in range(10):
+        clock = ManualClock()
+        engine = ChessEngine(seed=seed, clock=clock)
+        rng = random.Random(seed)
+        for _ in range(100):
+            if not engine.has_legal_move() or not all(engine.bitboards.pieces[color][5] for color in (0, 1)):
+                break
+            apply_action(engine, random_policy(engine, rng, split_rate=0.5))
+            if engine.promotion_square:
+                engine.promote('queen')
+            clock.advance(5)
+            engine.update_quantum_timers()
+            assert engine.observed_states() == scanned_states(engine)
+            observed += len(engine.observed_states())
+    assert observed
+
+
+def test_check_observations_collapses_attacked_superpositions():
+    # The bishop on e5 attacks the c3 half of the knight
+    engine = parse_fen('4k3/8/8/4b3/8/N1N5/8/4K3 w - - a3c3:90', ChessEngine(seed=0, clock=ManualClock()))
+    assert engine.check_observations() == 1
+    assert engine.collapse_counts['observation'] == 1
+    assert not engine.quantum_states
+    # The observed half turns out empty
+    assert engine.piece_at(5, 2) == 0 and engine.piece_at(5, 0)
+    assert engine.check_observations() == 0
+
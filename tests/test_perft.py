@@ -0,0 +1,24 @@
+import pytest
+
+from qchess.fen import parse_fen
+from qchess.perft import SUITE, divide, perft
+
+
+@pytest.mark.parametrize('name, fen, counts', [case for case in SUITE if case[2]], ids=lambda value: str(value))
+def test_suite_counts(name, fen, counts):
+    for depth, expected in enumerate(counts[:3], 1):
+        assert perft(parse_fen(fen), depth) == expected
+
+
+@pytest.mark.parametrize('name, fen, counts', SUITE)
+def test_moves_match_the_reference_generator(name, fen, counts):
+    # validate raises if any node disagrees with the slow reference generator
+    perft(parse_fen(fen), 2, validate=True)
+
+
+def test_quantum_divide_adds_up():
+    engine = parse_fen(SUITE[-1][1])
+    results = divide(engine, 2, quantum=True)
+    assert sum(nodes for _, nodes in results) == perft(engine, 2, quantum=True)
+    # Splits and collapse outcomes add branches to the classical tree
+    assert len(results) > len(divide(engine, 2))
@@ -0,0 +1,53 @@
+import io
+
+from qchess.protocol import Protocol
+
+
+def run(commands, seed=7):
+    output = io.StringIO()
+    Protocol(output).run([f'newgame {seed}'] + commands.strip().splitlines())
+    return output.getvalue().splitlines()[1:]
+
+
+def test_handshake_and_positions():
+    assert run('qci\nisready') == ['id name Quantum Chess', 'qciok', 'readyok']
+    lines = run('position startpos moves e2e4 e7e5 b1a3c3\nfen\nquantum')
+    assert lines[0] == 'ok'
+    assert lines[1] == 'fen rnbqkbnr/pppp1ppp/8/4p3/4P3/N1N5/PPPP1PPP/R1BQKBNR b KQkq - a3c3:90.0'
+    assert lines[2] == 'quantum a3c3:90.000'
+
+
+def test_moves_splits_and_undo():
+    lines = run('moves\nsplits\nmove e2e4\nundo\nundo\nmove e2e5\nsplit e1e2e3')
+    moves, splits = lines[0].split()[1:], lines[1].split()[1:]
+    assert len(moves) == 20 and 'g1f3' in moves
+    assert 'b1a3c3' in splits and all(len(split) == 6 for split in splits)
+    assert lines[2:] == ['ok', 'ok', 'error nothing to undo', 'error illegal move e2e5', 'error illegal split e1e2e3']
+
+
+def test_clock_collapses_and_rejects_bad_times():
+    lines = run('split g1f3h3\nclock nan\nclock inf\nclock -1\nclock 89\nquantum\nclock 1\nquantum')
+    assert lines[:5] == ['ok', 'error invalid time nan', 'error invalid time inf',
+                         'error the clock only runs forward', 'ok']
+    assert lines[5] == 'quantum f3h3:1.000'
+    assert lines[6].startswith('collapse timer f3 h3 ') and lines[7:] == ['ok', 'quantum -']
+
+
+def test_promotion_and_status():
+    fen = 'position fen 7k/4P3/8/8/8/8/8/4K3 w - -'
+    assert run(f'{fen}\nmove e7e8x\nmove e7e8n\nfen\nstatus') == [
+        'ok', 'error cannot promote to x', 'ok', 'fen 4N2k/8/8/8/8/8/8/4K3 b - -', 'status playing']
+    assert run(f'{fen}\nmove e7e8\nstatus\npromote z\npromote q\nstatus') == [
+        'ok', 'ok', 'status promotion', 'error cannot promote to z', 'ok', 'status playing']
+    assert run('position fen 7k/5Q2/6K1/8/8/8/8/8 b - -\nstatus') == ['ok', 'status stalemate']
+
+
+def test_go_without_a_score():
+    lines = run('go depth 0')
+    assert lines[0] == 'info depth 0 nodes 0' and lines[1].startswith('bestmove ')
+
+
+def test_go_and_errors():
+    lines = run('go depth 1\nbook\nbogus\nmove')
+    assert lines[0].startswith('info depth 1 score ') and lines[1].startswith('bestmove ')
+    assert lines[2:] == ['error no book loaded', 'error unknown command bogus', 'error expected one argument']
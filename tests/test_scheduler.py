@@ -0,0 +1,68 @@
+from qchess.engine import ChessEngine, ManualClock
+from qchess.scheduler import DeadlineScheduler
+
+
+def test_due_items_come_out_by_deadline_then_schedule_order():
+    clock = ManualClock()
+    timers = DeadlineScheduler(clock)
+    for item, deadline in (('c', 3), ('a', 1), ('b', 2), ('b2', 2), ('d', 9)):
+        timers.schedule(item, deadline)
+    assert timers.due() == []
+    assert timers.peek() == 'a'
+    clock.advance(2)
+    assert timers.due() == ['a', 'b', 'b2']
+    clock.advance(5)
+    assert timers.due() == ['c']
+    assert timers.peek() == 'd'
+
+
+def test_cancel_and_reschedule():
+    clock = ManualClock()
+    timers = DeadlineScheduler(clock)
+    timers.schedule('a', 1)
+    timers.schedule('b', 2)
+    timers.cancel('a')
+    timers.cancel('missing')
+    assert timers.peek() == 'b'
+    timers.schedule('b', 5)
+    clock.advance(3)
+    assert timers.due() == []
+    # Cancelled entries are compacted away
+    for index in range(100):
+        timers.schedule(index, 10)
+        timers.cancel(index)
+    assert len(timers.heap) < 40
+    clock.advance(2)
+    assert timers.due() == ['b']
+
+
+def test_pause_stops_the_time_line():
+    clock = ManualClock()
+    timers = DeadlineScheduler(clock)
+    timers.schedule('a', 10)
+    clock.advance(4)
+    timers.pause()
+    assert timers.paused
+    clock.advance(100)
+    assert timers.now() == 4 and timers.due() == []
+    timers.resume()
+    clock.advance(5)
+    assert timers.due() == []
+    clock.advance(1)
+    assert timers.due() == ['a']
+
+
+def test_engine_timers_pause_with_the_scheduler():
+    clock = ManualClock()
+    engine = ChessEngine(seed=0, clock=clock)
+    engine.split_move(7, 6, (5, 5), (5, 7))
+    state = engine.quantum_states[0]
+    left = engine.time_left(state)
+    engine.timers.pause()
+    clock.advance(left + 10)
+    engine.update_quantum_timers()
+    assert engine.quantum_states and engine.time_left(state) == left
+    engine.timers.resume()
+    clock.advance(left)
+    engine.update_quantum_timers()
+    assert not engine.quantum_states
@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+from qchess.server import GameServer
+
+
+class FaultyServer(GameServer):
+    async def cmd_fail(self, connection, request):
+        raise RuntimeError('boom')
+
+
+async def exchange(lines, server_class=GameServer):
+    server = server_class(workers=1)
+    tcp = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+    port = tcp.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    replies = []
+    for line in lines:
+        writer.write(line.encode() + b'\n')
+        await writer.drain()
+        replies.append(json.loads(await reader.readline()))
+    writer.close()
+    tcp.close()
+    await tcp.wait_closed()
+    server.pool.shutdown()
+    return replies
+
+
+def test_non_object_request_keeps_the_connection():
+    replies = asyncio.run(exchange(['[]', '1', '"x"', '{"cmd": "new", "id": 7}']))
+    for reply in replies[:3]:
+        assert reply == {'ok': False, 'error': 'Expected a JSON object'}
+    assert replies[3]['ok'] and replies[3]['id'] == 7
+
+
+def test_play_rejects_bad_search_times():
+    lines = ['{"cmd": "new"}'] + [f'{{"cmd": "play", "game": 1, "seconds": {seconds}}}'
+                                  for seconds in ('NaN', 'Infinity', '"inf"', '0', '-1')]
+    replies = asyncio.run(exchange(lines))
+    assert replies[0]['ok']
+    for reply in replies[1:]:
+        assert not reply['ok'] and reply['error'].startswith('Invalid')
+
+
+def test_bad_promotion_leaves_the_game_unchanged():
+    fen = '7k/4P3/8/8/8/8/8/4K3 w - -'
+    replies = asyncio.run(exchange([json.dumps({'cmd': 'new', 'fen': fen}),
+                                    '{"cmd": "move", "game": 1, "move": "e7e8", "promotion": "dragon"}',
+                                    '{"cmd": "state", "game": 1}',
+                                    '{"cmd": "move", "game": 1, "move": "e7e8", "promotion": "knight"}']))
+    assert replies[1] == {'ok': False, 'error': "Cannot promote to 'dragon'"}
+    assert replies[2]['fen'] == fen and replies[2]['status'] == 'playing'
+    assert replies[3]['ok'] and replies[3]['fen'].startswith('4N2k/8/')
+
+
+def test_wrongly_typed_fields_and_handler_errors_keep_the_connection():
+    lines = ['{"cmd": "new", "fen": 5}', '{"cmd": "new", "seed": 1.5}', '{"cmd": "new", "seed": true}',
+             '{"cmd": "new"}', '{"cmd": "move", "game": 1, "move": ["e2", "e4"]}',
+             '{"cmd": "play", "game": 1, "seconds": 1e400}', '{"cmd": "fail"}', '{"cmd": "state", "game": 1}']
+    replies = asyncio.run(exchange(lines, FaultyServer))
+    assert [reply['ok'] for reply in replies] == [False, False, False, True, False, False, False, True]
+    assert replies[0]['error'] == 'Invalid fen 5'
+    assert replies[6]['error'] == "Internal error: RuntimeError('boom')"
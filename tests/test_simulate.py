@@ -0,0 +1,30 @@
+import io
+import json
+
+from qchess.gamelog import MAGIC, open_log, read_games, replay
+from qchess.simulate import play_game, simulate
+
+
+def results(workers):
+    output = io.StringIO()
+    summary = simulate(6, output, seed=3, workers=workers, max_plies=60)
+    games = sorted((json.loads(line) for line in output.getvalue().splitlines()), key=lambda game: game['game'])
+    for game in games:
+        del game['seconds']
+    return summary, games
+
+
+def test_results_do_not_depend_on_workers():
+    summary, games = results(1)
+    assert (summary, games) == results(2)
+    assert summary['games'] == 6 and [game['seed'] for game in games] == [3_000_009 + game for game in range(6)]
+
+
+def test_simulate_observe_counts_and_replays(tmp_path):
+    assert play_game(0)['collapses']['observation'] == 0
+    result = play_game(0, log=True, observe=True)
+    assert result['collapses']['observation'] > 0
+    path = tmp_path / 'game.qlog'
+    path.write_bytes(MAGIC + result['log'])
+    engine = replay(next(read_games(open_log(path))))
+    assert engine.collapse_counts == result['collapses']
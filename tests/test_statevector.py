@@ -0,0 +1,66 @@
+import random
+
+import numpy as np
+import pytest
+
+from qchess.statevector import CAPTURED, StateVector
+
+S = 1 / np.sqrt(2)
+
+
+def test_split_amplitudes():
+    state = StateVector()
+    knight = state.add_piece(57)
+    state.split(knight, 57, 40, 42)
+    amplitudes = dict(zip(state.configs[:, knight], state.amplitudes))
+    assert amplitudes[40] == pytest.approx(S) and amplitudes[42] == pytest.approx(1j * S)
+    state.split(knight, 40, 25, 34, amplitudes=(np.sqrt(0.2), np.sqrt(0.8)))
+    assert state.probabilities(knight) == pytest.approx({25: 0.1, 34: 0.4, 42: 0.5})
+    with pytest.raises(ValueError):
+        state.split(knight, 42, 32, 27, amplitudes=(0.5, 0.5))
+
+
+def test_paths_interfere():
+    state = StateVector()
+    piece = state.add_piece(0)
+    state.split(piece, 0, 1, 2, amplitudes=(S, S))
+    state.split(piece, 1, 3, 4, amplitudes=(S, S))
+    state.split(piece, 2, 3, 4, amplitudes=(S, -S))
+    # The two paths to square 4 cancel and the ones to square 3 add up
+    assert state.branches == 1
+    assert state.probabilities(piece) == pytest.approx({3: 1.0})
+    assert state.amplitudes[0] == pytest.approx(1)
+
+
+def test_blocked_slide_entangles_and_measurement_collapses():
+    state = StateVector()
+    rook = state.add_piece(56)
+    knight = state.add_piece(57)
+    state.split(knight, 57, 40, 42)
+    # a1 to a8 is blocked where the knight went to a3
+    state.move(rook, 56, 0)
+    assert state.probabilities(rook) == pytest.approx({0: 0.5, 56: 0.5})
+    assert state.occupancy()[40] == pytest.approx(0.5)
+    square = state.measure_piece(knight, random.Random(1))
+    assert state.probabilities(rook) == {56 if square == 40 else 0: pytest.approx(1.0)}
+    assert (np.abs(state.amplitudes) ** 2).sum() == pytest.approx(1)
+
+
+def test_capture_and_square_measurement():
+    state = StateVector()
+    rook = state.add_piece(56)
+    target = state.add_piece(0)
+    state.split(target, 0, 1, 8)
+    state.move(rook, 56, 8)
+    assert state.probabilities(target) == pytest.approx({1: 0.5, CAPTURED: 0.5})
+    occupied = state.measure_square(1, random.Random(0))
+    assert state.probabilities(rook) == {56 if occupied else 8: pytest.approx(1.0)}
+
+
+def test_branches_stay_bounded():
+    state = StateVector(max_branches=16)
+    pieces = [state.add_piece(sq) for sq in range(8)]
+    for piece, sq in zip(pieces, range(8)):
+        state.split(piece, sq, sq + 16, sq + 24)
+    assert state.branches == 16
+    assert (np.abs(state.amplitudes) ** 2).sum() == pytest.approx(1)
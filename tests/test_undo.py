@@ -0,0 +1,76 @@
+import random
+
+from qchess.bitboard import Bitboards
+from qchess.engine import ChessEngine, ManualClock, QUANTUM_DURATION
+from qchess.simulate import apply_action, random_policy
+
+
+def snapshot(engine):
+    bitboards = engine.bitboards
+    return (bytes(engine.board), engine.turn, repr(engine.castling_rights), engine.last_move,
+            engine.promotion_square, engine.game_over, dict(engine.collapse_counts), engine.zobrist_key,
+            [list(pieces) for pieces in bitboards.pieces], list(bitboards.occupied),
+            list(bitboards.attack_map), list(bitboards.attacks_from),
+            [(state.piece, [tuple(pos) for pos in state.positions], state.deadline)
+             for state in engine.quantum_states],
+            sorted((entry[0], id(item)) for item, entry in engine.timers.entries.items()))
+
+
+def test_make_unmake_restores_everything():
+    for seed in range(10):
+        clock = ManualClock()
+        engine = ChessEngine(seed=seed, clock=clock)
+        rng = random.Random(seed)
+        history = []
+        for _ in range(80):
+            if not engine.has_legal_move() or not all(engine.bitboards.pieces[color][5] for color in (0, 1)):
+                break
+            history.append(snapshot(engine))
+            apply_action(engine, random_policy(engine, rng, split_rate=0.4))
+            if engine.promotion_square:
+                engine.promote('knight')
+            clock.advance(20)
+            engine.update_quantum_timers()
+            assert engine.zobrist_key == engine.compute_zobrist_key()
+        while engine.unmake_move():
+            assert snapshot(engine) == history.pop()
+            fresh = Bitboards.from_board(engine.board)
+            assert fresh.attack_map == engine.bitboards.attack_map
+        assert not history
+
+
+def test_undo_does_not_reroll_a_timer_collapse():
+    for seed in range(20):
+        clock = ManualClock()
+        engine = ChessEngine(seed=seed, clock=clock)
+        engine.split_move(7, 6, (5, 5), (5, 7))
+        engine.make_move(1, 0, 2, 0)
+        clock.advance(QUANTUM_DURATION + 1)
+        engine.update_quantum_timers()
+        board = bytes(engine.board)
+        # The collapse landed in the frame of a6, which is taken back
+        engine.unmake_move()
+        assert engine.quantum_states
+        engine.update_quantum_timers()
+        assert not engine.quantum_states
+        engine.make_move(1, 0, 2, 0)
+        assert bytes(engine.board) == board
+
+
+def test_undo_does_not_reroll_a_move_collapse():
+    boards = set()
+    for seed in range(20):
+        engine = ChessEngine(seed=seed)
+        engine.make_move(6, 4, 4, 4)
+        engine.split_move(0, 6, (2, 5), (2, 7))
+        engine.make_move(6, 0, 5, 0)
+        # Nf6xe4 collapses the knight first
+        engine.make_move(2, 5, 4, 4)
+        board = bytes(engine.board)
+        for _ in range(5):
+            engine.unmake_move()
+            engine.make_move(2, 5, 4, 4)
+            assert bytes(engine.board) == board
+        boards.add(board)
+    # Both outcomes come up across the seeds
+    assert len(boards) == 2
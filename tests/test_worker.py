@@ -0,0 +1,30 @@
+import queue
+
+from qchess.engine import ChessEngine
+from qchess.worker import Worker, analysis_job
+
+
+def run_job(kind, run):
+    results = queue.Queue()
+    worker = Worker(lambda job, result: results.put((job, result)))
+    try:
+        worker.submit(kind, 0, run)
+        return results.get(timeout=10)
+    finally:
+        worker.stop()
+
+
+def test_failing_job_is_posted_with_its_error():
+    def fail(job):
+        raise RuntimeError('boom')
+    job, result = run_job('analysis', fail)
+    assert result is None
+    assert isinstance(job.error, RuntimeError)
+
+
+def test_analysis_matches_the_engine():
+    engine = ChessEngine(seed=0)
+    job, moves = run_job('analysis', analysis_job(engine))
+    assert job.error is None
+    assert sorted((*square, *target) for square, (classical, _) in moves.items() for target in classical) == \
+        sorted(engine.iter_legal_moves())
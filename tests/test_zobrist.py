@@ -0,0 +1,45 @@
+import random
+
+from qchess.engine import ChessEngine, ManualClock
+from qchess.fen import parse_fen
+from qchess.simulate import apply_action, random_policy
+
+
+def test_incremental_key_matches_a_full_recompute():
+    for seed in range(10):
+        clock = ManualClock()
+        engine = ChessEngine(seed=seed, clock=clock)
+        rng = random.Random(seed)
+        for _ in range(120):
+            if not engine.has_legal_move() or not all(engine.bitboards.pieces[color][5] for color in (0, 1)):
+                break
+            apply_action(engine, random_policy(engine, rng, split_rate=0.3))
+            if engine.promotion_square:
+                engine.promote('rook')
+            assert engine.zobrist_key == engine.compute_zobrist_key()
+            clock.advance(10)
+            engine.update_quantum_timers()
+            assert engine.zobrist_key == engine.compute_zobrist_key()
+
+
+def test_transpositions_share_a_key():
+    first, second = ChessEngine(), ChessEngine()
+    for move in ((7, 6, 5, 5), (0, 6, 2, 5), (7, 1, 5, 2), (0, 1, 2, 2)):
+        first.make_move(*move)
+    for move in ((7, 1, 5, 2), (0, 1, 2, 2), (7, 6, 5, 5), (0, 6, 2, 5)):
+        second.make_move(*move)
+    assert first.position_key() == second.position_key()
+
+
+def test_key_covers_superpositions_en_passant_and_castling():
+    keys = {parse_fen(fen).position_key() for fen in (
+        'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq -',
+        'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w Kkq -',
+        'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR b KQkq -',
+        'rnbqkbnr/ppp1pppp/8/8/3pP3/8/PPPP1PPP/RNBQKBNR b KQkq e3',
+        'rnbqkbnr/ppp1pppp/8/8/3pP3/8/PPPP1PPP/RNBQKBNR b KQkq -',
+        'rnbqkbnr/pppppppp/8/8/8/N1N5/PPPPPPPP/R1BQKBNR w KQkq - a3c3:90',
+        'rnbqkbnr/pppppppp/8/8/8/N1N5/PPPPPPPP/R1BQKBNR w KQkq - a3c3:30',
+        'rnbqkbnr/pppppppp/8/8/8/N1N5/PPPPPPPP/R1BQKBNR w KQkq -')}
+    # The timer is left out of the key, so the two a3c3 positions share one
+    assert len(keys) == 7